@@ -1,14 +1,14 @@
 import networkx as nx
 import pandas as pd
 import geopandas as gpd
-import uuid
 import logging
 import os
 import json
-from copy import deepcopy
+from contextlib import contextmanager
+from itertools import chain, islice
+from types import MappingProxyType
 from typing import Union, List, Dict
 from pyproj import Transformer
-from s2sphere import CellId
 import genet.outputs_handler.matsim_xml_writer as matsim_xml_writer
 import genet.outputs_handler.geojson as geojson
 import genet.outputs_handler.sanitiser as sanitiser
@@ -17,6 +17,8 @@ import genet.modify.graph as modify_graph
 import genet.utils.spatial as spatial
 import genet.utils.persistence as persistence
 import genet.utils.graph_operations as graph_operations
+import genet.utils.indexing as indexing
+import genet.utils.attribute_store as attribute_store
 import genet.utils.parallel as parallel
 import genet.utils.dict_support as dict_support
 import genet.utils.plot as plot
@@ -28,6 +30,10 @@ import genet.auxiliary_files as auxiliary_files
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
 
+def _read_only_multi_edges(multi_edges):
+    return MappingProxyType({multi_idx: MappingProxyType(attribs) for multi_idx, attribs in multi_edges.items()})
+
+
 class Network:
     def __init__(self, epsg):
         self.epsg = epsg
@@ -40,6 +46,59 @@ class Network:
         # link_id_mapping maps between (usually string literal) index per edge to the from and to nodes that are
         # connected by the edge
         self.link_id_mapping = {}
+        # reverse of link_id_mapping, maps nodes to ids of links going in and out of them
+        self._node_link_index = indexing.NodeLinkIndex()
+        # generate new node and link ids without scanning the existing ones
+        self._node_id_allocator = indexing.NodeIdAllocator()
+        self._link_id_allocator = indexing.LinkIdAllocator()
+        # optional columnar copies of numeric node and link data, see `enable_attribute_store`
+        self._use_attribute_store = False
+        self._node_attribute_store = None
+        self._link_attribute_store = None
+        # R-tree indices of node and link geometries, built lazily, see `_spatial_index`
+        self._spatial_indices = {}
+        # views of the graph for modes, see `modal_subgraph`
+        self._modal_subgraphs = {}
+        # opt-in inverted indices of link attribute values, see `build_attribute_index`
+        self._attribute_indices = {}
+        # auxiliary file id maps collected while in `batch`, None otherwise
+        self._batch = None
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager for making many changes to the Network (and its Schedule), e.g. calling `add_link`,
+        `apply_attributes_to_link` or `remove_link` in a loop over links:
+
+            with network.batch():
+                for link_id in link_ids:
+                    network.apply_attributes_to_link(link_id, {'freespeed': 10})
+
+        Changes are made to the graph straight away, so the Network can be queried as usual inside the context. The
+        bookkeeping is done once, when the context is left: change log events are recorded as bunches, with repeated
+        modifications of the same object recorded as one (see genet.modify.change_log.ChangeLogBatch), auxiliary
+        files are updated once and one logging message is written. Indices kept by the Network are dropped, rather
+        than updated, on each change and rebuilt when next needed. Changes made before an error are kept and recorded.
+        :return:
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = {'node': {}, 'link': {}}
+        self.change_log = change_log.ChangeLogBatch(self.change_log)
+        try:
+            with self.schedule.batch():
+                yield
+        finally:
+            auxiliary_file_maps, self._batch = self._batch, None
+            number_of_changes = 0
+            if isinstance(self.change_log, change_log.ChangeLogBatch):
+                number_of_changes = self.change_log.number_of_events
+                self.change_log = self.change_log.record()
+            for id_type, id_map in auxiliary_file_maps.items():
+                if id_map:
+                    self._update_auxiliary_files(id_type, id_map)
+            logging.info(f'Finished a batch of {number_of_changes} changes to the Network')
 
     def __repr__(self):
         return f"<{self.__class__.__name__} instance at {id(self)}: with \ngraph: {nx.info(self.graph)} and " \
@@ -74,6 +133,7 @@ class Network:
         self.graph = nx.compose(other.graph, self.graph)
         # finally, combine link_id_mappings
         self.link_id_mapping = {**other.link_id_mapping, **self.link_id_mapping}
+        self._invalidate_indices()
 
         # combine schedules
         self.schedule.add(other.schedule)
@@ -163,6 +223,8 @@ class Network:
         if self.is_simplified():
             raise RuntimeError('This network has already been simplified. You cannot simplify the graph twice.')
         simplification.simplify_graph(self, no_processes)
+        self._invalidate_indices()
+        self._invalidate_attribute_indices()
         # mark graph as having been simplified
         self.graph.graph["simplified"] = True
 
@@ -186,6 +248,9 @@ class Network:
             e.g. {'attributes': {'osm:way:name': 'text'}}
         :return: pandas.Series
         """
+        store = self._node_store()
+        if store is not None and store.has_attribute(key):
+            return store.attribute_data(key)
         return pd.Series(graph_operations.get_attribute_data_under_key(self.nodes(), key))
 
     def node_attribute_data_under_keys(self, keys: Union[list, set], index_name=None):
@@ -196,7 +261,8 @@ class Network:
         :param index_name: optional, gives the index_name to dataframes index
         :return: pandas.DataFrame
         """
-        return graph_operations.build_attribute_dataframe(self.nodes(), keys=keys, index_name=index_name)
+        return graph_operations.build_attribute_dataframe(
+            self.nodes(), keys=keys, index_name=index_name, store=self._node_store())
 
     def link_attribute_summary(self, data=False):
         """
@@ -205,7 +271,7 @@ class Network:
         :param data: bool, False by default
         :return:
         """
-        root = graph_operations.get_attribute_schema(self.links(), data=data)
+        root = graph_operations.get_attribute_schema(self.links(copy=False), data=data)
         graph_operations.render_tree(root, data)
 
     def link_attribute_data_under_key(self, key: Union[str, dict]):
@@ -215,7 +281,10 @@ class Network:
             e.g. {'attributes': {'osm:way:name': 'text'}}
         :return: pandas.Series
         """
-        return pd.Series(graph_operations.get_attribute_data_under_key(self.links(), key))
+        store = self._link_store()
+        if store is not None and store.has_attribute(key):
+            return store.attribute_data(key)
+        return pd.Series(graph_operations.get_attribute_data_under_key(self.links(copy=False), key))
 
     def link_attribute_data_under_keys(self, keys: Union[list, set], index_name=None):
         """
@@ -225,7 +294,8 @@ class Network:
         :param index_name: optional, gives the index_name to dataframes index
         :return: pandas.DataFrame
         """
-        return graph_operations.build_attribute_dataframe(self.links(), keys=keys, index_name=index_name)
+        return graph_operations.build_attribute_dataframe(
+            self.links(copy=False), keys=keys, index_name=index_name, store=self._link_store())
 
     def extract_nodes_on_node_attributes(self, conditions: Union[list, dict], how=any, mixed_dtypes=True):
         """
@@ -312,8 +382,32 @@ class Network:
         values e.g. as in simplified networks.
         :return: list of link ids in the network satisfying conditions
         """
+        links = self._extract_links_using_attribute_indices(conditions=conditions, how=how, mixed_dtypes=mixed_dtypes)
+        if links is not None:
+            return links
         return graph_operations.extract_on_attributes(
-            self.links(), conditions=conditions, how=how, mixed_dtypes=mixed_dtypes)
+            self.links(copy=False), conditions=conditions, how=how, mixed_dtypes=mixed_dtypes)
+
+    def _extract_links_using_attribute_indices(self, conditions: Union[list, dict], how=any, mixed_dtypes=True):
+        """
+        Answers `extract_links_on_edge_attributes` with attribute indices, if all of the conditions are equality or
+        set-membership tests on indexed attributes
+        :return: list of link ids, or None if the indices cannot be used
+        """
+        if not self._attribute_indices:
+            return None
+        if isinstance(conditions, dict):
+            conditions = [conditions]
+        elif not (isinstance(conditions, list) and conditions and how in {any, all}):
+            return None
+        matches = []
+        for condition in conditions:
+            path, value = indexing.condition_path(condition)
+            if path not in self._attribute_indices:
+                return None
+            matches.append(self._attribute_index(path).match(value, mixed_dtypes=mixed_dtypes))
+        links = set.union(*matches) if how is any else set.intersection(*matches)
+        return self._attribute_index(path).sorted(links)
 
     def links_on_modal_condition(self, modes: Union[str, list]):
         """
@@ -321,6 +415,9 @@ class Network:
         :param modes: string mode e.g. 'car' or a list of such modes e.g. ['car', 'walk']
         :return: list of link IDs
         """
+        store = self._link_store()
+        if store is not None and store.has_modes():
+            return store.ids_with_modes(modes)
         return self.extract_links_on_edge_attributes(conditions={'modes': modes}, mixed_dtypes=True)
 
     def nodes_on_modal_condition(self, modes: Union[str, list]):
@@ -330,11 +427,26 @@ class Network:
         :return: list of link IDs
         """
         links = self.links_on_modal_condition(modes)
-        nodes = {self.link(link)['from'] for link in links} | {self.link(link)['to'] for link in links}
+        nodes = set()
+        for link in links:
+            u, v, multi_idx = self.edge_tuple_from_link_id(link)
+            nodes |= {u, v}
         return list(nodes)
 
     def modal_subgraph(self, modes: Union[str, list]):
-        return self.subgraph_on_link_conditions(conditions={'modes': modes}, mixed_dtypes=True)
+        """
+        Gives a read-only view of the graph restricted to links with modes or singular mode given in `modes`.
+        The view is kept and reused until links are added, removed or their modes change, data stored on nodes and
+        links is read from the graph. Use nx.MultiDiGraph(network.modal_subgraph(modes)) to get a modifiable copy.
+        :param modes: string mode e.g. 'car' or a list of such modes e.g. ['car', 'walk']
+        :return: nx.MultiDiGraph view
+        """
+        key = frozenset([modes]) if isinstance(modes, str) else frozenset(modes)
+        sources = (self.graph, self.graph.number_of_edges())
+        if (key not in self._modal_subgraphs) or (self._modal_subgraphs[key][0] != sources):
+            edges = [self.edge_tuple_from_link_id(link_id) for link_id in self.links_on_modal_condition(modes)]
+            self._modal_subgraphs[key] = (sources, nx.edge_subgraph(self.graph, edges))
+        return self._modal_subgraphs[key][1]
 
     def nodes_on_spatial_condition(self, region_input):
         """
@@ -349,11 +461,10 @@ class Network:
         """
         if not isinstance(region_input, str):
             # assumed to be a shapely.geometry input
-            gdf = self.to_geodataframe()['nodes'].to_crs("epsg:4326")
-            return self._find_ids_on_shapely_geometry(gdf, how='intersect', shapely_input=region_input)
+            return self._find_ids_on_shapely_geometry(
+                self._spatial_index('nodes'), how='intersect', shapely_input=region_input)
         elif persistence.is_geojson(region_input):
-            gdf = self.to_geodataframe()['nodes'].to_crs("epsg:4326")
-            return self._find_ids_on_geojson(gdf, how='intersect', geojson_input=region_input)
+            return self._find_ids_on_geojson(self._spatial_index('nodes'), how='intersect', geojson_input=region_input)
         else:
             # is assumed to be hex
             return self._find_node_ids_on_s2_geometry(region_input)
@@ -369,45 +480,37 @@ class Network:
             - shapely.geometry object, e.g. Polygon or a shapely.geometry.GeometryCollection of such objects
         :return: link IDs
         """
-        gdf = self.to_geodataframe()['links'].to_crs("epsg:4326")
         if not isinstance(region_input, str):
             # assumed to be a shapely.geometry input
-            return self._find_ids_on_shapely_geometry(gdf, how, region_input)
+            return self._find_ids_on_shapely_geometry(self._spatial_index('links'), how, region_input)
         elif persistence.is_geojson(region_input):
-            return self._find_ids_on_geojson(gdf, how, region_input)
+            return self._find_ids_on_geojson(self._spatial_index('links'), how, region_input)
         else:
             # is assumed to be hex
-            return self._find_link_ids_on_s2_geometry(gdf, how, region_input)
+            return self._find_link_ids_on_s2_geometry(how, region_input)
 
-    def _find_ids_on_geojson(self, gdf, how, geojson_input):
+    def _find_ids_on_geojson(self, spatial_index, how, geojson_input):
         shapely_input = spatial.read_geojson_to_shapely(geojson_input)
-        return self._find_ids_on_shapely_geometry(gdf=gdf, how=how, shapely_input=shapely_input)
+        return self._find_ids_on_shapely_geometry(spatial_index=spatial_index, how=how, shapely_input=shapely_input)
 
-    def _find_ids_on_shapely_geometry(self, gdf, how, shapely_input):
+    def _find_ids_on_shapely_geometry(self, spatial_index, how, shapely_input):
         if how == 'intersect':
-            return list(gdf[gdf.intersects(shapely_input)]['id'])
+            return spatial_index.intersecting(shapely_input)
         if how == 'within':
-            return list(gdf[gdf.within(shapely_input)]['id'])
+            return spatial_index.within(shapely_input)
         else:
             raise NotImplementedError('Only `intersect` and `contain` options for `how` param.')
 
     def _find_node_ids_on_s2_geometry(self, s2_input):
         cell_union = spatial.s2_hex_to_cell_union(s2_input)
-        return [_id for _id, s2_id in self.graph.nodes(data='s2_id') if cell_union.intersects(CellId(s2_id))]
-
-    def _find_link_ids_on_s2_geometry(self, gdf, how, s2_input):
-        gdf['geometry'] = gdf['geometry'].apply(lambda x: spatial.swap_x_y_in_linestring(x))
-        gdf['s2_geometry'] = gdf['geometry'].apply(lambda x: spatial.generate_s2_geometry(x))
-        gdf = gdf.set_index('id')
-        links = gdf['s2_geometry'].T.to_dict()
+        return self._s2_index('nodes').intersecting(cell_union)
 
+    def _find_link_ids_on_s2_geometry(self, how, s2_input):
         cell_union = spatial.s2_hex_to_cell_union(s2_input)
         if how == 'intersect':
-            return [_id for _id, s2_geom in links.items() if
-                    any([cell_union.intersects(CellId(s2_id)) for s2_id in s2_geom])]
+            return self._s2_index('links').intersecting(cell_union)
         elif how == 'within':
-            return [_id for _id, s2_geom in links.items() if
-                    all([cell_union.intersects(CellId(s2_id)) for s2_id in s2_geom])]
+            return self._s2_index('links').within(cell_union)
         else:
             raise NotImplementedError('Only `intersect` and `within` options for `how` param.')
 
@@ -420,12 +523,16 @@ class Network:
         :param silent: whether to mute stdout logging messages
         :return:
         """
+        new_node = node not in self.graph
         if attribs is not None:
             self.graph.add_node(node, **attribs)
         else:
             self.graph.add_node(node)
+        if new_node:
+            self._node_id_allocator.add([node])
+        self._invalidate_indices()
         self.change_log.add(object_type='node', object_id=node, object_attributes=attribs)
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Added Node with index `{node}` and data={attribs}')
         return node
 
@@ -452,7 +559,7 @@ class Network:
         if clashing_node_ids:
             reindexing_dict = dict(
                 zip(clashing_node_ids, self.generate_indices_for_n_nodes(
-                    len(nodes_and_attribs), avoid_keys=set(nodes_and_attribs.keys()))))
+                    len(clashing_node_ids), avoid_keys=set(nodes_and_attribs.keys()))))
             clashing_mask = df_nodes['id'].isin(reindexing_dict.keys())
             df_nodes.loc[clashing_mask, 'id'] = df_nodes.loc[clashing_mask, 'id'].map(reindexing_dict)
         df_nodes = df_nodes.set_index('id', drop=False)
@@ -460,11 +567,13 @@ class Network:
         nodes_and_attribs_to_add = df_nodes.T.to_dict()
 
         self.graph.add_nodes_from([(node_id, attribs) for node_id, attribs in nodes_and_attribs_to_add.items()])
+        self._node_id_allocator.add(nodes_and_attribs_to_add.keys())
+        self._invalidate_indices()
         if not ignore_change_log:
             self.change_log = self.change_log.add_bunch(object_type='node',
                                                         id_bunch=list(nodes_and_attribs_to_add.keys()),
                                                         attributes_bunch=list(nodes_and_attribs_to_add.values()))
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Added {len(nodes_and_attribs)} nodes')
         return reindexing_dict, nodes_and_attribs_to_add
 
@@ -483,7 +592,7 @@ class Network:
         """
         link_id = self.generate_index_for_edge(silent=silent)
         self.add_link(link_id, u, v, multi_edge_idx, attribs, silent)
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Added edge from `{u}` to `{v}` with link_id `{link_id}`')
         return link_id
 
@@ -540,14 +649,20 @@ class Network:
             raise RuntimeError('Multi index key needs to be an integer')
 
         self.link_id_mapping[link_id] = {'from': u, 'to': v, 'multi_edge_idx': multi_edge_idx}
+        self._node_link_index.add(link_id, u, v)
+        self._link_id_allocator.add([link_id])
         compulsory_attribs = {'from': u, 'to': v, 'id': link_id}
         if attribs is None:
             attribs = compulsory_attribs
         else:
             attribs = {**attribs, **compulsory_attribs}
+        new_nodes = {u, v} - set(self.graph.nbunch_iter([u, v]))
         self.graph.add_edge(u, v, key=multi_edge_idx, **attribs)
+        self._node_id_allocator.add(new_nodes)
+        self._invalidate_indices()
+        self._add_to_attribute_indices([link_id])
         self.change_log.add(object_type='link', object_id=link_id, object_attributes=attribs)
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Added Link with index {link_id}, from node:{u} to node:{v}, under '
                          f'multi-index:{multi_edge_idx}, and data={attribs}')
         return link_id
@@ -623,16 +738,25 @@ class Network:
                                 df_links.T.to_dict().items()}
 
         # update link_id_mapping
-        self.link_id_mapping = {**self.link_id_mapping, **add_to_link_id_mapping}
-
+        self.link_id_mapping.update(add_to_link_id_mapping)
+        for link_id, link_edge in add_to_link_id_mapping.items():
+            self._node_link_index.add(link_id, link_edge['from'], link_edge['to'])
+        self._link_id_allocator.add(add_to_link_id_mapping.keys())
+
+        link_nodes = {link_edge['from'] for link_edge in add_to_link_id_mapping.values()} | {
+            link_edge['to'] for link_edge in add_to_link_id_mapping.values()}
+        new_nodes = link_nodes - set(self.graph.nbunch_iter(link_nodes))
         self.graph.add_edges_from(
             [(attribs['from'], attribs['to'], add_to_link_id_mapping[link]['multi_edge_idx'], attribs) for link, attribs
              in links_and_attributes.items()])
+        self._node_id_allocator.add(new_nodes)
+        self._invalidate_indices()
+        self._add_to_attribute_indices(links_and_attributes.keys())
         if not ignore_change_log:
             self.change_log = self.change_log.add_bunch(
                 object_type='link', id_bunch=list(links_and_attributes.keys()),
                 attributes_bunch=list(links_and_attributes.values()))
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Added {len(links_and_attributes)} links')
         return reindexing_dict, links_and_attributes
 
@@ -641,41 +765,160 @@ class Network:
         if self.node_id_exists(new_node_id):
             new_node_id = self.generate_index_for_node()
         # extract link ids which will be affected byt the node relabel and change the from anf to attributes
-        from_links = self.extract_links_on_edge_attributes(conditions={'from': node_id})
+        from_links = self.out_links(node_id)
         self.apply_attributes_to_links({link: {'from': new_node_id} for link in from_links})
-        to_links = self.extract_links_on_edge_attributes(conditions={'to': node_id})
+        to_links = self.in_links(node_id)
         self.apply_attributes_to_links({link: {'to': new_node_id} for link in to_links})
         # update link_id_mapping
         for k in from_links:
             self.link_id_mapping[k]['from'] = new_node_id
         for k in to_links:
             self.link_id_mapping[k]['to'] = new_node_id
+        self._node_link_index.relabel_nodes({node_id: new_node_id})
 
-        new_attribs = deepcopy(self.node(node_id))
-        new_attribs['id'] = new_node_id
+        new_attribs = {**self.node(node_id), 'id': new_node_id}
         self.change_log.modify(object_type='node', old_id=node_id, new_id=new_node_id,
                                old_attributes=self.node(node_id), new_attributes=new_attribs)
         self.apply_attributes_to_node(node_id, new_attribs)
         self.graph = nx.relabel_nodes(self.graph, {node_id: new_node_id})
+        self._invalidate_indices()
         self.update_node_auxiliary_files({node_id: new_node_id})
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Changed Node index from {node_id} to {new_node_id}')
 
     def reindex_link(self, link_id, new_link_id, silent: bool = False):
         # check if new id is already occupied
         if self.link_id_exists(new_link_id):
             new_link_id = self.generate_index_for_edge()
-        new_attribs = deepcopy(self.link(link_id))
-        new_attribs['id'] = new_link_id
+        new_attribs = {**self.link(link_id, copy=False), 'id': new_link_id}
         self.change_log.modify(object_type='link', old_id=link_id, new_id=new_link_id,
-                               old_attributes=self.link(link_id), new_attributes=new_attribs)
+                               old_attributes=self.link(link_id, copy=False), new_attributes=new_attribs)
         self.apply_attributes_to_link(link_id, new_attribs)
+        u, v, multi_idx = self.edge_tuple_from_link_id(link_id)
         self.link_id_mapping[new_link_id] = self.link_id_mapping[link_id]
         del self.link_id_mapping[link_id]
+        self._node_link_index.remove(link_id, u, v)
+        self._node_link_index.add(new_link_id, u, v)
+        self._link_id_allocator.remove([link_id])
+        self._link_id_allocator.add([new_link_id])
+        self._invalidate_indices()
+        self._remove_from_attribute_indices([link_id])
+        self._add_to_attribute_indices([new_link_id])
         self.update_link_auxiliary_files({link_id: new_link_id})
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Changed Link index from {link_id} to {new_link_id}')
 
+    def _resolve_clashing_reindexing(self, mapping: dict, id_exists, generate_indices):
+        """
+        Replaces new indices in `mapping` which are taken by items that are not being reindexed, or are repeated,
+        with newly generated indices
+        :param mapping: {old_id: new_id}
+        :param id_exists: function returning whether an id is taken
+        :param generate_indices: function generating n new unique indices
+        :return: updated mapping
+        """
+        mapping = {old_id: new_id for old_id, new_id in mapping.items() if old_id != new_id}
+        new_ids = set()
+        clashing_ids = []
+        for old_id, new_id in mapping.items():
+            if (new_id in new_ids) or (id_exists(new_id) and new_id not in mapping):
+                clashing_ids.append(old_id)
+            new_ids.add(new_id)
+        if clashing_ids:
+            logging.warning(f'{len(clashing_ids)} of the new indices already exist. New unique indices will be '
+                            f'generated for them')
+            mapping = {**mapping, **dict(zip(clashing_ids, generate_indices(len(clashing_ids), avoid_keys=new_ids)))}
+        return mapping
+
+    def reindex_nodes(self, mapping: dict, silent: bool = False):
+        """
+        Changes indices of many nodes at once. Relabels the graph once and updates the links going in and out of the
+        nodes. Records one change log event for nodes and one for links. If a new index is already taken by a node
+        that is not being reindexed, a new unique index is generated instead.
+        :param mapping: {old_node_id: new_node_id}
+        :param silent: whether to mute stdout logging messages
+        :return: {old_node_id: new_node_id} the mapping that was applied
+        """
+        mapping = self._resolve_clashing_reindexing(mapping, self.has_node, self.generate_indices_for_n_nodes)
+        if not mapping:
+            return mapping
+        old_ids = list(mapping.keys())
+        new_ids = [mapping[node_id] for node_id in old_ids]
+        old_node_attribs = [dict(self.node(node_id)) for node_id in old_ids]
+        new_node_attribs = [{**attribs, 'id': new_id} for attribs, new_id in zip(old_node_attribs, new_ids)]
+
+        node_links = self._node_links()
+        links = set()
+        for node_id in old_ids:
+            links |= node_links.in_links(node_id) | node_links.out_links(node_id)
+        links = list(links)
+        old_link_attribs = [self.link(link_id) for link_id in links]
+
+        self.graph = nx.relabel_nodes(self.graph, mapping)
+        nx.set_node_attributes(self.graph, dict(zip(new_ids, new_node_attribs)))
+
+        new_link_attribs = []
+        edge_attribs = {}
+        edge_attribs_by_link = {}
+        for link_id, attribs in zip(links, old_link_attribs):
+            link_edge = self.link_id_mapping[link_id]
+            link_edge['from'] = mapping.get(link_edge['from'], link_edge['from'])
+            link_edge['to'] = mapping.get(link_edge['to'], link_edge['to'])
+            new_link_attribs.append({**attribs, 'from': link_edge['from'], 'to': link_edge['to']})
+            edge_attribs_by_link[link_id] = {'from': link_edge['from'], 'to': link_edge['to']}
+            edge_attribs[self.edge_tuple_from_link_id(link_id)] = edge_attribs_by_link[link_id]
+        nx.set_edge_attributes(self.graph, edge_attribs)
+        node_links.relabel_nodes(mapping)
+        self._invalidate_indices()
+        self._update_attribute_indices(edge_attribs_by_link)
+
+        self.change_log = self.change_log.modify_bunch('node', old_ids, old_node_attribs, new_ids, new_node_attribs)
+        if links:
+            self.change_log = self.change_log.modify_bunch('link', links, old_link_attribs, links, new_link_attribs)
+        self.update_node_auxiliary_files(mapping)
+        if not silent and self._batch is None:
+            logging.info(f'Changed indices of {len(mapping)} nodes')
+        return mapping
+
+    def reindex_links(self, mapping: dict, silent: bool = False):
+        """
+        Changes indices of many links at once. Records one change log event for all of the links. If a new index is
+        already taken by a link that is not being reindexed, a new unique index is generated instead.
+        :param mapping: {old_link_id: new_link_id}
+        :param silent: whether to mute stdout logging messages
+        :return: {old_link_id: new_link_id} the mapping that was applied
+        """
+        mapping = self._resolve_clashing_reindexing(
+            mapping, lambda link_id: link_id in self.link_id_mapping, self.generate_indices_for_n_edges)
+        if not mapping:
+            return mapping
+        old_ids = list(mapping.keys())
+        new_ids = [mapping[link_id] for link_id in old_ids]
+        old_attribs = [self.link(link_id) for link_id in old_ids]
+        new_attribs = [{**attribs, 'id': new_id} for attribs, new_id in zip(old_attribs, new_ids)]
+
+        nx.set_edge_attributes(
+            self.graph, {self.edge_tuple_from_link_id(link_id): {'id': mapping[link_id]} for link_id in old_ids})
+
+        node_links = self._node_links()
+        link_edges = {link_id: self.link_id_mapping.pop(link_id) for link_id in old_ids}
+        for link_id, link_edge in link_edges.items():
+            node_links.remove(link_id, link_edge['from'], link_edge['to'])
+        for link_id, link_edge in link_edges.items():
+            self.link_id_mapping[mapping[link_id]] = link_edge
+            node_links.add(mapping[link_id], link_edge['from'], link_edge['to'])
+        self._link_id_allocator.remove(old_ids)
+        self._link_id_allocator.add(new_ids)
+        self._invalidate_indices()
+        self._remove_from_attribute_indices(old_ids)
+        self._add_to_attribute_indices(new_ids)
+
+        self.change_log = self.change_log.modify_bunch('link', old_ids, old_attribs, new_ids, new_attribs)
+        self.update_link_auxiliary_files(mapping)
+        if not silent and self._batch is None:
+            logging.info(f'Changed indices of {len(mapping)} links')
+        return mapping
+
     def subgraph_on_link_conditions(self, conditions, how=any, mixed_dtypes=True):
         """
         Gives a subgraph of network.graph based on matching conditions defined in conditions
@@ -698,7 +941,7 @@ class Network:
         :return:
         """
         modes = set()
-        for link, link_attribs in self.links():
+        for link, link_attribs in self.links(copy=False):
             try:
                 modes |= set(link_attribs['modes'])
             except KeyError:
@@ -709,9 +952,8 @@ class Network:
                            return_nodes=False):
         """
         Finds shortest path between from and to nodes in the graph. If modes specified, finds shortest path in the
-        modal subgraph (using links which have given modes stored under 'modes' key in link attributes). If computing
-        a large number of routes on the same modal subgraph, it is best to find the subgraph using the `modal_subgraph`
-        method and pass it under subgraph to avoid re-computing the subgraph every time.
+        modal subgraph (using links which have given modes stored under 'modes' key in link attributes). The modal
+        subgraph is kept between calls, see `modal_subgraph`.
         :param from_node: node id in the graph
         :param to_node: node id in the graph
         :param modes: string e.g. 'car' or list ['car', 'bike']
@@ -743,11 +985,12 @@ class Network:
         :param silent: whether to mute stdout logging messages
         :return:
         """
-        old_attributes = deepcopy(self.node(node_id))
+        old_attributes = self.node(node_id)
+        changed_keys = set(new_attributes)
 
         # check if change is to nested part of node data
         if any(isinstance(v, dict) for v in new_attributes.values()):
-            new_attributes = dict_support.set_nested_value(old_attributes, new_attributes)
+            new_attributes = dict_support.set_nested_value(old_attributes, new_attributes, copy=True)
         else:
             new_attributes = {**old_attributes, **new_attributes}
 
@@ -755,10 +998,11 @@ class Network:
             object_type='node',
             old_id=node_id,
             new_id=node_id,
-            old_attributes=self.node(node_id),
+            old_attributes=old_attributes,
             new_attributes=new_attributes)
         nx.set_node_attributes(self.graph, {node_id: new_attributes})
-        if not silent:
+        self._update_indices_on_node_data({node_id: {k: new_attributes[k] for k in changed_keys}})
+        if not silent and self._batch is None:
             logging.info(f'Changed Node attributes under index: {node_id}')
 
     def apply_attributes_to_nodes(self, new_attributes: dict):
@@ -769,12 +1013,13 @@ class Network:
         :return:
         """
         nodes = list(new_attributes.keys())
-        old_attribs = [deepcopy(self.node(node)) for node in nodes]
-        new_attribs = [{**self.node(node), **new_attributes[node]} for node in nodes]
+        old_attribs = [self.node(node) for node in nodes]
+        new_attribs = [{**attribs, **new_attributes[node]} for node, attribs in zip(nodes, old_attribs)]
 
         self.change_log = self.change_log.modify_bunch('node', nodes, old_attribs, nodes, new_attribs)
 
         nx.set_node_attributes(self.graph, dict(zip(nodes, new_attribs)))
+        self._update_indices_on_node_data(new_attributes)
         logging.info(f'Changed Node attributes for {len(nodes)} nodes')
 
     def apply_function_to_nodes(self, function, location: str):
@@ -810,13 +1055,11 @@ class Network:
 
         for multi_idx, edge_attribs in self.edge(u, v).items():
             if filter.satisfies_conditions(edge_attribs):
-                old_attributes = deepcopy(edge_attribs)
-
                 # check if change is to nested part of node data
                 if any(isinstance(v, dict) for v in new_attributes.values()):
-                    new_attribs = dict_support.set_nested_value(old_attributes, new_attributes)
+                    new_attribs = dict_support.set_nested_value(edge_attribs, new_attributes, copy=True)
                 else:
-                    new_attribs = {**old_attributes, **new_attributes}
+                    new_attribs = {**edge_attribs, **new_attributes}
 
                 edge = f'({u}, {v}, {multi_idx})'
 
@@ -828,7 +1071,9 @@ class Network:
                     new_attributes=new_attribs)
 
                 nx.set_edge_attributes(self.graph, {(u, v, multi_idx): new_attribs})
-                if not silent:
+                self._invalidate_indices()
+                self._invalidate_attribute_indices()
+                if not silent and self._batch is None:
                     logging.info(f'Changed Edge attributes under index: {edge}')
 
     def apply_attributes_to_edges(self, new_attributes: dict, conditions=None, how=any):
@@ -849,8 +1094,8 @@ class Network:
         for (u, v), attribs_to_set in new_attributes.items():
             for multi_idx, edge_attribs in self.edge(u, v).items():
                 if filter.satisfies_conditions(edge_attribs):
-                    old_attribs.append(deepcopy(edge_attribs))
-                    new_attribs.append(dict_support.set_nested_value(edge_attribs, attribs_to_set))
+                    old_attribs.append(edge_attribs)
+                    new_attribs.append(dict_support.set_nested_value(edge_attribs, attribs_to_set, copy=True))
                     edge_tuples.append((u, v, multi_idx))
 
         edge_ids = list(map(str, edge_tuples))
@@ -864,6 +1109,8 @@ class Network:
         nx.set_edge_attributes(
             self.graph,
             dict(zip(edge_tuples, new_attribs)))
+        self._invalidate_indices()
+        self._invalidate_attribute_indices()
 
         logging.info(f'Changed Edge attributes for {len(edge_tuples)} edges')
 
@@ -878,11 +1125,12 @@ class Network:
         """
         u, v = self.link_id_mapping[link_id]['from'], self.link_id_mapping[link_id]['to']
         multi_idx = self.link_id_mapping[link_id]['multi_edge_idx']
-        old_attributes = deepcopy(self.link(link_id))
+        old_attributes = self.link(link_id, copy=False)
+        changed_keys = set(new_attributes)
 
         # check if change is to nested part of node data
         if any(isinstance(v, dict) for v in new_attributes.values()):
-            new_attributes = dict_support.set_nested_value(old_attributes, new_attributes)
+            new_attributes = dict_support.set_nested_value(old_attributes, new_attributes, copy=True)
         else:
             new_attributes = {**old_attributes, **new_attributes}
 
@@ -890,11 +1138,12 @@ class Network:
             object_type='link',
             old_id=link_id,
             new_id=link_id,
-            old_attributes=self.link(link_id),
+            old_attributes=old_attributes,
             new_attributes=new_attributes)
 
         nx.set_edge_attributes(self.graph, {(u, v, multi_idx): new_attributes})
-        if not silent:
+        self._update_indices_on_link_data({link_id: {k: new_attributes[k] for k in changed_keys}})
+        if not silent and self._batch is None:
             logging.info(f'Changed Link attributes under index: {link_id}')
 
     def apply_attributes_to_links(self, new_attributes: dict):
@@ -905,14 +1154,16 @@ class Network:
         :return:
         """
         links = list(new_attributes.keys())
-        old_attribs = [deepcopy(self.link(link)) for link in links]
-        new_attribs = [dict_support.set_nested_value(self.link(link), new_attributes[link]) for link in links]
+        old_attribs = [self.link(link, copy=False) for link in links]
+        new_attribs = [dict_support.set_nested_value(attribs, new_attributes[link], copy=True)
+                       for link, attribs in zip(links, old_attribs)]
         edge_tuples = [self.edge_tuple_from_link_id(link) for link in links]
 
         self.change_log = self.change_log.modify_bunch('link', links, old_attribs, links, new_attribs)
         nx.set_edge_attributes(
             self.graph,
             dict(zip(edge_tuples, new_attribs)))
+        self._update_indices_on_link_data(new_attributes)
         logging.info(f'Changed Link attributes for {len(links)} links')
 
     def apply_function_to_links(self, function, location: str):
@@ -945,9 +1196,12 @@ class Network:
         :return:
         """
         self.change_log.remove(object_type='node', object_id=node_id, object_attributes=self.node(node_id))
+        self._drop_link_ids_on_nodes([node_id])
         self.graph.remove_node(node_id)
+        self._node_id_allocator.remove([node_id])
+        self._invalidate_indices()
         self.update_node_auxiliary_files({node_id: None})
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Removed Node under index: {node_id}')
 
     def remove_nodes(self, nodes, ignore_change_log=False, silent=False):
@@ -963,9 +1217,12 @@ class Network:
         if not ignore_change_log:
             self.change_log = self.change_log.remove_bunch(
                 object_type='node', id_bunch=nodes, attributes_bunch=[self.node(node_id) for node_id in nodes])
+        self._drop_link_ids_on_nodes(nodes)
         self.graph.remove_nodes_from(nodes)
+        self._node_id_allocator.remove(nodes)
+        self._invalidate_indices()
         self.update_node_auxiliary_files(dict(zip(nodes, [None] * len(nodes))))
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Removed {len(nodes)} nodes.')
 
     def remove_link(self, link_id, silent: bool = False):
@@ -979,8 +1236,12 @@ class Network:
         u, v, multi_idx = self.edge_tuple_from_link_id(link_id)
         self.graph.remove_edge(u, v, multi_idx)
         del self.link_id_mapping[link_id]
+        self._node_link_index.remove(link_id, u, v)
+        self._link_id_allocator.remove([link_id])
+        self._invalidate_indices()
+        self._remove_from_attribute_indices([link_id])
         self.update_link_auxiliary_files({link_id: None})
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Removed link under index: {link_id}')
 
     def remove_links(self, links, ignore_change_log=False, silent=False):
@@ -998,9 +1259,14 @@ class Network:
                 object_type='link', id_bunch=links, attributes_bunch=[self.link(link_id) for link_id in links])
         self.graph.remove_edges_from([self.edge_tuple_from_link_id(link_id) for link_id in links])
         for link_id in links:
+            u, v, multi_idx = self.edge_tuple_from_link_id(link_id)
             del self.link_id_mapping[link_id]
+            self._node_link_index.remove(link_id, u, v)
+        self._link_id_allocator.remove(links)
+        self._invalidate_indices()
+        self._remove_from_attribute_indices(links)
         self.update_link_auxiliary_files(dict(zip(links, [None] * len(links))))
-        if not silent:
+        if not silent and self._batch is None:
             logging.info(f'Removed {len(links)} links')
 
     def number_of_multi_edges(self, u, v):
@@ -1028,40 +1294,50 @@ class Network:
         """
         return self.graph.nodes[node_id]
 
-    def edges(self):
+    def edges(self, copy: bool = True):
         """
-        :return: Iterator through each edge's from, to nodes and its attrib (three-tuple)
+        :param copy: if False, yields read-only views of the attribs stored in the graph rather than copies
+        :return: Iterator through each edge's from, to nodes and its attrib (three-tuple), attribs of all multi edges
+            between the two nodes are yielded at once
         """
-        for u, v in self.graph.edges():
-            yield u, v, self.edge(u, v)
+        for u, neighbours in self.graph.adjacency():
+            for v, multi_edges in neighbours.items():
+                yield u, v, dict(multi_edges) if copy else _read_only_multi_edges(multi_edges)
 
-    def edge(self, u, v):
+    def edge(self, u, v, copy: bool = True):
         """
         :param u: from node of self.graph
         :param v: to node of self.graph
+        :param copy: if False, returns read-only views of the attribs stored in the graph rather than a copy
         :return:  attribs of the edge from u to  v
         """
-        return dict(self.graph[u][v])
+        multi_edges = self.graph[u][v]
+        return dict(multi_edges) if copy else _read_only_multi_edges(multi_edges)
 
-    def links(self):
+    def links(self, copy: bool = True):
         """
+        :param copy: if False, yields read-only views of the attribs stored in the graph rather than copies
         :return: Iterator through each link id its attrib (two-tuple)
         """
-        for link_id in self.link_id_mapping.keys():
-            yield link_id, self.link(link_id)
+        adjacency = self.graph.adj
+        for link_id, link_edge in self.link_id_mapping.items():
+            attribs = adjacency[link_edge['from']][link_edge['to']][link_edge['multi_edge_idx']]
+            yield link_id, dict(attribs) if copy else MappingProxyType(attribs)
 
     def edge_tuple_from_link_id(self, link):
         u, v = self.link_id_mapping[link]['from'], self.link_id_mapping[link]['to']
         multi_idx = self.link_id_mapping[link]['multi_edge_idx']
         return u, v, multi_idx
 
-    def link(self, link_id):
+    def link(self, link_id, copy: bool = True):
         """
         :param link_id:
+        :param copy: if False, returns a read-only view of the attribs stored in the graph rather than a copy
         :return:
         """
         u, v, multi_idx = self.edge_tuple_from_link_id(link_id)
-        return dict(self.graph[u][v][multi_idx])
+        attribs = self.graph[u][v][multi_idx]
+        return dict(attribs) if copy else MappingProxyType(attribs)
 
     def services(self):
         """
@@ -1099,7 +1375,7 @@ class Network:
         return routes
 
     def node_id_exists(self, node_id):
-        if node_id in [i for i, attribs in self.nodes()]:
+        if self.has_node(node_id):
             logging.warning(f'{node_id} already exists.')
             return True
         return False
@@ -1140,7 +1416,8 @@ class Network:
             return has_all_links
         elif has_all_links:
             filter = graph_operations.Filter(conditions, how=any, mixed_dtypes=mixed_dtypes)
-            links_satisfy = [link_id for link_id in link_ids if filter.satisfies_conditions(self.link(link_id))]
+            links_satisfy = [
+                link_id for link_id in link_ids if filter.satisfies_conditions(self.link(link_id, copy=False))]
             return set(links_satisfy) == set(link_ids)
         else:
             return False
@@ -1159,45 +1436,251 @@ class Network:
 
     def route_distance(self, link_ids):
         if self.has_valid_link_chain(link_ids):
+            links = [self.link(link_id, copy=False) for link_id in link_ids]
+            missing_length = [link_attribs for link_attribs in links if 'length' not in link_attribs]
+            missing_lengths = iter(spatial.distances_between_s2cellids(
+                [link_attribs['from'] for link_attribs in missing_length],
+                [link_attribs['to'] for link_attribs in missing_length]).tolist() if missing_length else [])
             distance = 0
-            for link_id in link_ids:
-                link_attribs = self.link(link_id)
-                if 'length' in link_attribs:
-                    distance += link_attribs['length']
-                else:
-                    length = spatial.distance_between_s2cellids(link_attribs['from'], link_attribs['to'])
-                    link_attribs['length'] = length
-                    distance += length
+            for link_attribs in links:
+                distance += link_attribs['length'] if 'length' in link_attribs else next(missing_lengths)
             return distance
         else:
             logging.warning(f'This route is invalid: {link_ids}')
             return 0
 
-    def generate_index_for_node(self, avoid_keys: Union[list, set] = None, silent: bool = False):
-        existing_keys = set([i for i, attribs in self.nodes()])
-        if avoid_keys:
-            existing_keys = existing_keys | set(avoid_keys)
+    def _node_links(self):
+        return self._node_link_index.sync(self.link_id_mapping)
+
+    def in_links(self, node_id):
+        """
+        :param node_id: node id
+        :return: set of ids of links ending at node `node_id`
+        """
+        return self._node_links().in_links(node_id)
+
+    def out_links(self, node_id):
+        """
+        :param node_id: node id
+        :return: set of ids of links starting at node `node_id`
+        """
+        return self._node_links().out_links(node_id)
+
+    def _drop_link_ids_on_nodes(self, nodes):
+        """
+        Removes ids of links going in and out of `nodes` from link_id_mapping, used when the nodes, and with them their
+        edges, are being removed from the graph
+        :param nodes: list or set of node ids
+        :return:
+        """
+        index = self._node_links()
+        for node in nodes:
+            for link_id in index.in_links(node) | index.out_links(node):
+                if link_id in self.link_id_mapping:
+                    u, v, multi_idx = self.edge_tuple_from_link_id(link_id)
+                    del self.link_id_mapping[link_id]
+                    index.remove(link_id, u, v)
+                    self._link_id_allocator.remove([link_id])
+                    self._remove_from_attribute_indices([link_id])
+
+    def enable_attribute_store(self):
+        """
+        Keeps columnar copies of numeric node and link data (e.g. `x`, `y`, `freespeed`, `capacity`) and a bitmask of
+        link modes. Speeds up repeated calls to `node_attribute_data_under_key(s)`, `link_attribute_data_under_key(s)`
+        and `links_on_modal_condition` on large networks. The graph stays the source of truth: the copies are built
+        lazily, kept up to date by methods of this class which change node and link data and rebuilt if the graph or
+        link_id_mapping are replaced. Changes made to the graph's data directly are not picked up, call
+        `disable_attribute_store` before doing so.
+        :return:
+        """
+        self._use_attribute_store = True
+
+    def disable_attribute_store(self):
+        """
+        Stops keeping and drops the columnar copies of node and link data, see `enable_attribute_store`
+        :return:
+        """
+        self._use_attribute_store = False
+        self._invalidate_attribute_stores()
+
+    def _invalidate_attribute_stores(self):
+        self._node_attribute_store = None
+        self._link_attribute_store = None
+
+    def _invalidate_indices(self):
+        self._invalidate_attribute_stores()
+        self._spatial_indices = {}
+        self._modal_subgraphs = {}
+
+    def _node_store(self):
+        if not self._use_attribute_store:
+            return None
+        if self._node_attribute_store is None or not self._node_attribute_store.describes(self.graph):
+            self._node_attribute_store = attribute_store.AttributeStore(
+                self.graph.nodes(data=True), keys=attribute_store.NODE_ATTRIBUTES, sources=(self.graph,))
+        return self._node_attribute_store
+
+    def _link_store(self):
+        if not self._use_attribute_store:
+            return None
+        if self._link_attribute_store is None or \
+                not self._link_attribute_store.describes(self.graph, self.link_id_mapping):
+            self._link_attribute_store = attribute_store.AttributeStore(
+                self.links(copy=False), keys=attribute_store.LINK_ATTRIBUTES, modes=True,
+                sources=(self.graph, self.link_id_mapping))
+        return self._link_attribute_store
+
+    def _update_indices_on_node_data(self, new_attributes: dict):
+        if self._batch is not None:
+            self._invalidate_indices()
+            return
+        if any(('x' in attribs) or ('y' in attribs) for attribs in new_attributes.values()):
+            # default link geometries are drawn between nodes
+            self._spatial_indices = {}
+        elif any('s2_id' in attribs for attribs in new_attributes.values()):
+            self._spatial_indices.pop('s2_nodes', None)
+        if self._node_attribute_store is not None and not self._node_attribute_store.update(new_attributes):
+            self._node_attribute_store = None
+
+    def _update_indices_on_link_data(self, new_attributes: dict):
+        if self._batch is not None:
+            self._invalidate_indices()
+            self._invalidate_attribute_indices()
+            return
+        self._update_attribute_indices(new_attributes)
+        if any('modes' in attribs for attribs in new_attributes.values()):
+            self._modal_subgraphs = {}
+        if any('geometry' in attribs for attribs in new_attributes.values()):
+            self._spatial_indices.pop('links', None)
+            self._spatial_indices.pop('s2_links', None)
+        if self._link_attribute_store is not None and not self._link_attribute_store.update(new_attributes):
+            self._link_attribute_store = None
+
+    def build_attribute_index(self, key: Union[str, dict]):
+        """
+        Builds an inverted (hash) index of values stored on links under `key`. `extract_links_on_edge_attributes`
+        (and methods relying on it) then uses the index, rather than checking every link, for conditions which are
+        equality or set-membership tests on that attribute, e.g. {'attributes': {'osm:way:id': {'text': '123'}}} or
+        {'modes': ['car', 'bus']}. The index is kept up to date by methods of this class which change links.
+        :param key: either a string e.g. 'modes', or if accessing nested information, a dictionary
+            e.g. {'attributes': {'osm:way:id': 'text'}}
+        :return:
+        """
+        path = indexing.attribute_path(key)
+        self._attribute_indices[path] = None
+        self._attribute_index(path)
+
+    def drop_attribute_index(self, key: Union[str, dict]):
+        """
+        Removes index of values stored on links under `key`, see `build_attribute_index`
+        :param key: either a string e.g. 'modes', or if accessing nested information, a dictionary
+            e.g. {'attributes': {'osm:way:id': 'text'}}
+        :return:
+        """
+        self._attribute_indices.pop(indexing.attribute_path(key), None)
+
+    @contextmanager
+    def attribute_index(self, key: Union[str, dict]):
+        """
+        Context manager for querying links with an index of values stored on links under `key`, see
+        `build_attribute_index`. The index is built when the context is entered, if it does not exist already, and is
+        dropped when the context is left, only if it was built here:
+
+            with network.attribute_index('modes'):
+                for mode in modes:
+                    links = network.extract_links_on_edge_attributes(conditions={'modes': mode})
+
+        :param key: either a string e.g. 'modes', or if accessing nested information, a dictionary
+            e.g. {'attributes': {'osm:way:id': 'text'}}
+        :return:
+        """
+        path = indexing.attribute_path(key)
+        if path in self._attribute_indices:
+            yield
+            return
+        self.build_attribute_index(key)
         try:
-            id = max([int(i) for i in existing_keys]) + 1
-        except ValueError:
-            id = len(existing_keys) + 1
-        if (id in existing_keys) or (str(id) in existing_keys):
-            id = uuid.uuid4()
-        if not silent:
-            logging.info(f'Generated node id {id}.')
-        return str(id)
+            yield
+        finally:
+            self.drop_attribute_index(key)
+
+    def _attribute_index(self, path: tuple):
+        index = self._attribute_indices[path]
+        if index is None or not index.describes(self.link_id_mapping):
+            index = indexing.AttributeIndex(path, self.links(copy=False), sources=(self.link_id_mapping,))
+            self._attribute_indices[path] = index
+        return index
+
+    def _invalidate_attribute_indices(self):
+        self._attribute_indices = dict.fromkeys(self._attribute_indices)
+
+    def _add_to_attribute_indices(self, link_ids):
+        for index in filter(None, self._attribute_indices.values()):
+            for link_id in link_ids:
+                index.add(link_id, self.link(link_id, copy=False))
+
+    def _remove_from_attribute_indices(self, link_ids):
+        for index in filter(None, self._attribute_indices.values()):
+            for link_id in link_ids:
+                if link_id in index:
+                    index.remove(link_id)
+
+    def _update_attribute_indices(self, new_attributes: dict):
+        for path, index in self._attribute_indices.items():
+            if index is not None:
+                for link_id, attribs in new_attributes.items():
+                    if (path[0] in attribs) and (link_id in index):
+                        index.update(link_id, self.link(link_id, copy=False))
+
+    def _spatial_index(self, kind: str):
+        """
+        Lazily builds, or rebuilds if stale, the R-tree index of node or link geometries in epsg:4326
+        :param kind: 'nodes' or 'links'
+        :return: genet.utils.spatial.SpatialIndex
+        """
+        sources = (self.graph, self.epsg, self.graph.number_of_nodes(), self.graph.number_of_edges())
+        if (kind not in self._spatial_indices) or not self._spatial_indices[kind].describes(*sources):
+            gdf = self.to_geodataframe()[kind].to_crs("epsg:4326")
+            self._spatial_indices[kind] = spatial.SpatialIndex(gdf, sources=sources)
+        return self._spatial_indices[kind]
+
+    def _s2_index(self, kind: str):
+        """
+        Lazily builds, or rebuilds if stale, the index of S2 cells of nodes (`s2_id`) or links (points of their
+        geometry)
+        :param kind: 'nodes' or 'links'
+        :return: genet.utils.spatial.S2Index
+        """
+        sources = (self.graph, self.epsg, self.graph.number_of_nodes(), self.graph.number_of_edges())
+        key = f's2_{kind}'
+        if (key not in self._spatial_indices) or not self._spatial_indices[key].describes(*sources):
+            if kind == 'nodes':
+                ids, s2_ids = zip(*self.graph.nodes(data='s2_id')) if self.graph else ((), ())
+                s2_geometries = [[] if s2_id is None else [s2_id] for s2_id in s2_ids]
+            else:
+                gdf = self._spatial_index('links').gdf
+                ids = gdf['id']
+                coords = [[(point[0], point[1]) for point in geometry.coords] for geometry in gdf['geometry']]
+                lons, lats = zip(*chain.from_iterable(coords)) if any(coords) else ((), ())
+                s2_ids = iter(spatial.generate_indices_s2(lats, lons).tolist())
+                s2_geometries = [list(islice(s2_ids, len(points))) for points in coords]
+            self._spatial_indices[key] = spatial.S2Index(ids, s2_geometries, sources=sources)
+        return self._spatial_indices[key]
+
+    def _node_ids(self):
+        return self._node_id_allocator.sync(self.graph)
+
+    def _link_ids(self):
+        return self._link_id_allocator.sync(self.link_id_mapping)
+
+    def generate_index_for_node(self, avoid_keys: Union[list, set] = None, silent: bool = False):
+        _id = self._node_ids().generate(n=1, avoid_keys=avoid_keys)[0]
+        if not silent and self._batch is None:
+            logging.info(f'Generated node id {_id}.')
+        return _id
 
     def generate_indices_for_n_nodes(self, n, avoid_keys: Union[list, set] = None):
-        existing_keys = set([i for i, attribs in self.nodes()])
-        if avoid_keys:
-            existing_keys = existing_keys | set(avoid_keys)
-        try:
-            id_set = set([str(max([int(i) for i in existing_keys]) + j) for j in range(1, n + 1)])
-        except ValueError:
-            id_set = set([str(len(existing_keys) + j) for j in range(1, n + 1)])
-        if id_set & existing_keys:
-            id_set = id_set - existing_keys
-            id_set = id_set | set([str(uuid.uuid4()) for i in range(n - len(id_set))])
+        id_set = set(self._node_ids().generate(n=n, avoid_keys=avoid_keys))
         logging.info(f'Generated {len(id_set)} node ids.')
         return id_set
 
@@ -1208,29 +1691,13 @@ class Network:
         return False
 
     def generate_index_for_edge(self, avoid_keys: Union[list, set] = None, silent: bool = False):
-        _id = list(self.generate_indices_for_n_edges(n=1, avoid_keys=avoid_keys))[0]
-        if not silent:
+        _id = self._link_ids().generate(n=1, avoid_keys=avoid_keys)[0]
+        if not silent and self._batch is None:
             logging.info(f'Generated link id {_id}.')
-        return str(_id)
+        return _id
 
     def generate_indices_for_n_edges(self, n, avoid_keys: Union[list, set] = None):
-        existing_keys = set(self.link_id_mapping.keys())
-        if avoid_keys:
-            existing_keys = existing_keys | set(avoid_keys)
-        id_set = set(map(str, range(n))) - existing_keys
-        _max = 0
-        loop_no = 0
-
-        while len(id_set) != n:
-            if loop_no > 0:
-                if not _max:
-                    _max = n
-                else:
-                    _max += n
-            missing_ns = n - len(id_set)
-            id_set |= set(map(str, range(_max + 1, _max + missing_ns + 1))) - existing_keys
-            loop_no += 1
-
+        id_set = set(self._link_ids().generate(n=n, avoid_keys=avoid_keys))
         logging.info(f'Generated {len(id_set)} link ids.')
         return id_set
 
@@ -1241,6 +1708,7 @@ class Network:
         for u, v, multi_edge_idx in self.graph.edges:
             self.link_id_mapping[str(i)] = {'from': u, 'to': v, 'multi_edge_idx': multi_edge_idx}
             i += 1
+        self._invalidate_indices()
 
     def has_schedule_with_valid_network_routes(self):
         routes = [route for route in self.schedule_routes()]
@@ -1309,7 +1777,7 @@ class Network:
             return (value == 0) or (value == '0') or (value == '0.0')
 
         report['graph']['link_attributes']['zero_attributes'] = {}
-        for attrib in [d.name for d in graph_operations.get_attribute_schema(self.links()).descendants]:
+        for attrib in [d.name for d in graph_operations.get_attribute_schema(self.links(copy=False)).descendants]:
             links_with_zero_attrib = self.extract_links_on_edge_attributes(
                 conditions={attrib: zero_value}, mixed_dtypes=False)
             if links_with_zero_attrib:
@@ -1353,7 +1821,7 @@ class Network:
 
     def read_auxiliary_link_file(self, file_path):
         aux_file = auxiliary_files.AuxiliaryFile(file_path)
-        aux_file.attach({link_id for link_id, dat in self.links()})
+        aux_file.attach(set(self.link_id_mapping))
         if aux_file.is_attached():
             self.auxiliary_files['link'][aux_file.filename] = aux_file
         else:
@@ -1372,15 +1840,21 @@ class Network:
         :param id_map: dict map between old link ID and new link ID
         :return:
         """
-        for name, aux_file in self.auxiliary_files['link'].items():
-            aux_file.apply_map(id_map)
+        self._update_auxiliary_files('link', id_map)
 
     def update_node_auxiliary_files(self, id_map: dict):
         """
         :param id_map: dict map between old node ID and new node ID
         :return:
         """
-        for name, aux_file in self.auxiliary_files['node'].items():
+        self._update_auxiliary_files('node', id_map)
+
+    def _update_auxiliary_files(self, id_type: str, id_map: dict):
+        if self._batch is not None:
+            # applying the maps one after another is the same as applying them all merged at once
+            self._batch[id_type].update(id_map)
+            return
+        for name, aux_file in self.auxiliary_files[id_type].items():
             aux_file.apply_map(id_map)
 
     def write_auxiliary_files(self, output_dir):
@@ -1388,6 +1862,20 @@ class Network:
             for name, aux_file in self.auxiliary_files[id_type].items():
                 aux_file.write_to_file(output_dir)
 
+    def set_change_log_level(self, level: str, path: str = None, schedule_path: str = None):
+        """
+        Sets what is recorded in the change logs of the Network and its Schedule from now on, by every method changing
+        them. Some bulk methods can also skip the change log with `ignore_change_log`
+        :param level: 'off', 'summary', 'ids_only' or 'full', see genet.modify.change_log.ChangeLog
+        :param path: optional, path to a file to stream the Network's change log events to, e.g.
+            'network_change_log.csv.gz' or 'network_change_log.jsonl.gz', see genet.modify.change_log.ChangeLogSink.
+            The change log written by `write_extras` is then read from that file
+        :param schedule_path: optional, same as `path` for the Schedule's change log
+        :return:
+        """
+        self.change_log.set_level(level, sink=path)
+        self.schedule.set_change_log_level(level, path=schedule_path)
+
     def write_extras(self, output_dir):
         self.change_log.export(os.path.join(output_dir, 'network_change_log.csv'))
         self.write_auxiliary_files(os.path.join(output_dir, 'auxiliary_files'))
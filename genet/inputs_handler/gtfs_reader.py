@@ -1,25 +1,77 @@
 import csv
+import io
 import logging
 import os
-import shutil
+import zipfile
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
 import networkx as nx
-from datetime import datetime, timedelta
-from genet.utils import spatial, persistence
+from datetime import datetime
+from genet.utils import spatial, persistence, parallel
 import genet.modify.change_log as change_log
 from genet import variables
 
+# number of stop_times rows read at a time, when only stop times of some of the trips are needed
+STOP_TIMES_CHUNKSIZE = 10 ** 6
 
-def read_services_from_calendar(path, day):
+
+def list_gtfs_files(path):
+    """
+    Lists files of a GTFS feed
+    :param path: path to GTFS folder or a zip file
+    :return: list of file names, relative to the folder, or members of the zip file
+    """
+    if persistence.is_zip(path):
+        with zipfile.ZipFile(path, 'r') as zip_ref:
+            return [info.filename for info in zip_ref.infolist()
+                    if not (info.is_dir() or info.filename.startswith('__MACOSX')
+                            or os.path.basename(info.filename).startswith('.'))]
+    return os.listdir(path)
+
+
+@contextmanager
+def open_gtfs_file(path, file_name):
+    """
+    Opens a file of a GTFS feed for reading, in binary mode, straight from the zip file if the feed is zipped
+    :param path: path to GTFS folder or a zip file
+    :param file_name: file name, as given by `list_gtfs_files`
+    :return: file object
+    """
+    if persistence.is_zip(path):
+        with zipfile.ZipFile(path, 'r') as zip_ref:
+            with zip_ref.open(file_name, 'r') as file:
+                yield file
+    else:
+        with open(os.path.join(path, file_name), mode='rb') as file:
+            yield file
+
+
+def read_calendar(path):
+    """
+    Reads the calendar of a GTFS feed
+    :param path: path to GTFS folder or a zip file
+    :return: list of calendar rows, dictionaries {column: value}, or None if the feed has no calendar
+    """
+    logging.info("Reading the calendar for GTFS")
+
+    calendar = None
+    for file_name in list_gtfs_files(path):
+        base_name = os.path.basename(file_name)
+        if ("calendar" in base_name) and (not ("dates" in base_name)):
+            calendar = [] if calendar is None else calendar
+            with open_gtfs_file(path, file_name) as infile:
+                calendar.extend(csv.DictReader(io.TextIOWrapper(infile, encoding="utf-8-sig")))
+    return calendar
+
+
+def services_from_calendar(calendar, day):
     """
     return list of services to be included
-    :param path: path to GTFS folder
+    :param calendar: calendar rows, see `read_calendar`
     :param day: 'YYYYMMDD' for specific day
     :return:
     """
-    logging.info("Reading the calendar for GTFS")
-
     weekdays = {
         0: 'monday',
         1: 'tuesday',
@@ -32,27 +84,65 @@ def read_services_from_calendar(path, day):
     day_of_the_week = weekdays[datetime.strptime(day, '%Y%m%d').weekday()]
 
     services = []
-
-    calendar_present = False
-    for file_name in os.listdir(path):
-        file = os.path.join(path, file_name)
-        if ("calendar" in file) and (not ("dates" in file)):
-            calendar_present = True
-            with open(file, mode='r', encoding="utf-8-sig") as infile:
-                reader = csv.DictReader(infile)
-                for row in reader:
-                    if (int(day) in range(int(row['start_date']), int(row['end_date']))) and \
-                            (int(row[day_of_the_week]) == 1):
-                        services.append(row['service_id'])
+    for row in calendar or []:
+        if (int(day) in range(int(row['start_date']), int(row['end_date']))) and \
+                (int(row[day_of_the_week]) == 1):
+            services.append(row['service_id'])
     if not services:
-        if calendar_present:
+        if calendar is not None:
             raise RuntimeError('The date you have selected yielded no services')
         else:
             raise RuntimeError('Calendar was not found with the GTFS')
     return services
 
 
-def read_gtfs_to_db_like_tables(path):
+def read_services_from_calendar(path, day):
+    """
+    return list of services to be included
+    :param path: path to GTFS folder or a zip file
+    :param day: 'YYYYMMDD' for specific day
+    :return:
+    """
+    return services_from_calendar(read_calendar(path), day)
+
+
+def read_stop_times_of_trips(file, trip_ids, chunksize=STOP_TIMES_CHUNKSIZE):
+    """
+    Reads the stop times needed for a schedule, of the given trips only. The file is read in chunks so that memory
+    use depends on the number of stop times of the selected trips, rather than the size of the file. Times are
+    given in seconds past midnight, see `get_times_in_seconds`.
+    :param file: GTFS stop_times file, path or file object
+    :param trip_ids: trip ids to keep
+    :param chunksize: number of rows to read at a time
+    :return: pandas.DataFrame with trip_id, arrival_time, departure_time, stop_id and stop_sequence columns
+    """
+    trip_ids = set(trip_ids)
+    chunks = []
+    for chunk in pd.read_csv(file, usecols=['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+                             dtype={'trip_id': str, 'stop_id': str, 'arrival_time': str, 'departure_time': str},
+                             chunksize=chunksize):
+        chunk = chunk[chunk['trip_id'].isin(trip_ids)]
+        if not chunk.empty:
+            chunk = chunk.assign(
+                arrival_time=get_times_in_seconds(chunk['arrival_time']).astype(np.int32),
+                departure_time=get_times_in_seconds(chunk['departure_time']).astype(np.int32),
+                stop_sequence=pd.to_numeric(chunk['stop_sequence'], downcast='integer'))
+            chunks.append(chunk)
+    if chunks:
+        return pd.concat(chunks, ignore_index=True)
+    return pd.DataFrame({'trip_id': pd.Series(dtype=str), 'arrival_time': pd.Series(dtype=np.int32),
+                         'departure_time': pd.Series(dtype=np.int32), 'stop_id': pd.Series(dtype=str),
+                         'stop_sequence': pd.Series(dtype=np.int32)})
+
+
+def read_gtfs_to_db_like_tables(path, services=None):
+    """
+    Reads GTFS files into pandas.DataFrames
+    :param path: path to GTFS folder or a zip file
+    :param services: optional, list of service ids to read trips and stop times for. If given, stop times are read
+        for those trips only, with the columns needed for a schedule, see `read_stop_times_of_trips`
+    :return: stop_times_db, stops_db, trips_db, routes_db
+    """
     logging.info("Reading GTFS data into usable format")
 
     trips_db = None
@@ -60,24 +150,37 @@ def read_gtfs_to_db_like_tables(path):
     routes_db = None
     stop_times_db = None
 
-    for file_name in os.listdir(path):
-        file = os.path.join(path, file_name)
+    stop_times_file = None
+    for file_name in list_gtfs_files(path):
+        base_name = os.path.basename(file_name)
 
-        if "stop_times" in file:
-            logging.info("Reading stop times")
-            stop_times_db = pd.read_csv(file, dtype={'trip_id': str, 'stop_id': str}, low_memory=False)
+        if "stop_times" in base_name:
+            stop_times_file = file_name
 
-        elif "stops" in file:
+        elif "stops" in base_name:
             logging.info("Reading stops")
-            stops_db = pd.read_csv(file, dtype={'stop_id': str})
+            with open_gtfs_file(path, file_name) as file:
+                stops_db = pd.read_csv(file, dtype={'stop_id': str})
 
-        elif "trips" in file:
+        elif "trips" in base_name:
             logging.info("Reading trips")
-            trips_db = pd.read_csv(file, dtype={'route_id': str, 'service_id': str, 'trip_id': str})
+            with open_gtfs_file(path, file_name) as file:
+                trips_db = pd.read_csv(file, dtype={'route_id': str, 'service_id': str, 'trip_id': str})
+            if services is not None:
+                trips_db = trips_db[trips_db['service_id'].isin(services)].reset_index(drop=True)
 
-        elif "routes" in file:
+        elif "routes" in base_name:
             logging.info("Reading routes")
-            routes_db = pd.read_csv(file, dtype={'route_id': str})
+            with open_gtfs_file(path, file_name) as file:
+                routes_db = pd.read_csv(file, dtype={'route_id': str})
+
+    if stop_times_file is not None:
+        logging.info("Reading stop times")
+        with open_gtfs_file(path, stop_times_file) as file:
+            if (services is not None) and (trips_db is not None):
+                stop_times_db = read_stop_times_of_trips(file, trips_db['trip_id'])
+            else:
+                stop_times_db = pd.read_csv(file, dtype={'trip_id': str, 'stop_id': str}, low_memory=False)
 
     return stop_times_db, stops_db, trips_db, routes_db
 
@@ -92,80 +195,104 @@ def get_mode(route_type):
         return 'other'
 
 
-def gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, services):
-    def get_time(time):
-        # return time as datetime.datetime, account for 24 in %H
-        time_list = time.split(':')
-        if int(time_list[0]) >= 24:
-            days = int(time_list[0]) // 24
-            time_list[0] = int(time_list[0]) % 24
-            if time_list[0] < 10:
-                time_list[0] = '0{}'.format(time_list[0])
-            else:
-                time_list[0] = str(time_list[0])
-            return datetime.strptime(':'.join(time_list), '%H:%M:%S') + timedelta(days=days)
-        else:
-            return datetime.strptime(time, '%H:%M:%S')
+def get_times_in_seconds(times: pd.Series) -> np.ndarray:
+    """
+    Parses GTFS times 'HH:MM:SS' to integer seconds past midnight, hours can be 24 or more for times past midnight
+    of the following day(s)
+    :param times: pandas.Series of 'HH:MM:SS' strings
+    :return: numpy array of integer seconds
+    """
+    hms = times.astype(str).str.strip().str.split(':', expand=True).astype(np.int64).values
+    return hms[:, 0] * 3600 + hms[:, 1] * 60 + hms[:, 2]
 
-    def timedelta_to_hms(td):
-        return str(td).split('days')[-1].strip(' ')
 
-    def generate_stop_sequence(group):
-        group = group.sort_values(by='stop_sequence')
-        # remove stops that are loopy (consecutively duplicated)
-        unique_stops_mask = group['stop_id'].shift() != group['stop_id']
-        if not unique_stops_mask.all():
-            logging.warning(
-                'Your GTFS has (a) looooop edge(s)! A zero link between a node and itself, edge affected '
-                '\nThis edge will not be considered for computation, the stop will be deleted and the '
-                f'schedule will be changed. Affected stops: {group[~unique_stops_mask]["stop_id"].to_list()}')
-        group = group.loc[unique_stops_mask]
-        flattened = group.iloc[0, :][
-            list(set(group.columns) - {'trip_id', 'stop_sequence', 'stop_id', 'arrival_time', 'departure_time'})]
-        departure_time = group.iloc[0, :]['arrival_time']
-        flattened['trip_departure_time'] = departure_time.strftime("%H:%M:%S")
-        flattened['ordered_stops'] = group['stop_id'].to_list()
-        flattened['stops_str'] = ','.join(group['stop_id'].to_list())
-        flattened['arrival_offsets'] = [timedelta_to_hms(t - departure_time) for t in group['arrival_time']]
-        flattened['departure_offsets'] = [timedelta_to_hms(t - departure_time) for t in group['departure_time']]
-        return flattened
-
-    def generate_trips(group):
-        flattened = group.iloc[0, :][
-            list(set(group.columns) - {'route_id', 'stops_str', 'trip_id', 'vehicle_id', 'trip_departure_time'})]
-        trip_id = group['trip_id'].to_list()
-        trip_departure_time = group['trip_departure_time'].to_list()
-        vehicle_id = group['vehicle_id'].to_list()
-        flattened['trips'] = {
-            'trip_id': trip_id,
-            'trip_departure_time': trip_departure_time,
-            'vehicle_id': vehicle_id
-        }
-        return flattened
-
-    def generate_routes(group):
-        service_id = group.iloc[0, :]['service_id']
-        group['route_id'] = [f'{service_id}_{i}' for i in range(len(group))]
-        return group
+def seconds_to_hms(seconds: np.ndarray) -> np.ndarray:
+    """
+    Formats integer seconds as 'HH:MM:SS' time of day, i.e. wrapping around 24 hours. Negative values are prefixed
+    with '+', the way the time of day is given by pandas for negative timedeltas.
+    :param seconds: numpy array of integer seconds
+    :return: numpy array of 'HH:MM:SS' strings
+    """
+    seconds = np.asarray(seconds, dtype=np.int64)
+    time_of_day = seconds % 86400
+    hms = pd.Series(time_of_day // 3600).astype(str).str.zfill(2) + ':' + \
+        pd.Series(time_of_day % 3600 // 60).astype(str).str.zfill(2) + ':' + \
+        pd.Series(time_of_day % 60).astype(str).str.zfill(2)
+    return np.where(seconds < 0, '+' + hms, hms).astype(object)
 
+
+def _split_at(values: list, starts: np.ndarray, ends: np.ndarray) -> list:
+    return [values[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, services):
     trips_db = trips_db[trips_db['service_id'].isin(services)]
     df = trips_db[['route_id', 'trip_id']].merge(
         routes_db[['route_id', 'route_type', 'route_short_name', 'route_long_name', 'route_color']], on='route_id',
         how='left')
-    df['mode'] = df['route_type'].apply(lambda x: get_mode(x))
+    df['mode'] = df['route_type'].map({route_type: get_mode(route_type) for route_type in df['route_type'].unique()})
     df = df.merge(stop_times_db[['trip_id', 'stop_id', 'arrival_time', 'departure_time', 'stop_sequence']],
                   on='trip_id', how='left')
-    df['arrival_time'] = df['arrival_time'].apply(lambda x: get_time(x))
-    df['departure_time'] = df['departure_time'].apply(lambda x: get_time(x))
-
-    df = df.groupby('trip_id').apply(generate_stop_sequence).reset_index()
+    for col in ['arrival_time', 'departure_time']:
+        if not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = get_times_in_seconds(df[col])
+
+    # stop sequences of trips, one after the other, trips ordered by their ids
+    df = df.sort_values(by=['trip_id', 'stop_sequence']).reset_index(drop=True)
+    trip_starts = (df['trip_id'] != df['trip_id'].shift()).values
+    # remove stops that are loopy (consecutively duplicated)
+    loopy_stops = ~trip_starts & (df['stop_id'] == df['stop_id'].shift()).values
+    if loopy_stops.any():
+        for trip_id, stops in df.loc[loopy_stops].groupby('trip_id')['stop_id']:
+            logging.warning(
+                'Your GTFS has (a) looooop edge(s)! A zero link between a node and itself, edge affected '
+                '\nThis edge will not be considered for computation, the stop will be deleted and the '
+                f'schedule will be changed. Affected stops: {stops.to_list()}')
+        df = df.loc[~loopy_stops].reset_index(drop=True)
+        trip_starts = trip_starts[~loopy_stops]
+    starts = np.flatnonzero(trip_starts)
+    ends = np.append(starts[1:], len(df))
+    trip_departure_times = df['arrival_time'].values[starts]
+
+    trips = df.loc[starts, ['trip_id', 'route_id', 'route_type', 'route_short_name', 'route_long_name',
+                            'route_color', 'mode']].reset_index(drop=True)
+    trips['trip_departure_time'] = seconds_to_hms(trip_departure_times)
+    stop_ids = df['stop_id'].values
+    trips['stops_str'] = [','.join(stops) for stops in _split_at(stop_ids.tolist(), starts, ends)]
     # drop stop sequences that are single stops
-    df = df[df['ordered_stops'].str.len() > 1]
-    df['vehicle_id'] = [f'veh_{i}' for i in range(len(df))]
-    df = df.groupby(['route_id', 'stops_str']).apply(generate_trips).reset_index()
-    df = df.drop('stops_str', axis=1)
+    trips = trips[(ends - starts) > 1].copy()
+    trips['vehicle_id'] = [f'veh_{i}' for i in range(len(trips))]
+
+    # trips with the same route_id and stop sequence make up a route, its stops and offsets are those of its first trip
+    trips = trips.sort_values(by=['route_id', 'stops_str'])
+    route_starts = ((trips['route_id'] != trips['route_id'].shift()) |
+                    (trips['stops_str'] != trips['stops_str'].shift())).values
+    first_trips = trips.index.values[route_starts]
+    route_stop_counts = (ends - starts)[first_trips]
+    route_stop_ends = np.cumsum(route_stop_counts)
+    route_stop_starts = route_stop_ends - route_stop_counts
+    # positions, in df, of the stops of the first trips, route after route
+    route_stops = np.repeat(starts[first_trips] - route_stop_starts, route_stop_counts) + np.arange(
+        route_stop_ends[-1] if len(route_stop_ends) else 0)
+    trip_departure_times = np.repeat(trip_departure_times[first_trips], route_stop_counts)
+    arrival_offsets = seconds_to_hms(df['arrival_time'].values[route_stops] - trip_departure_times).tolist()
+    departure_offsets = seconds_to_hms(df['departure_time'].values[route_stops] - trip_departure_times).tolist()
+
+    route_trip_starts = np.flatnonzero(route_starts)
+    route_trip_ends = np.append(route_trip_starts[1:], len(trips))
+    df = trips.loc[first_trips, ['route_id', 'route_type', 'route_short_name', 'route_long_name', 'route_color',
+                                 'mode']].reset_index(drop=True)
+    df['ordered_stops'] = _split_at(stop_ids[route_stops].tolist(), route_stop_starts, route_stop_ends)
+    df['arrival_offsets'] = _split_at(arrival_offsets, route_stop_starts, route_stop_ends)
+    df['departure_offsets'] = _split_at(departure_offsets, route_stop_starts, route_stop_ends)
+    df['trips'] = [
+        {'trip_id': trip_id, 'trip_departure_time': trip_departure_time, 'vehicle_id': vehicle_id}
+        for trip_id, trip_departure_time, vehicle_id in zip(
+            *[_split_at(trips[col].to_list(), route_trip_starts, route_trip_ends)
+              for col in ['trip_id', 'trip_departure_time', 'vehicle_id']])
+    ]
     df['service_id'] = df['route_id'].astype(str)
-    df = df.groupby(['service_id']).apply(generate_routes)
+    df['route_id'] = df['service_id'] + '_' + df.groupby('service_id').cumcount().astype(str)
 
     g = nx.DiGraph(name='Schedule graph')
     g.graph['crs'] = {'init': 'epsg:4326'}
@@ -192,8 +319,8 @@ def gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, serv
     stops_db['x'] = stops_db['lon']
     stops_db['y'] = stops_db['lat']
     stops_db['epsg'] = 'epsg:4326'
-    stops_db['s2_id'] = stops_db.apply(
-        lambda x: spatial.generate_index_s2(lat=float(x['lat']), lng=float(x['lon'])), axis=1)
+    stops_db['s2_id'] = spatial.generate_indices_s2(
+        stops_db['lat'].astype(float), stops_db['lon'].astype(float)).tolist()
     nx.set_node_attributes(g, stops_db[stops_db['stop_id'].isin(stops)].set_index('stop_id').T.to_dict())
     nx.set_node_attributes(g, pd.DataFrame(stop_groups['route_id'].apply(set)).rename(
         columns={'route_id': 'routes'}).T.to_dict())
@@ -218,21 +345,52 @@ def gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, serv
 
 
 def read_gtfs_to_schedule_graph(path: str, day: str):
-    if persistence.is_zip(path):
-        gtfs_path = os.path.join(os.getcwd(), 'tmp')
-        if not os.path.exists(gtfs_path):
-            os.makedirs(gtfs_path)
-        import zipfile
-        with zipfile.ZipFile(path, 'r') as zip_ref:
-            zip_ref.extractall(gtfs_path)
-        gtfs_path = os.path.join(gtfs_path, os.path.splitext(os.path.basename(path))[0])
-    else:
-        gtfs_path = path
+    """
+    Reads GTFS feed to a schedule graph, for the services running on the given day
+    :param path: path to GTFS folder or a zip file, zip files are read without being extracted
+    :param day: 'YYYYMMDD' for specific day
+    :return: networkx.DiGraph schedule graph
+    """
+    services = read_services_from_calendar(path, day=day)
+    stop_times_db, stops_db, trips_db, routes_db = read_gtfs_to_db_like_tables(path, services=services)
+    return gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, services)
 
-    services = read_services_from_calendar(gtfs_path, day=day)
-    stop_times_db, stops_db, trips_db, routes_db = read_gtfs_to_db_like_tables(gtfs_path)
-    schedule_graph = gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, services)
 
-    if persistence.is_zip(path):
-        shutil.rmtree(os.path.dirname(gtfs_path))
-    return schedule_graph
+def gtfs_db_to_schedule_graphs(days_to_services, stop_times_db, stops_db, trips_db, routes_db):
+    """
+    Builds schedule graphs for several days from the same GTFS tables
+    :param days_to_services: {day: list of service ids running on that day}
+    :param stop_times_db: stop times, see `read_gtfs_to_db_like_tables`
+    :param stops_db: stops
+    :param trips_db: trips
+    :param routes_db: routes
+    :return: {day: networkx.DiGraph schedule graph}
+    """
+    return {day: gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, services)
+            for day, services in days_to_services.items()}
+
+
+def read_gtfs_to_schedule_graphs(path: str, days: list, processes: int = 1):
+    """
+    Reads GTFS feed to schedule graphs, one for each of the days. The calendar and tables of the feed are read once,
+    for the services running on any of the days.
+    :param path: path to GTFS folder or a zip file, zip files are read without being extracted
+    :param days: list of 'YYYYMMDD' days
+    :param processes: number of processes to build the schedule graphs of the days with
+    :return: {day: networkx.DiGraph schedule graph}
+    """
+    calendar = read_calendar(path)
+    days_to_services = {day: services_from_calendar(calendar, day) for day in days}
+    services = sorted(set().union(*days_to_services.values()))
+    stop_times_db, stops_db, trips_db, routes_db = read_gtfs_to_db_like_tables(path, services=services)
+    return parallel.multiprocess_wrap(
+        data=days_to_services,
+        split=parallel.split_dict,
+        apply=gtfs_db_to_schedule_graphs,
+        combine=parallel.combine_dict,
+        processes=processes,
+        stop_times_db=stop_times_db,
+        stops_db=stops_db,
+        trips_db=trips_db,
+        routes_db=routes_db
+    )
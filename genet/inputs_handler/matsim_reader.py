@@ -2,39 +2,56 @@ import re
 import logging
 import networkx as nx
 import xml.etree.cElementTree as ET
+from lxml import etree
 from pyproj import Transformer, Proj
+import genet.modify.change_log as change_log
 from genet.utils import spatial
 from genet.schedule_elements import Route, Stop, Service
 
 
-def read_node(elem, g, node_id_mapping, transformer):
+def read_node(elem, nodes):
     """
-    Adds node elem of the stream to the network
+    Reads node elem of the stream, nodes are added to the network in bulk, see `add_nodes`
     :param elem:
+    :param nodes: list of attributes of nodes read so far
+    :return: nodes
+    """
+    attribs = dict(elem.attrib)
+    attribs['x'], attribs['y'] = float(attribs['x']), float(attribs['y'])
+    nodes.append(attribs)
+    return nodes
+
+
+def add_nodes(nodes, g, node_id_mapping, duplicated_node_ids, transformer):
+    """
+    Adds nodes read from the stream to the network. Coordinates of all nodes are transformed in one go, and their
+    s2 spatial ids are generated together
+    :param nodes: list of node attributes, see `read_node`
     :param g: nx.MultiDiGraph
     :param node_id_mapping:
+    :param duplicated_node_ids: dict {node id: list of attributes of the nodes that were not added}
     :param transformer:
-    :return:
+    :return: g, duplicated_node_ids
     """
-    duplicated_node_id = {}
-    attribs = elem.attrib
-    attribs['x'], attribs['y'] = float(attribs['x']), float(attribs['y'])
-    lon, lat = spatial.change_proj(attribs['x'], attribs['y'], transformer)
+    lons, lats = spatial.change_proj_arrays(
+        [attribs['x'] for attribs in nodes], [attribs['y'] for attribs in nodes], transformer)
     # ideally we would check if the transformer was created with always_xy=True and swap
     # lat and long values if so, but there is no obvious way to interrogate the transformer
-    attribs['lon'], attribs['lat'] = lon, lat
-    attribs['s2_id'] = spatial.generate_index_s2(lat, lon)
-    node_id = attribs['id']
-    if node_id in node_id_mapping:
-        logging.warning('This MATSim network has a node that is not unique: {}. Generating a new id would'
-                        'be pointless as we don\'t know which links should be connected to this particular'
-                        'node. The node will cease to exist and the first encountered node with this id'
-                        'will be kept. Investigate the links connected to that node.'.format(node_id))
-        duplicated_node_id[node_id] = attribs
-    else:
-        node_id_mapping[node_id] = attribs['s2_id']
-        g.add_node(node_id, **attribs)
-    return g, duplicated_node_id
+    s2_ids = spatial.generate_indices_s2(lats, lons).tolist()
+    for attribs, lon, lat, s2_id in zip(nodes, lons, lats, s2_ids):
+        attribs['lon'], attribs['lat'] = lon, lat
+        attribs['s2_id'] = s2_id
+        node_id = attribs['id']
+        if node_id in node_id_mapping:
+            logging.warning('This MATSim network has a node that is not unique: {}. Generating a new id would'
+                            'be pointless as we don\'t know which links should be connected to this particular'
+                            'node. The node will cease to exist and the first encountered node with this id'
+                            'will be kept. Investigate the links connected to that node.'.format(node_id))
+            duplicated_node_ids.setdefault(node_id, []).append(attribs)
+        else:
+            node_id_mapping[node_id] = s2_id
+            g.add_node(node_id, **attribs)
+    return g, duplicated_node_ids
 
 
 def read_link(elem, g, u, v, node_id_mapping, link_id_mapping, link_attribs):
@@ -51,7 +68,7 @@ def read_link(elem, g, u, v, node_id_mapping, link_id_mapping, link_attribs):
     """
     duplicated_link_id = {}
 
-    attribs = elem.attrib
+    attribs = dict(elem.attrib)
     attribs['s2_from'] = node_id_mapping[attribs['from']]
     attribs['s2_to'] = node_id_mapping[attribs['to']]
     attribs['modes'] = set(attribs['modes'].split(','))
@@ -99,7 +116,7 @@ def read_link_attrib(elem, link_attribs):
     :param link_attribs: current link attributes
     :return:
     """
-    d = elem.attrib
+    d = dict(elem.attrib)
     if elem.text is None:
         d['text'] = ''
         logging.warning(f"Elem {elem.attrib['name']} is being read as None.")
@@ -126,9 +143,24 @@ def unique_link_id(link_id, link_id_mapping):
     return link_id, duplicated_link_id
 
 
+def _release_element(elem):
+    """
+    Frees an element of the stream that has been read, together with its already read preceding siblings, so that
+    the parsed XML tree does not grow with the size of the file
+    :param elem: lxml element
+    :return:
+    """
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
 def read_network(network_path, transformer: Transformer):
     """
-    Read MATSim network
+    Read MATSim network. The file is streamed, elements are discarded as soon as they are read, so memory use does
+    not grow with the size of the XML file.
     :param network_path: path to the network.xml file
     :param transformer: pyproj crs transformer
     :return: g (nx.MultiDiGraph representing the multimodal network),
@@ -144,23 +176,22 @@ def read_network(network_path, transformer: Transformer):
     duplicated_link_ids = {}
     duplicated_node_ids = {}
     u, v = None, None
+    nodes = []
 
-    for event, elem in ET.iterparse(network_path):
+    for event, elem in etree.iterparse(network_path, events=('end',), tag=('node', 'link', 'attribute')):
         if elem.tag == 'node':
-            g, duplicated_node_id = read_node(elem, g, node_id_mapping, transformer)
-            if duplicated_node_id:
-                for key, val in duplicated_node_id.items():
-                    if key in duplicated_node_ids:
-                        duplicated_node_ids[key].append(val)
-                    else:
-                        duplicated_node_ids[key] = [val]
+            nodes = read_node(elem, nodes)
         elif elem.tag == 'attribute':
-            if node_id_mapping:
+            if node_id_mapping or nodes:
                 link_attribs = read_link_attrib(elem, link_attribs)
             # else the attribute is on network level and does not belong to any nodes or links
             elif elem.attrib['name'] == 'simplified':
                 g.graph['simplified'] = 'True' == elem.text
         elif elem.tag == 'link':
+            if nodes:
+                # nodes precede links in the file
+                g, duplicated_node_ids = add_nodes(nodes, g, node_id_mapping, duplicated_node_ids, transformer)
+                nodes = []
             g, u, v, link_id_mapping, duplicated_link_id = read_link(
                 elem, g, u, v, node_id_mapping, link_id_mapping, link_attribs)
             if duplicated_link_id:
@@ -171,6 +202,9 @@ def read_network(network_path, transformer: Transformer):
                         duplicated_link_ids[key] = [val]
             # reset link_attribs
             link_attribs = {}
+        _release_element(elem)
+    if nodes:
+        g, duplicated_node_ids = add_nodes(nodes, g, node_id_mapping, duplicated_node_ids, transformer)
     return g, link_id_mapping, duplicated_node_ids, duplicated_link_ids
 
 
@@ -311,6 +345,178 @@ def read_schedule(schedule_path, epsg):
     return services, minimalTransferTimes
 
 
+def read_schedule_to_schedule_graph(schedule_path, epsg):
+    """
+    Read MATSim schedule straight into a Schedule graph, without creating Stop, Route and Service objects. The file
+    is streamed, each transitRoute is read in one go once parsed. Stops are projected together, once each, after
+    the whole file has been read.
+    :param schedule_path: path to the schedule.xml file
+    :param epsg: 'epsg:12345'
+    :return: schedule graph (nx.DiGraph, see genet.Schedule), minimal transfer times
+        {'stop_id_1': {stop: 'stop_id_2', transfer_time: 0.0}}
+    """
+    transit_stops = {}
+    minimal_transfer_times = {}
+    graph_routes = {}
+    graph_services = {}
+    route_to_service_map = {}
+    service_to_route_map = {}
+    stop_references = {}
+    edge_references = {}
+    line_routes = {}
+
+    def add_transit_line(line_elem):
+        service_id = line_elem.attrib['id']
+        original_service_id = service_id
+        if service_id in graph_services:
+            i = 0
+            while service_id in graph_services:
+                service_id = f'{original_service_id}_{i}'
+                i += 1
+            logging.warning(f'Service has been re-indexed from {original_service_id} to {service_id} due to an ID '
+                            'clash')
+        name = line_elem.attrib['name']
+        # a service inherits a name from its routes
+        graph_services[service_id] = {'id': service_id, 'name': str(name) if (name and line_routes) else ''}
+        service_to_route_map[service_id] = []
+        service_route_ids = []
+        for route_id, route in line_routes.items():
+            if (not route_id) or (route_id in service_route_ids):
+                new_id = f'{original_service_id}_{len(service_route_ids)}'
+                logging.warning(f'Route has been re-indexed from {route_id} tp {new_id} due to an ID clash')
+                route_id = new_id
+            service_route_ids.append(route_id)
+            if route_id in route_to_service_map:
+                # Services index their routes uniquely within themselves
+                route_id = f'{service_id}_{route_id}'
+            route['route_short_name'] = name
+            route['id'] = route_id
+            graph_routes[route_id] = route
+            route_to_service_map[route_id] = service_id
+            service_to_route_map[service_id].append(route_id)
+            for stop in route['ordered_stops']:
+                references = stop_references.setdefault(stop, {'routes': set(), 'services': set()})
+                references['routes'].add(route_id)
+                references['services'].add(service_id)
+            for edge in zip(route['ordered_stops'][:-1], route['ordered_stops'][1:]):
+                references = edge_references.setdefault(edge, {'routes': set(), 'services': set()})
+                references['routes'].add(route_id)
+                references['services'].add(service_id)
+
+    for event, elem in etree.iterparse(
+            schedule_path, events=('end',), tag=('stopFacility', 'relation', 'transitRoute', 'transitLine')):
+        if elem.tag == 'stopFacility':
+            if elem.attrib['id'] not in transit_stops:
+                transit_stops[elem.attrib['id']] = dict(elem.attrib)
+        elif elem.tag == 'relation':
+            if elem.getparent().tag == 'minimalTransferTimes':
+                attribs = elem.attrib
+                if not attribs['toStop'] in minimal_transfer_times:
+                    minimal_transfer_times[attribs['fromStop']] = {
+                        'stop': attribs['toStop'],
+                        'transferTime': float(attribs['transferTime'])
+                    }
+        elif elem.tag == 'transitRoute':
+            line_routes[elem.attrib['id']] = read_transit_route(elem)
+        elif elem.tag == 'transitLine':
+            add_transit_line(elem)
+            line_routes = {}
+        _release_element(elem)
+
+    g = nx.DiGraph(name='Schedule graph')
+    g.graph['route_to_service_map'] = route_to_service_map
+    g.graph['service_to_route_map'] = service_to_route_map
+    g.graph['change_log'] = change_log.ChangeLog()
+    g.graph['routes'] = graph_routes
+    g.graph['services'] = graph_services
+    g.add_nodes_from(read_transit_stops([transit_stops[stop] for stop in stop_references], epsg))
+    nx.set_node_attributes(g, stop_references)
+    g.add_edges_from(edge_references)
+    nx.set_edge_attributes(g, edge_references)
+    return g, minimal_transfer_times
+
+
+def read_transit_route(elem):
+    """
+    Reads transitRoute elem of the stream, once all of it has been parsed
+    :param elem:
+    :return: route data, as stored in a Schedule graph, route_short_name and id are filled in by the transitLine
+    """
+    arrival_offsets = []
+    departure_offsets = []
+    await_departure = []
+    ordered_stops = []
+    for stop in elem.iter('stop'):
+        stop = stop.attrib
+        ordered_stops.append(stop['refId'])
+        if 'departureOffset' not in stop and 'arrivalOffset' not in stop:
+            pass
+        elif 'departureOffset' not in stop:
+            arrival_offsets.append(stop['arrivalOffset'])
+            departure_offsets.append(stop['arrivalOffset'])
+        elif 'arrivalOffset' not in stop:
+            arrival_offsets.append(stop['departureOffset'])
+            departure_offsets.append(stop['departureOffset'])
+        else:
+            arrival_offsets.append(stop['arrivalOffset'])
+            departure_offsets.append(stop['departureOffset'])
+
+        if 'awaitDeparture' in stop:
+            await_departure.append(str(stop['awaitDeparture']).lower() in ['true', '1'])
+
+    trips = {
+        'trip_id': [],
+        'trip_departure_time': [],
+        'vehicle_id': []
+    }
+    for departure in elem.iter('departure'):
+        trips['trip_id'].append(departure.attrib['id'])
+        trips['trip_departure_time'].append(departure.attrib['departureTime'])
+        trips['vehicle_id'].append(departure.attrib['vehicleRefId'])
+
+    return {
+        'route_short_name': '',
+        'mode': elem.findtext('transportMode'),
+        'trips': trips,
+        'arrival_offsets': arrival_offsets,
+        'departure_offsets': departure_offsets,
+        'route_long_name': '',
+        'id': elem.attrib['id'],
+        'route': [link.attrib['refId'] for link in elem.iter('link')],
+        'await_departure': await_departure,
+        'ordered_stops': ordered_stops
+    }
+
+
+def read_transit_stops(stop_facilities, epsg):
+    """
+    Generates Schedule graph nodes for stops, all stops are projected to 'epsg:4326' and indexed with s2sphere at once
+    :param stop_facilities: list of stopFacility attributes
+    :param epsg: 'epsg:12345', projection of the stops
+    :return: list of (stop_id, stop attributes) tuples, stop attributes are the same as genet.Stop's
+    """
+    xs = [float(attribs['x']) for attribs in stop_facilities]
+    ys = [float(attribs['y']) for attribs in stop_facilities]
+    if epsg == 'epsg:4326':
+        lons, lats = xs, ys
+    else:
+        transformer = Transformer.from_proj(Proj(epsg), Proj('epsg:4326'), always_xy=True)
+        lons, lats = spatial.change_proj_arrays(xs, ys, transformer)
+    s2_ids = spatial.generate_indices_s2(lats, lons).tolist()
+
+    nodes = []
+    for attribs, x, y, lon, lat, s2_id in zip(stop_facilities, xs, ys, lons, lats, s2_ids):
+        stop = {'id': attribs['id'], 'x': x, 'y': y, 'epsg': epsg, 'name': '', 'lon': lon, 'lat': lat,
+                's2_id': s2_id, 'additional_attributes': set()}
+        # same as Stop.add_additional_attributes
+        for k, v in attribs.items():
+            if k not in stop or (not stop[k] and k != 'additional_attributes'):
+                stop[k] = v
+                stop['additional_attributes'].add(k)
+        nodes.append((attribs['id'], stop))
+    return nodes
+
+
 def read_vehicles(vehicles_path):
     vehicles = {}
     vehicle_types = {}
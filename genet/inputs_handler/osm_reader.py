@@ -1,14 +1,20 @@
 import yaml
 import logging
 import osmread
+import numpy as np
+from array import array
 from pyproj import Transformer
 from math import ceil
 
 import genet.inputs_handler.osmnx_customised as osmnx_customised
+import genet.inputs_handler.pbf_reader as pbf_reader
 import genet.utils.parallel as parallel
 import genet.utils.spatial as spatial
 from genet.outputs_handler.matsim_xml_values import MATSIM_JOSM_DEFAULTS
 
+# number of OSM nodes read before discarding those not needed for the graph
+OSM_NODES_CHUNKSIZE = 10 ** 6
+
 
 class Config(object):
     def __init__(self, path):
@@ -78,29 +84,27 @@ def find_matsim_link_values(edge_data, config):
 
 
 def generate_osm_graph_edges_from_file(osm_file, config, num_processes):
+    """
+    Reads OSM file in two passes: the first one reads ways which are assigned modes (see `read_osm_paths`), the
+    second one reads the nodes of those ways only (see `read_osm_nodes`). Blocks of .osm.pbf files are decoded in
+    parallel (see genet.inputs_handler.pbf_reader)
+    :param osm_file: path to .osm or .osm.pbf file
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :param num_processes: number of processes to split the decoding of .osm.pbf files and creation of edges across
+    :return: nodes {osm_node_id: {osmid, x, y, s2id, ...}}, edges [((u, v), {osmid, modes, ...})]
+    """
     logging.info("Building OSM graph from file {}".format(osm_file))
-    response_jsons = file_converter(osm_file)
-    nodes, edges = create_s2_indexed_osm_graph(response_jsons, config, num_processes, bidirectional=False)
-    logging.info('Created OSM edges')
-    return nodes, edges
-
-
-def create_s2_indexed_osm_graph(response_jsons, config, num_processes, bidirectional):
-    logging.info('Creating networkx graph from OSM data')
-
-    elements = []
-    for response_json in response_jsons:
-        elements.extend(response_json['elements'])
-
-    logging.info('OSM: Extract Nodes and Paths from OSM data')
-    nodes = {}
-    paths = {}
-    for osm_data in response_jsons:
-        nodes_temp, paths_temp = osmnx_customised.parse_osm_nodes_paths(osm_data, config)
-        for key, value in nodes_temp.items():
-            nodes[key] = value
-        for key, value in paths_temp.items():
-            paths[key] = value
+    if pbf_reader.is_pbf(osm_file):
+        logging.info('OSM: Extract Paths from OSM PBF data')
+        paths, node_ids, node_blocks = pbf_reader.read_pbf_paths(osm_file, config, processes=num_processes)
+        logging.info('OSM: Extract Nodes of the Paths from OSM PBF data')
+        nodes = build_nodes(*pbf_reader.read_pbf_nodes(
+            osm_file, node_ids, config, blocks=node_blocks, processes=num_processes))
+    else:
+        logging.info('OSM: Extract Paths from OSM data')
+        paths, node_ids, _ = read_osm_paths(osm_file, config)
+        logging.info('OSM: Extract Nodes of the Paths from OSM data')
+        nodes = read_osm_nodes(osm_file, node_ids, config)
 
     logging.info('OSM: Add each OSM way (aka, path) to the OSM graph')
     edges = parallel.multiprocess_wrap(
@@ -110,16 +114,106 @@ def create_s2_indexed_osm_graph(response_jsons, config, num_processes, bidirecti
         combine=parallel.combine_list,
         processes=num_processes,
         config=config,
-        bidirectional=bidirectional)
-
+        bidirectional=False)
+    logging.info('Created OSM edges')
     return nodes, edges
 
 
+def read_osm_paths(osm_file, config, relations=False):
+    """
+    First pass over OSM file. Streams through the file and keeps the ways which are assigned modes by the config's
+    MODE_INDICATORS, nodes are not kept.
+    :param osm_file: path to .osm or .osm.pbf file
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :param relations: if True, reads relations as well, they are skipped otherwise
+    :return: paths {osm_way_id: path, see osmnx_customised.get_path}, sorted numpy array of unique ids of nodes the
+        paths go through, list of relations (empty unless `relations`)
+    """
+    paths = {}
+    node_refs = array('q')
+    osm_relations = []
+    for entity in osmread.parse_file(osm_file):
+        if isinstance(entity, osmread.Way):
+            path = osmnx_customised.get_path(read_way(entity), config)
+            if path['modes']:
+                paths[entity.id] = path
+                node_refs.extend(path['nodes'])
+        elif relations and isinstance(entity, osmread.Relation):
+            osm_relations.append(read_relation(entity))
+    return paths, np.unique(np.array(node_refs, dtype=np.int64)), osm_relations
+
+
+def read_osm_nodes(osm_file, node_ids, config, chunksize=OSM_NODES_CHUNKSIZE):
+    """
+    Second pass over OSM file. Streams through the file and keeps ids and coordinates of the given nodes, in compact
+    arrays, discarding other nodes every `chunksize` nodes.
+    :param osm_file: path to .osm or .osm.pbf file
+    :param node_ids: sorted numpy array of ids of nodes to keep, see `read_osm_paths`
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :param chunksize: number of nodes read before discarding the ones not needed
+    :return: nodes {osm_node_id: {osmid, x, y, useful node tags, s2id}}
+    """
+    kept_ids, kept_lons, kept_lats = [], [], []
+    kept_tags = {}
+    ids, lons, lats = array('q'), array('d'), array('d')
+    tags = {}
+
+    def discard_nodes_not_needed():
+        _ids = np.array(ids, dtype=np.int64)
+        mask = np.isin(_ids, node_ids, assume_unique=False)
+        kept_ids.append(_ids[mask])
+        kept_lons.append(np.array(lons, dtype=np.float64)[mask])
+        kept_lats.append(np.array(lats, dtype=np.float64)[mask])
+        if tags:
+            tagged_ids = np.array(list(tags), dtype=np.int64)
+            for node_id in tagged_ids[np.isin(tagged_ids, node_ids)].tolist():
+                kept_tags[node_id] = tags[node_id]
+
+    for entity in osmread.parse_file(osm_file):
+        if isinstance(entity, osmread.Node):
+            ids.append(entity.id)
+            lons.append(entity.lon)
+            lats.append(entity.lat)
+            useful_tags = {tag: entity.tags[tag] for tag in config.USEFUL_TAGS_NODE if tag in entity.tags}
+            if useful_tags:
+                tags[entity.id] = useful_tags
+            if len(ids) >= chunksize:
+                discard_nodes_not_needed()
+                ids, lons, lats = array('q'), array('d'), array('d')
+                tags = {}
+    discard_nodes_not_needed()
+
+    return build_nodes(
+        np.concatenate(kept_ids), np.concatenate(kept_lons), np.concatenate(kept_lats), kept_tags)
+
+
+def build_nodes(ids, lons, lats, tags):
+    """
+    Builds nodes dictionary from arrays of node ids and coordinates
+    :param ids: numpy array of osm node ids
+    :param lons: numpy array of longitudes of the nodes
+    :param lats: numpy array of latitudes of the nodes
+    :param tags: {osm_node_id: {tag: value}} of USEFUL_TAGS_NODE
+    :return: nodes {osm_node_id: {osmid, x, y, useful node tags, s2id}}
+    """
+    nodes = {}
+    if len(ids):
+        s2_ids = spatial.generate_indices_s2(lats, lons).tolist()
+        for node_id, x, y, s2_id in zip(ids.tolist(), lons.tolist(), lats.tolist(), s2_ids):
+            node = {'osmid': node_id, 'x': x, 'y': y}
+            node.update(tags.get(node_id, {}))
+            node['s2id'] = s2_id
+            nodes[node_id] = node
+    return nodes
+
+
 def generate_graph_nodes(nodes, epsg):
     input_to_output_transformer = Transformer.from_crs('epsg:4326', epsg, always_xy=True)
     nodes_and_attributes = {}
-    for node_id, attribs in nodes.items():
-        x, y = spatial.change_proj(attribs['x'], attribs['y'], input_to_output_transformer)
+    xs, ys = spatial.change_proj_arrays(
+        [attribs['x'] for attribs in nodes.values()], [attribs['y'] for attribs in nodes.values()],
+        input_to_output_transformer)
+    for (node_id, attribs), x, y in zip(nodes.items(), xs, ys):
         nodes_and_attributes[str(node_id)] = {
             'id': str(node_id),
             'x': x,
@@ -131,8 +225,39 @@ def generate_graph_nodes(nodes, epsg):
     return nodes_and_attributes
 
 
+def matsim_link_values_key(edge_data):
+    """
+    Key to a lookup table of MATSim link values found by `find_matsim_link_values`, which only depend on the edge's
+    highway tag, or the last of its other tags with MATSim defaults, and its modes
+    :param edge_data: OSM edge attributes, with modes
+    :return: hashable key
+    """
+    if 'highway' in edge_data:
+        tag = ('highway', edge_data['highway'])
+    else:
+        tag = None
+        for key in edge_data.keys():
+            if key in MATSIM_JOSM_DEFAULTS:
+                tag = key
+    return tag, tuple(edge_data['modes'])
+
+
+def _permlanes(lanes):
+    try:
+        return ceil(float(lanes)), None
+    except Exception as e:
+        return None, e
+
+
 def generate_graph_edges(edges, reindexing_dict, nodes_and_attributes, config_path):
+    config = Config(config_path)
+    # lookup tables, filled in once for each combination of OSM tags met
+    matsim_link_values = {}
+    lanes_to_permlanes = {}
+
     edges_attributes = []
+    permlanes = []
+    capacities = []
     for edge, attribs in edges:
         u, v = str(edge[0]), str(edge[1])
         if u in reindexing_dict:
@@ -140,16 +265,23 @@ def generate_graph_edges(edges, reindexing_dict, nodes_and_attributes, config_pa
         if v in reindexing_dict:
             v = reindexing_dict[v]
 
-        link_attributes = find_matsim_link_values(attribs, Config(config_path)).copy()
+        values_key = matsim_link_values_key(attribs)
+        if values_key not in matsim_link_values:
+            matsim_link_values[values_key] = find_matsim_link_values(attribs, config)
+        link_attributes = matsim_link_values[values_key].copy()
         if 'lanes' in attribs:
-            try:
+            lanes = attribs['lanes']
+            if lanes not in lanes_to_permlanes:
+                lanes_to_permlanes[lanes] = _permlanes(lanes)
+            lanes_permlanes, e = lanes_to_permlanes[lanes]
+            if e is None:
                 # overwrite the default matsim josm values
-                link_attributes['permlanes'] = ceil(float(attribs['lanes']))
-            except Exception as e:
+                link_attributes['permlanes'] = lanes_permlanes
+            else:
                 logging.warning(f'Reading lanes from OSM resulted in {type(e)} with message "{e}".'
                                 f'Found at edge {edge}. Defaulting to permlanes={link_attributes["permlanes"]}')
-        # compute link-wide capacity
-        link_attributes['capacity'] = link_attributes['permlanes'] * link_attributes['capacity']
+        permlanes.append(link_attributes['permlanes'])
+        capacities.append(link_attributes['capacity'])
 
         link_attributes['oneway'] = '1'
         link_attributes['modes'] = attribs['modes']
@@ -157,8 +289,8 @@ def generate_graph_edges(edges, reindexing_dict, nodes_and_attributes, config_pa
         link_attributes['to'] = v
         link_attributes['s2_from'] = nodes_and_attributes[u]['s2_id']
         link_attributes['s2_to'] = nodes_and_attributes[v]['s2_id']
-        link_attributes['length'] = spatial.distance_between_s2cellids(
-            link_attributes['s2_from'], link_attributes['s2_to'])
+        # computed for all edges at once below
+        link_attributes['length'] = None
         # the rest of the keys are osm attributes
         link_attributes['attributes'] = {}
         for key, val in attribs.items():
@@ -169,22 +301,18 @@ def generate_graph_edges(edges, reindexing_dict, nodes_and_attributes, config_pa
                     'text': str(val),
                 }
         edges_attributes.append(link_attributes)
+    if edges_attributes:
+        # compute link-wide capacity
+        capacities = (np.array(permlanes, dtype=np.float64) * np.array(capacities, dtype=np.float64)).tolist()
+        lengths = spatial.distances_between_s2cellids(
+            [link_attributes['s2_from'] for link_attributes in edges_attributes],
+            [link_attributes['s2_to'] for link_attributes in edges_attributes]).tolist()
+        for link_attributes, capacity, length in zip(edges_attributes, capacities, lengths):
+            link_attributes['capacity'] = capacity
+            link_attributes['length'] = length
     return edges_attributes
 
 
-def read_node(entity):
-    json_data = {'type': 'node',
-                 'id': entity.id,
-                 'version': entity.version,
-                 'timestamp': entity.timestamp,
-                 'uid': entity.uid,
-                 'tags': entity.tags,
-                 'lon': entity.lon,
-                 'lat': entity.lat
-                 }
-    return json_data
-
-
 def read_way(entity):
     json_data = {'type': 'way',
                  'id': entity.id,
@@ -207,25 +335,3 @@ def read_relation(entity):
                  'members': entity.members
                  }
     return json_data
-
-
-def file_converter(osm_file):
-    elements = []
-
-    # Extract the nodes and the ways
-    for entity in osmread.parse_file(osm_file):
-        json_data = {}
-
-        if isinstance(entity, osmread.Node):
-            json_data = read_node(entity)
-
-        elif isinstance(entity, osmread.Way):
-            json_data = read_way(entity)
-
-        elif isinstance(entity, osmread.Relation):
-            json_data = read_relation(entity)
-
-        elements.append(json_data)
-
-    # response_jsons
-    return [{'elements': elements}]
@@ -1,70 +1,10 @@
 from itertools import groupby
-import genet.utils.spatial as spatial
 import genet.inputs_handler.osm_reader as osm_reader
 
 
 # rip and monkey patch of a few functions from osmnx.core to customise the tags being saved to the graph
 
 
-def parse_osm_nodes_paths(osm_data, config):
-    """
-    function from osmnx, adding our own spin on this - need extra tags
-
-    Construct dicts of nodes and paths with key=osmid and value=dict of
-    attributes.
-
-    Parameters
-    ----------
-    osm_data : dict
-        JSON response from from the Overpass API
-
-    Returns
-    -------
-    nodes, paths : tuple
-    """
-
-    nodes = {}
-    paths = {}
-    for element in osm_data['elements']:
-        if element['type'] == 'node':
-            key = element['id']
-            nodes[key] = get_node(element, config)
-        elif element['type'] == 'way':  # osm calls network paths 'ways'
-            key = element['id']
-            path = get_path(element, config)
-            if path['modes']:
-                # only proceed with edges that have found a mode (that's why it's important to define them in
-                # MODE_INDICATORS in the config
-                paths[key] = path
-
-    return nodes, paths
-
-
-def get_node(element, config):
-    """
-    Convert an OSM node element into the format for a networkx node.
-
-    Parameters
-    ----------
-    element : dict
-        an OSM node element
-
-    Returns
-    -------
-    dict
-    """
-
-    node = {}
-    node['osmid'] = element['id']
-    node['s2id'] = spatial.generate_index_s2(lat=element['lat'], lng=element['lon'])
-    node['x'], node['y'] = element['lon'], element['lat']
-    if 'tags' in element:
-        for useful_tag in config.USEFUL_TAGS_NODE:
-            if useful_tag in element['tags']:
-                node[useful_tag] = element['tags'][useful_tag]
-    return node
-
-
 def get_path(element, config):
     """
     function from osmnx, adding our own spin on this - need extra tags
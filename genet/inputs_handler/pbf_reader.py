@@ -0,0 +1,242 @@
+import logging
+import zlib
+from struct import unpack
+
+import numpy as np
+from osmread.parser.pbf import PBFException, PBFNotImplemented
+from osmread.protobuf.fileformat_pb2 import BlobHeader, Blob
+from osmread.protobuf.osmformat_pb2 import HeaderBlock, PrimitiveBlock
+
+import genet.inputs_handler.osmnx_customised as osmnx_customised
+import genet.utils.parallel as parallel
+
+SUPPORTED_FEATURES = {'OsmSchema-V0.6', 'DenseNodes'}
+
+
+def is_pbf(path):
+    return path.lower().endswith('.pbf')
+
+
+def read_blob_data(fp, datasize):
+    blob = Blob()
+    blob.ParseFromString(fp.read(datasize))
+    if len(blob.raw) > 0:
+        return blob.raw
+    elif len(blob.zlib_data) > 0:
+        return zlib.decompress(blob.zlib_data)
+    else:
+        raise PBFNotImplemented('Unsupported data type!')
+
+
+def read_blocks(osm_file):
+    """
+    Splits OSM PBF file into its fileblocks, which can be decoded independently of each other. Only the small
+    headers of the blocks are read.
+    :param osm_file: path to .osm.pbf file
+    :return: list of (offset, size) of the data blocks, in the order they appear in the file
+    """
+    blocks = []
+    with open(osm_file, 'rb') as fp:
+        while True:
+            buf = fp.read(4)
+            if len(buf) == 0:
+                break
+            elif len(buf) != 4:
+                raise PBFException('Invalid header len!')
+            blob_header = BlobHeader()
+            blob_header.ParseFromString(fp.read(unpack('!L', buf)[0]))
+            if blob_header.type == 'OSMHeader':
+                header_block = HeaderBlock()
+                header_block.ParseFromString(read_blob_data(fp, blob_header.datasize))
+                for feature in header_block.required_features:
+                    if feature not in SUPPORTED_FEATURES:
+                        raise PBFNotImplemented(f'Required feature {feature} not implemented!')
+            elif blob_header.type == 'OSMData':
+                blocks.append((fp.tell(), blob_header.datasize))
+                fp.seek(blob_header.datasize, 1)
+            else:
+                raise PBFException('Invalid header type!')
+    return blocks
+
+
+def read_block(osm_file, block):
+    """
+    Decodes a single data block of OSM PBF file
+    :param osm_file: path to .osm.pbf file
+    :param block: (offset, size) of the block, see `read_blocks`
+    :return: osmformat_pb2.PrimitiveBlock
+    """
+    offset, size = block
+    with open(osm_file, 'rb') as fp:
+        fp.seek(offset)
+        primitive_block = PrimitiveBlock()
+        primitive_block.ParseFromString(read_blob_data(fp, size))
+    return primitive_block
+
+
+def _tags(element, strings):
+    return {strings[k]: strings[v] for k, v in zip(element.keys, element.vals)}
+
+
+def read_blocks_paths(blocks, osm_file, config):
+    """
+    Reads ways which are assigned modes by the config's MODE_INDICATORS from data blocks of OSM PBF file
+    :param blocks: list of (offset, size) of data blocks, see `read_blocks`
+    :param osm_file: path to .osm.pbf file
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :return: list of (block, paths, has_nodes) for each of the blocks, paths is a list of (osm_way_id, path), see
+        osmnx_customised.get_path, has_nodes says whether the block holds any nodes
+    """
+    results = []
+    for block in blocks:
+        primitive_block = read_block(osm_file, block)
+        strings = [s.decode('utf-8') for s in primitive_block.stringtable.s]
+        paths = []
+        has_nodes = False
+        for group in primitive_block.primitivegroup:
+            if len(group.nodes) > 0 or len(group.dense.id) > 0:
+                has_nodes = True
+            for way in group.ways:
+                element = {'id': way.id, 'tags': _tags(way, strings), 'nodes': np.cumsum(way.refs).tolist()}
+                path = osmnx_customised.get_path(element, config)
+                if path['modes']:
+                    paths.append((way.id, path))
+        results.append((block, paths, has_nodes))
+    return results
+
+
+def _coordinates(values, granularity, offset):
+    return (values * granularity + offset).astype(np.float64) / 1000000000
+
+
+def _dense_nodes_tags(dense, strings, useful_tags):
+    """
+    :return: {position of node in the dense group: {tag: value}} for tags in `useful_tags`
+    """
+    keys_vals = np.array(dense.keys_vals, dtype=np.int64)
+    if not len(keys_vals):
+        return {}
+    useful_keys = np.flatnonzero(np.isin(np.array(strings, dtype=object), useful_tags))
+    if not len(useful_keys):
+        return {}
+    # keys_vals holds (key, value) string indices of each node's tags in turn, nodes are delimited with 0
+    delimiters = np.flatnonzero(keys_vals == 0)
+    node_index = np.searchsorted(delimiters, np.arange(len(keys_vals)))
+    node_start = np.append(0, delimiters + 1)[node_index]
+    is_key = ((np.arange(len(keys_vals)) - node_start) % 2 == 0) & (keys_vals != 0)
+    positions = np.flatnonzero(is_key & np.isin(keys_vals, useful_keys))
+    tags = {}
+    for position, i in zip(positions.tolist(), node_index[positions].tolist()):
+        tags.setdefault(i, {})[strings[keys_vals[position]]] = strings[keys_vals[position + 1]]
+    return tags
+
+
+def read_blocks_nodes(blocks, osm_file, node_ids, config):
+    """
+    Reads ids and coordinates of the given nodes from data blocks of OSM PBF file
+    :param blocks: list of (offset, size) of data blocks, see `read_blocks`
+    :param osm_file: path to .osm.pbf file
+    :param node_ids: sorted numpy array of ids of nodes to keep
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :return: list of (ids, lons, lats, tags) for each group of nodes in the blocks: numpy arrays of ids and
+        coordinates of the kept nodes, and their tags {osm_node_id: {tag: value}} of config's USEFUL_TAGS_NODE
+    """
+    useful_tags = list(config.USEFUL_TAGS_NODE)
+    results = []
+    for block in blocks:
+        primitive_block = read_block(osm_file, block)
+        strings = [s.decode('utf-8') for s in primitive_block.stringtable.s]
+        granularity = primitive_block.granularity
+        lon_offset = primitive_block.lon_offset
+        lat_offset = primitive_block.lat_offset
+        for group in primitive_block.primitivegroup:
+            if len(group.dense.id) > 0:
+                dense = group.dense
+                ids = np.cumsum(np.array(dense.id, dtype=np.int64))
+                lons = _coordinates(np.cumsum(np.array(dense.lon, dtype=np.int64)), granularity, lon_offset)
+                lats = _coordinates(np.cumsum(np.array(dense.lat, dtype=np.int64)), granularity, lat_offset)
+                tags = _dense_nodes_tags(dense, strings, useful_tags)
+            elif len(group.nodes) > 0:
+                ids = np.array([node.id for node in group.nodes], dtype=np.int64)
+                lons = _coordinates(np.array([node.lon for node in group.nodes], dtype=np.int64), granularity,
+                                    lon_offset)
+                lats = _coordinates(np.array([node.lat for node in group.nodes], dtype=np.int64), granularity,
+                                    lat_offset)
+                tags = {}
+                for i, node in enumerate(group.nodes):
+                    node_tags = {k: v for k, v in _tags(node, strings).items() if k in useful_tags}
+                    if node_tags:
+                        tags[i] = node_tags
+            else:
+                continue
+            mask = np.isin(ids, node_ids)
+            results.append((ids[mask], lons[mask], lats[mask],
+                            {int(ids[i]): node_tags for i, node_tags in tags.items() if mask[i]}))
+    return results
+
+
+def read_pbf_paths(osm_file, config, processes=1):
+    """
+    First pass over OSM PBF file, its data blocks are decoded in parallel. Keeps the ways which are assigned modes
+    by the config's MODE_INDICATORS, relations are skipped.
+    :param osm_file: path to .osm.pbf file
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :param processes: number of processes to decode the blocks with
+    :return: paths {osm_way_id: path}, sorted numpy array of unique ids of nodes the paths go through, list of data
+        blocks holding nodes
+    """
+    blocks = read_blocks(osm_file)
+    logging.info(f'Decoding {len(blocks)} OSM PBF blocks for paths')
+    results = parallel.multiprocess_wrap(
+        data=blocks,
+        split=parallel.split_list,
+        apply=read_blocks_paths,
+        combine=parallel.combine_list,
+        processes=processes,
+        osm_file=osm_file,
+        config=config
+    )
+    paths = {}
+    node_blocks = []
+    for block, block_paths, has_nodes in results:
+        paths.update(block_paths)
+        if has_nodes:
+            node_blocks.append(block)
+    node_ids = np.unique(np.fromiter(
+        (node for path in paths.values() for node in path['nodes']), dtype=np.int64))
+    return paths, node_ids, node_blocks
+
+
+def read_pbf_nodes(osm_file, node_ids, config, blocks=None, processes=1):
+    """
+    Second pass over OSM PBF file, its data blocks are decoded in parallel. Keeps ids and coordinates of the given
+    nodes, in compact arrays.
+    :param osm_file: path to .osm.pbf file
+    :param node_ids: sorted numpy array of ids of nodes to keep, see `read_pbf_paths`
+    :param config: genet.inputs_handler.osm_reader.Config object
+    :param blocks: optional, data blocks to read, e.g. those holding nodes, as given by `read_pbf_paths`. All data
+        blocks of the file are read by default
+    :param processes: number of processes to decode the blocks with
+    :return: ids, lons, lats numpy arrays of the kept nodes in the order they appear in the file, and tags
+        {osm_node_id: {tag: value}} of config's USEFUL_TAGS_NODE
+    """
+    if blocks is None:
+        blocks = read_blocks(osm_file)
+    logging.info(f'Decoding {len(blocks)} OSM PBF blocks for nodes')
+    results = parallel.multiprocess_wrap(
+        data=blocks,
+        split=parallel.split_list,
+        apply=read_blocks_nodes,
+        combine=parallel.combine_list,
+        processes=processes,
+        osm_file=osm_file,
+        node_ids=node_ids,
+        config=config
+    )
+    tags = {}
+    for _, _, _, block_tags in results:
+        tags.update(block_tags)
+    if not results:
+        return np.array([], dtype=np.int64), np.array([]), np.array([]), tags
+    return (np.concatenate([ids for ids, _, _, _ in results]), np.concatenate([lons for _, lons, _, _ in results]),
+            np.concatenate([lats for _, _, lats, _ in results]), tags)
@@ -74,13 +74,13 @@ def read_matsim_schedule(path_to_schedule: str, epsg: str, path_to_vehicles: str
     :param epsg: projection for the schedule, e.g. 'epsg:27700'
     :return: genet.Schedule object
     """
-    services, minimal_transfer_times = matsim_reader.read_schedule(path_to_schedule, epsg)
+    schedule_graph, minimal_transfer_times = matsim_reader.read_schedule_to_schedule_graph(path_to_schedule, epsg)
     if path_to_vehicles:
         vehicles, vehicle_types = matsim_reader.read_vehicles(path_to_vehicles)
         matsim_schedule = schedule_elements.Schedule(
-            services=services, epsg=epsg, vehicles=vehicles, vehicle_types=vehicle_types)
+            _graph=schedule_graph, epsg=epsg, vehicles=vehicles, vehicle_types=vehicle_types)
     else:
-        matsim_schedule = schedule_elements.Schedule(services=services, epsg=epsg)
+        matsim_schedule = schedule_elements.Schedule(_graph=schedule_graph, epsg=epsg)
     matsim_schedule.minimal_transfer_times = minimal_transfer_times
     return matsim_schedule
 
@@ -174,12 +174,16 @@ def read_json_schedule(schedule_path: str, epsg: str):
     with open(schedule_path) as json_file:
         json_data = json.load(json_file)
 
+    # each stop is created once and shared by the routes using it
+    stops = {}
     for service_id, service_data in json_data['schedule']['services'].items():
         routes = []
         for route_id, route_data in service_data['routes'].items():
-            stops = route_data.pop('ordered_stops')
-            route_data['stops'] = [schedule_elements.Stop(**json_data['schedule']['stops'][stop], epsg=epsg) for stop in
-                                   stops]
+            ordered_stops = route_data.pop('ordered_stops')
+            for stop in ordered_stops:
+                if stop not in stops:
+                    stops[stop] = schedule_elements.Stop(**json_data['schedule']['stops'][stop], epsg=epsg)
+            route_data['stops'] = [stops[stop] for stop in ordered_stops]
             routes.append(schedule_elements.Route(**route_data))
         service_data['routes'] = routes
 
@@ -288,6 +292,28 @@ def read_gtfs(path, day, epsg=None):
     return s
 
 
+def read_gtfs_days(path, days, epsg=None, num_processes: int = 1):
+    """
+    Reads from GTFS, Schedules for several days. The feed is read once and the Schedules are built from the shared
+    tables. The resulting services will not have network routes. Assumed to be in lat lon epsg:4326.
+    :param path: to GTFS folder or a zip file
+    :param days: list of 'YYYYMMDD' days to use from the gtfs
+    :param epsg: projection for the output Schedules, e.g. 'epsg:27700'. If not provided, the Schedules remain in
+        epsg:4326
+    :param num_processes: number of processes to build the Schedules of the days with
+    :return: {day: Schedule}
+    """
+    logging.info(f'Reading GTFS from {path} for days: {days}')
+    schedule_graphs = gtfs_reader.read_gtfs_to_schedule_graphs(path, days, processes=num_processes)
+    schedules = {}
+    for day, schedule_graph in schedule_graphs.items():
+        s = schedule_elements.Schedule(epsg='epsg:4326', _graph=schedule_graph)
+        if epsg is not None:
+            s.reproject(new_epsg=epsg)
+        schedules[day] = s
+    return schedules
+
+
 def read_osm(osm_file_path, osm_read_config, num_processes: int = 1, epsg=None):
     """
     Reads OSM data into a graph of the Network object
@@ -1,10 +1,140 @@
+import gzip
+import json
+import logging
+import math
+import shutil
 import pandas as pd
 import dictdiffer
 from datetime import datetime
+from itertools import chain
+from types import MappingProxyType
 from typing import Union, List
+from genet.utils.dict_support import copy_containers
 
+COLUMNS = ['timestamp', 'change_event', 'object_type', 'old_id', 'new_id', 'old_attributes', 'new_attributes', 'diff']
+LEVELS = ['off', 'summary', 'ids_only', 'full']
 
-class ChangeLog(pd.DataFrame):
+
+class _Deferred:
+    # copies and pickles of events keep pointing at the same marker
+    def __reduce__(self):
+        return '_DEFERRED'
+
+
+# marks events whose diff is yet to be computed
+_DEFERRED = _Deferred()
+
+
+def _snapshot(attributes):
+    # nested lists, sets and dictionaries are copied too, so that changing them in place later leaves the event as it
+    # was recorded
+    return copy_containers(attributes) if isinstance(attributes, (dict, MappingProxyType)) else attributes
+
+
+def _str_or_none(attributes):
+    return None if attributes is None else str(attributes)
+
+
+def _as_text(value):
+    # the text written for the value in CSV by pandas.DataFrame.to_csv, None for empty values
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+
+def _same_value(old_attributes: dict, new_attributes: dict, key) -> bool:
+    if (key not in old_attributes) or (key not in new_attributes):
+        return False
+    old_value, new_value = old_attributes[key], new_attributes[key]
+    if old_value is new_value:
+        return True
+    try:
+        return bool(old_value == new_value)
+    except (ValueError, TypeError):
+        return False
+
+
+class ChangeLogSink:
+    """
+    Appends change log events to a file on disk, so that they do not need to be held in memory. The format of the
+    file follows its extension: CSV (the same as ChangeLog.export) for '.csv' or '.csv.gz', JSON lines for '.jsonl' or
+    '.jsonl.gz'. Files ending with '.gz' are gzip compressed. The file is overwritten when the first events are
+    written to it.
+
+    Values are written as the text ChangeLog.export writes for them, e.g. ids as strings, so that exporting the events
+    from the file gives the same CSV as exporting them from memory.
+
+    Parameters
+    ----------
+    :param path: path to the file
+    :param buffer_size: number of events the change log holds in memory before writing them to the file
+    """
+
+    def __init__(self, path: str, buffer_size: int = 10000):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.number_of_events = 0
+        self.json_lines = path.endswith('.jsonl') or path.endswith('.jsonl.gz')
+        self.compressed = path.endswith('.gz')
+
+    def _open(self):
+        mode = 'at' if self.number_of_events else 'wt'
+        if self.compressed:
+            return gzip.open(self.path, mode, encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def write(self, events: List[tuple]):
+        """
+        Appends events to the file
+        :param events: list of change log events, with values for each of the change log's columns
+        :return:
+        """
+        if not events:
+            return
+        with self._open() as f:
+            if self.json_lines:
+                for event in events:
+                    f.write(json.dumps(dict(zip(COLUMNS, map(_as_text, event)))) + '\n')
+            else:
+                df = pd.DataFrame.from_records(events, columns=COLUMNS)
+                df.index += self.number_of_events
+                df.to_csv(f, header=not self.number_of_events)
+        self.number_of_events += len(events)
+
+    def read(self, chunksize: int = None):
+        """
+        :param chunksize: optional, number of events in each pandas.DataFrame
+        :return: pandas.DataFrame of the events in the file, or an iterator of such DataFrames if chunksize is given.
+            Values are strings, as written to the file, or NaN/None if empty
+        """
+        if self.json_lines:
+            return pd.read_json(self.path, lines=True, chunksize=chunksize, dtype=False, convert_dates=False)
+        return pd.read_csv(self.path, index_col=0, chunksize=chunksize, dtype={column: str for column in COLUMNS},
+                           keep_default_na=False, na_values=[''])
+
+    def export(self, path: str, chunksize: int = 100000):
+        """
+        Writes the events in the file to a CSV file at `path`. CSV files are copied as they are, JSON lines files are
+        converted in chunks
+        :param path: path to the CSV file
+        :param chunksize: number of events held in memory at a time, for JSON lines files
+        :return:
+        """
+        if not self.number_of_events:
+            pd.DataFrame(columns=COLUMNS).to_csv(path)
+            return
+        if not self.json_lines:
+            with (gzip.open(self.path, 'rb') if self.compressed else open(self.path, 'rb')) as f_in, \
+                    open(path, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            return
+        mode = 'w'
+        for chunk in self.read(chunksize=chunksize):
+            chunk.to_csv(path, mode=mode, header=(mode == 'w'))
+            mode = 'a'
+
+
+class ChangeLog:
     """
     Records changes in genet.core.Network into a pandas.DataFrame
 
@@ -12,65 +142,176 @@ class ChangeLog(pd.DataFrame):
     • Add :
     • Modify :
     • Remove :
+
+    Events are appended to a list and only turned into a pandas.DataFrame when the log is queried, e.g. `log.loc[0]`,
+    `log['diff']` or `log.to_dataframe()`, or exported. Any pandas.DataFrame attribute or method can be used on the
+    log and is applied to that DataFrame, which is a snapshot of the log: changing it does not change the log.
+
+    Until then, events hold copies of the attribute dictionaries they were given, including the lists, sets and
+    dictionaries nested in them, the string forms of the attributes and their diffs are computed only when the
+    DataFrame is built.
+
+    How much is recorded depends on the level of the log:
+    • 'full': all of the columns of the log, default
+    • 'ids_only': the timestamp, types of change and object and the ids, without the attributes or their diff
+    • 'summary': only the number of events of each type of change and object, see `summary`
+    • 'off': nothing
+
+    Parameters
+    ----------
+    :param df: optional, pandas.DataFrame with the log's columns to start the log with
+    :param changed_keys_only: if True, modify events record only the attributes which have changed, rather than the
+        full attribute dictionaries. The diffs are the same either way
+    :param level: 'off', 'summary', 'ids_only' or 'full'
+    :param sink: optional, ChangeLogSink, or path to a file, to write the events to rather than holding all of them
+        in memory, see ChangeLogSink
     """
 
-    def __init__(self, df=None):
-        if df is None:
-            super().__init__(
-                columns=['timestamp', 'change_event', 'object_type', 'old_id', 'new_id', 'old_attributes',
-                         'new_attributes', 'diff'])
-        else:
-            super().__init__(df)
+    def __init__(self, df=None, changed_keys_only: bool = False, level: str = 'full',
+                 sink: Union[ChangeLogSink, str] = None):
+        self.changed_keys_only = changed_keys_only
+        self.level = None
+        self.sink = None
+        self._events = []
+        self._number_of_built_events = 0
+        self._frame = None
+        self._counts = {}
+        if df is not None:
+            self._events = list(pd.DataFrame(df).reindex(columns=COLUMNS).itertuples(index=False, name=None))
+            self._number_of_built_events = len(self._events)
+            for event in self._events:
+                self._count(event[1], event[2], 1)
+        self.set_level(level, sink=sink)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __getitem__(self, key):
+        return self.to_dataframe()[key]
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the log itself
+        if name.startswith('_'):
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+        return getattr(self.to_dataframe(), name)
+
+    def __iter__(self):
+        return iter(COLUMNS)
+
+    def __repr__(self):
+        return repr(self.to_dataframe())
+
+    def _repr_html_(self):
+        return self.to_dataframe()._repr_html_()
 
-    def _next_index(self):
-        idx = self.index.max() + 1
-        if str(idx) == 'nan':
-            idx = 0
-        return idx
+    @property
+    def empty(self):
+        return not self._events
+
+    def set_level(self, level: str, sink: Union[ChangeLogSink, str] = None):
+        """
+        Changes what is recorded in the log from now on, events recorded so far are kept
+        :param level: 'off', 'summary', 'ids_only' or 'full', see ChangeLog
+        :param sink: optional, ChangeLogSink, or path to a file, to start writing the events to, see ChangeLogSink.
+            Events held in the log are written to it straight away
+        :return:
+        """
+        if level not in LEVELS:
+            raise ValueError(f'Change log level `{level}` is not recognised, use one of {LEVELS}')
+        self.level = level
+        if sink is not None:
+            self.sink = ChangeLogSink(sink) if isinstance(sink, str) else sink
+            self.flush()
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        :return: pandas.DataFrame with a row for each recorded change event, in the order they were recorded. If the
+            log writes to a sink, only the events not yet written to it are included
+        """
+        if self._number_of_built_events != len(self._events):
+            for i in range(self._number_of_built_events, len(self._events)):
+                self._events[i] = self._build_event(self._events[i])
+            self._number_of_built_events = len(self._events)
+            self._frame = None
+        if self._frame is None:
+            self._frame = pd.DataFrame.from_records(self._events, columns=COLUMNS)
+        return self._frame
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return: pandas.DataFrame with the number of recorded events of each type of change and object
+        """
+        return pd.DataFrame(
+            [(change_event, object_type, count) for (change_event, object_type), count in self._counts.items()],
+            columns=['change_event', 'object_type', 'count'])
+
+    def flush(self):
+        """
+        Writes the events held in the log to its sink, if it has one, and drops them from memory
+        :return:
+        """
+        if (self.sink is not None) and self._events:
+            self.to_dataframe()
+            self.sink.write(self._events)
+            self._events = []
+            self._number_of_built_events = 0
+            self._frame = None
+
+    def _build_event(self, event: tuple) -> tuple:
+        timestamp, change_event, object_type, old_id, new_id, old_attributes, new_attributes, diff = event
+        if diff is _DEFERRED:
+            diff = self.generate_diff(old_id, new_id, old_attributes, new_attributes)
+        return (timestamp, change_event, object_type, old_id, new_id, _str_or_none(old_attributes),
+                _str_or_none(new_attributes), diff)
+
+    def _count(self, change_event, object_type, number_of_events):
+        self._counts[(change_event, object_type)] = self._counts.get((change_event, object_type), 0) + number_of_events
+
+    def _record(self, change_event: str, object_type: str, old_ids: list, new_ids: list, attributes):
+        """
+        :param change_event: e.g. 'add'
+        :param object_type: e.g. 'link'
+        :param old_ids: list of old ids of the objects
+        :param new_ids: list of new ids of the objects, same len as old_ids
+        :param attributes: function returning an iterable of (old_attributes, new_attributes, diff) for each of the
+            objects, only called if the attributes are recorded
+        :return: the log
+        """
+        if self.level == 'off':
+            return self
+        self._count(change_event, object_type, len(new_ids))
+        if self.level == 'summary':
+            return self
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if self.level == 'ids_only':
+            self._events.extend(
+                (timestamp, change_event, object_type, old_id, new_id, None, None, None)
+                for old_id, new_id in zip(old_ids, new_ids))
+        else:
+            self._events.extend(
+                (timestamp, change_event, object_type, old_id, new_id, old_attributes, new_attributes, diff)
+                for old_id, new_id, (old_attributes, new_attributes, diff) in zip(old_ids, new_ids, attributes()))
+        if (self.sink is not None) and (len(self._events) >= self.sink.buffer_size):
+            self.flush()
+        return self
 
     def add(self, object_type: str, object_id: Union[int, str], object_attributes: dict):
-        self.loc[self._next_index()] = pd.Series({
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'change_event': 'add',
-            'object_type': object_type,
-            'old_id': None,
-            'new_id': object_id,
-            'old_attributes': None,
-            'new_attributes': str(object_attributes),
-            'diff': self.generate_diff(None, object_id, None, object_attributes)
-        })
+        self.add_bunch(object_type, [object_id], [object_attributes])
 
     def add_bunch(self, object_type: str, id_bunch: List[Union[int, str]], attributes_bunch: List[dict]):
         """
         :param object_type:
         :param id_bunch: same len as attributes_bunch
         :param attributes_bunch: same len as id_bunch
-        :return:
+        :return: the log, with the events appended
         """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return self.__class__(self.append(pd.DataFrame({
-            'timestamp': [timestamp] * len(id_bunch),
-            'change_event': ['add'] * len(id_bunch),
-            'object_type': [object_type] * len(id_bunch),
-            'old_id': None,
-            'new_id': id_bunch,
-            'old_attributes': None,
-            'new_attributes': [str(d) for d in attributes_bunch],
-            'diff': [self.generate_diff(None, _id, None, attrib) for _id, attrib in zip(id_bunch, attributes_bunch)]
-        }), ignore_index=True))
+        return self._record(
+            'add', object_type, [None] * len(id_bunch), id_bunch,
+            lambda: ((None, _snapshot(attrib), _DEFERRED) for attrib in attributes_bunch))
 
     def modify(self, object_type: str, old_id: Union[int, str], old_attributes: dict, new_id: Union[int, str],
                new_attributes: dict):
-        self.loc[self._next_index()] = pd.Series({
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'change_event': 'modify',
-            'object_type': object_type,
-            'old_id': old_id,
-            'new_id': new_id,
-            'old_attributes': str(old_attributes),
-            'new_attributes': str(new_attributes),
-            'diff': self.generate_diff(old_id, new_id, old_attributes, new_attributes)
-        })
+        self.modify_bunch(object_type, [old_id], [old_attributes], [new_id], [new_attributes])
 
     def modify_bunch(self, object_type: str, old_id_bunch: List[Union[int, str]], old_attributes: List[dict],
                      new_id_bunch: List[Union[int, str]], new_attributes: List[dict]):
@@ -80,21 +321,12 @@ class ChangeLog(pd.DataFrame):
         :param old_attributes: same len as attributes_bunch
         :param new_id_bunch: same len as id_bunch
         :param new_attributes: same len as id_bunch
-        :return:
+        :return: the log, with the events appended
         """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return self.__class__(self.append(pd.DataFrame({
-            'timestamp': [timestamp] * len(old_id_bunch),
-            'change_event': ['modify'] * len(old_id_bunch),
-            'object_type': [object_type] * len(old_id_bunch),
-            'old_id': old_id_bunch,
-            'new_id': new_id_bunch,
-            'old_attributes': [str(d) for d in old_attributes],
-            'new_attributes': [str(d) for d in new_attributes],
-            'diff': [self.generate_diff(old_id, new_id, old_attrib, new_attrib)
-                     for old_id, new_id, old_attrib, new_attrib in
-                     zip(old_id_bunch, new_id_bunch, old_attributes, new_attributes)]
-        }), ignore_index=True))
+        return self._record(
+            'modify', object_type, old_id_bunch, new_id_bunch,
+            lambda: ((*self._modified_attributes(old_attrib, new_attrib), _DEFERRED)
+                     for old_attrib, new_attrib in zip(old_attributes, new_attributes)))
 
     def simplify_bunch(self, old_ids_list_bunch, new_id_bunch, indexed_paths_to_simplify, links_to_add):
         """ Series of ordered lists of indecies and attributes to log simplification of links, data prior to
@@ -104,50 +336,35 @@ class ChangeLog(pd.DataFrame):
         :param indexed_paths_to_simplify: same len as id_bunch
         :param links_to_add: lists of nodes deleted in order e.g. is path_before = [A, B, C, D] and path_after = [A, D]
         path_diff = [B, C], list of those for all links
-        :return:
+        :return: the log, with the events appended
         """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return self.__class__(self.append(pd.DataFrame({
-            'timestamp': [timestamp] * len(new_id_bunch),
-            'change_event': ['simplify'] * len(new_id_bunch),
-            'object_type': ['links'] * len(new_id_bunch),
-            'old_id': old_ids_list_bunch,
-            'new_id': new_id_bunch,
-            'old_attributes': [str(indexed_paths_to_simplify[_id]['link_data']) for _id in new_id_bunch],
-            'new_attributes': [str(links_to_add[_id]) for _id in new_id_bunch],
-            'diff': [str(indexed_paths_to_simplify[_id]['nodes_to_remove']) for _id in new_id_bunch]
-        }), ignore_index=True))
+        return self._record(
+            'simplify', 'links', old_ids_list_bunch, new_id_bunch,
+            lambda: ((_snapshot(indexed_paths_to_simplify[_id]['link_data']), _snapshot(links_to_add[_id]),
+                      str(indexed_paths_to_simplify[_id]['nodes_to_remove'])) for _id in new_id_bunch))
 
     def remove(self, object_type: str, object_id: Union[int, str], object_attributes: dict):
-        self.loc[self._next_index()] = pd.Series({
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'change_event': 'remove',
-            'object_type': object_type,
-            'old_id': object_id,
-            'new_id': None,
-            'old_attributes': str(object_attributes),
-            'new_attributes': None,
-            'diff': self.generate_diff(object_id, None, object_attributes, None)
-        })
+        self.remove_bunch(object_type, [object_id], [object_attributes])
 
     def remove_bunch(self, object_type: str, id_bunch: List[Union[int, str]], attributes_bunch: List[dict]):
         """
         :param object_type:
         :param id_bunch: same len as attributes_bunch
         :param attributes_bunch: same len as id_bunch
-        :return:
+        :return: the log, with the events appended
         """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return self.__class__(self.append(pd.DataFrame({
-            'timestamp': [timestamp] * len(id_bunch),
-            'change_event': ['remove'] * len(id_bunch),
-            'object_type': [object_type] * len(id_bunch),
-            'old_id': id_bunch,
-            'new_id': None,
-            'old_attributes': [str(d) for d in attributes_bunch],
-            'new_attributes': None,
-            'diff': [self.generate_diff(_id, None, attrib, None) for _id, attrib in zip(id_bunch, attributes_bunch)]
-        }), ignore_index=True))
+        return self._record(
+            'remove', object_type, id_bunch, [None] * len(id_bunch),
+            lambda: ((_snapshot(attrib), None, _DEFERRED) for attrib in attributes_bunch))
+
+    def _modified_attributes(self, old_attributes, new_attributes):
+        if self.changed_keys_only and isinstance(old_attributes, (dict, MappingProxyType)) and \
+                isinstance(new_attributes, (dict, MappingProxyType)):
+            changed_keys = {k for k in old_attributes.keys() | new_attributes.keys()
+                            if not _same_value(old_attributes, new_attributes, k)}
+            return ({k: copy_containers(v) for k, v in old_attributes.items() if k in changed_keys},
+                    {k: copy_containers(v) for k, v in new_attributes.items() if k in changed_keys})
+        return _snapshot(old_attributes), _snapshot(new_attributes)
 
     def generate_diff(self, old_id, new_id, old_attributes_dict, new_attributes_dict):
         if old_attributes_dict is None:
@@ -165,8 +382,144 @@ class ChangeLog(pd.DataFrame):
                 diff.append(('change', 'id', (old_id, new_id)))
         return diff
 
-    def merge_logs(self, other):
-        return self.__class__(self.append(other).sort_values(by='timestamp').reset_index(drop=True))
+    def merge_logs(self, *others):
+        """
+        :param others: one or more ChangeLogs
+        :return: new ChangeLog with events of all of the logs, ordered by their timestamps, which records changes in
+            the same way as this log. Events already written to the sinks of the logs are not merged
+        """
+        merged_log = self.__class__(changed_keys_only=self.changed_keys_only, level=self.level)
+        merged_log.sink = self.sink
+        logs = [self] + list(others)
+        merged_log._events = sorted(chain.from_iterable(log._events for log in logs), key=lambda event: event[0])
+        for log in logs:
+            for (change_event, object_type), count in log._counts.items():
+                merged_log._count(change_event, object_type, count)
+        return merged_log
 
     def export(self, path):
-        self.to_csv(path)
+        """
+        Writes the log to a CSV file. If the log writes to a sink, all of the events in the sink are written. If the
+        log is at 'summary' level, the summary of the events is written
+        :param path: path to the CSV file
+        :return:
+        """
+        if self.sink is not None:
+            self.flush()
+            self.sink.export(path)
+        elif self.level == 'summary':
+            self.summary().to_csv(path)
+        else:
+            if self.level == 'off':
+                logging.warning('The change log is turned off, changes made since are not in the exported change log')
+            self.to_dataframe().to_csv(path)
+
+
+class ChangeLogBatch:
+    """
+    Stands in for a ChangeLog while a batch of changes is made, e.g. in `with network.batch():`. Events are collected
+    and recorded in the change log when the batch is done, one bunch for each run of events of the same type.
+    Repeated modifications of the same object are recorded as one, from the attributes the object had before the
+    first modification to its attributes after the last one.
+
+    Querying the batch, e.g. `batch.loc[0]`, records the events collected so far and queries the change log.
+
+    Parameters
+    ----------
+    :param change_log: ChangeLog to record the events in
+    """
+
+    def __init__(self, change_log: ChangeLog):
+        self.change_log = change_log
+        self._runs = []
+        self._modified = {}
+
+    def __len__(self):
+        return len(self.record())
+
+    def __getitem__(self, key):
+        return self.record()[key]
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the batch itself
+        if name.startswith('_'):
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+        return getattr(self.record(), name)
+
+    def __repr__(self):
+        return repr(self.record())
+
+    @property
+    def number_of_events(self):
+        return sum(len(events) for change_event, object_type, events in self._runs)
+
+    def _events(self, change_event: str, object_type: str) -> list:
+        if not self._runs or self._runs[-1][:2] != (change_event, object_type):
+            self._runs.append((change_event, object_type, []))
+        return self._runs[-1][2]
+
+    def add(self, object_type: str, object_id: Union[int, str], object_attributes: dict):
+        if self.change_log.level != 'off':
+            self._modified.pop((object_type, object_id), None)
+            self._events('add', object_type).append((object_id, _snapshot(object_attributes)))
+
+    def add_bunch(self, object_type: str, id_bunch: List[Union[int, str]], attributes_bunch: List[dict]):
+        for object_id, object_attributes in zip(id_bunch, attributes_bunch):
+            self.add(object_type, object_id, object_attributes)
+        return self
+
+    def modify(self, object_type: str, old_id: Union[int, str], old_attributes: dict, new_id: Union[int, str],
+               new_attributes: dict):
+        if self.change_log.level == 'off':
+            return
+        event = self._modified.pop((object_type, old_id), None)
+        if event is None:
+            event = [old_id, _snapshot(old_attributes), new_id, _snapshot(new_attributes)]
+            self._events('modify', object_type).append(event)
+        else:
+            event[2:] = [new_id, _snapshot(new_attributes)]
+        self._modified[(object_type, new_id)] = event
+
+    def modify_bunch(self, object_type: str, old_id_bunch: List[Union[int, str]], old_attributes: List[dict],
+                     new_id_bunch: List[Union[int, str]], new_attributes: List[dict]):
+        for old_id, old_attrib, new_id, new_attrib in zip(old_id_bunch, old_attributes, new_id_bunch, new_attributes):
+            self.modify(object_type, old_id, old_attrib, new_id, new_attrib)
+        return self
+
+    def remove(self, object_type: str, object_id: Union[int, str], object_attributes: dict):
+        if self.change_log.level != 'off':
+            self._modified.pop((object_type, object_id), None)
+            self._events('remove', object_type).append((object_id, _snapshot(object_attributes)))
+
+    def remove_bunch(self, object_type: str, id_bunch: List[Union[int, str]], attributes_bunch: List[dict]):
+        for object_id, object_attributes in zip(id_bunch, attributes_bunch):
+            self.remove(object_type, object_id, object_attributes)
+        return self
+
+    def simplify_bunch(self, old_ids_list_bunch, new_id_bunch, indexed_paths_to_simplify, links_to_add):
+        self.record().simplify_bunch(old_ids_list_bunch, new_id_bunch, indexed_paths_to_simplify, links_to_add)
+        return self
+
+    def merge_logs(self, *others):
+        self.change_log = self.record().merge_logs(*others)
+        return self
+
+    def record(self) -> ChangeLog:
+        """
+        Records the events collected so far in the change log
+        :return: the change log
+        """
+        for change_event, object_type, events in self._runs:
+            if change_event == 'add':
+                ids, attributes = zip(*events)
+                self.change_log.add_bunch(object_type, list(ids), list(attributes))
+            elif change_event == 'remove':
+                ids, attributes = zip(*events)
+                self.change_log.remove_bunch(object_type, list(ids), list(attributes))
+            else:
+                old_ids, old_attributes, new_ids, new_attributes = zip(*events)
+                self.change_log.modify_bunch(
+                    object_type, list(old_ids), list(old_attributes), list(new_ids), list(new_attributes))
+        self._runs = []
+        self._modified = {}
+        return self.change_log
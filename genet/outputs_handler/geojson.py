@@ -177,16 +177,17 @@ def generate_standard_outputs(n, output_dir, gtfs_day='19700101', include_shp_fi
     logging.info('Generating geojson outputs for different highway tags in car modal subgraph')
     highway_tags = n.link_attribute_data_under_key({'attributes': {'osm:way:highway': 'text'}})
     highway_tags = set(chain.from_iterable(highway_tags.apply(lambda x: setify(x))))
-    for tag in highway_tags:
-        tag_links = n.extract_links_on_edge_attributes(
-            conditions={'attributes': {'osm:way:highway': {'text': tag}}},
-            mixed_dtypes=True)
-        save_geodataframe(
-            graph_links[graph_links['id'].isin(tag_links)],
-            filename=f'car_osm_highway_{tag}',
-            output_dir=graph_output_dir,
-            include_shp_files=include_shp_files
-        )
+    with n.attribute_index({'attributes': {'osm:way:highway': 'text'}}):
+        for tag in highway_tags:
+            tag_links = n.extract_links_on_edge_attributes(
+                conditions={'attributes': {'osm:way:highway': {'text': tag}}},
+                mixed_dtypes=True)
+            save_geodataframe(
+                graph_links[graph_links['id'].isin(tag_links)],
+                filename=f'car_osm_highway_{tag}',
+                output_dir=graph_output_dir,
+                include_shp_files=include_shp_files
+            )
 
     for mode in n.modes():
         logging.info(f'Generating geometry-only geojson outputs for {mode} modal subgraph')
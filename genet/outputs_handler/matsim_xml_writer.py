@@ -82,8 +82,8 @@ def write_matsim_network(output_dir, network):
 
             links_attribs = {'capperiod': '01:00:00', 'effectivecellsize': '7.5', 'effectivelanewidth': '3.75'}
             with xf.element("links", links_attribs):
-                for link_id, link_attribs in network.links():
-                    link_attributes = prepare_link_attributes(deepcopy(link_attribs))
+                for link_id, link_attribs in network.links(copy=False):
+                    link_attributes = prepare_link_attributes(deepcopy(dict(link_attribs)))
                     if 'attributes' in link_attributes:
                         attributes = link_attributes.pop('attributes')
                         with xf.element("link", sanitiser.sanitise_dictionary_for_xml(link_attributes)):
@@ -13,9 +13,9 @@ from datetime import datetime
 from pandas import DataFrame, Series
 from copy import deepcopy
 from collections import defaultdict
+from contextlib import contextmanager
 import itertools
 import dictdiffer
-from s2sphere import CellId
 import genet.utils.plot as plot
 import genet.utils.spatial as spatial
 import genet.utils.dict_support as dict_support
@@ -77,6 +77,34 @@ class ScheduleElement:
     def change_log(self):
         return self._graph.graph['change_log']
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager for making many changes to the object, e.g. adding or removing Services or Routes in a loop.
+        Change log events are collected and recorded once the context is left, repeated modifications of the same
+        object are recorded as one, see genet.modify.change_log.ChangeLogBatch
+        :return:
+        """
+        if isinstance(self.change_log(), change_log.ChangeLogBatch):
+            yield
+            return
+        self._graph.graph['change_log'] = change_log.ChangeLogBatch(self.change_log())
+        try:
+            yield
+        finally:
+            if isinstance(self.change_log(), change_log.ChangeLogBatch):
+                self._graph.graph['change_log'] = self.change_log().record()
+
+    def set_change_log_level(self, level: str, path: str = None):
+        """
+        Sets what is recorded in the change log from now on, by every method changing the object
+        :param level: 'off', 'summary', 'ids_only' or 'full', see genet.modify.change_log.ChangeLog
+        :param path: optional, path to a file to stream the change log events to, e.g. 'schedule_change_log.csv.gz'
+            or 'schedule_change_log.jsonl.gz', see genet.modify.change_log.ChangeLogSink
+        :return:
+        """
+        self.change_log().set_level(level, sink=path)
+
     @abstractmethod
     def reference_nodes(self):
         pass
@@ -586,9 +614,11 @@ class Route(ScheduleElement):
 
     def crowfly_distance(self):
         distance = 0
-        for prev_stop, next_stop in zip(self.ordered_stops[:-1], self.ordered_stops[1:]):
+        if len(self.ordered_stops) > 1:
             # todo replace by accessing graph nodes
-            distance += spatial.distance_between_s2cellids(self.stop(prev_stop).s2_id, self.stop(next_stop).s2_id)
+            s2_ids = [self.stop(stop).s2_id for stop in self.ordered_stops]
+            for length in spatial.distances_between_s2cellids(s2_ids[:-1], s2_ids[1:]).tolist():
+                distance += length
         return distance
 
     def is_strongly_connected(self):
@@ -734,24 +764,11 @@ class Service(ScheduleElement):
 
     def _build_graph(self, routes):
         _id = self.id
-        nodes = {}
-        edges = {}
-        graph_routes = {}
-        service_graph = nx.DiGraph(name='Service graph')
-        service_graph.graph['change_log'] = change_log.ChangeLog()
-        for route in routes:
-            g = route.graph()
-            nodes = dict_support.merge_complex_dictionaries(dict(g.nodes(data=True)), nodes)
-            edges = dict_support.combine_edge_data_lists(list(g.edges(data=True)), edges)
-            graph_routes = dict_support.merge_complex_dictionaries(g.graph['routes'], graph_routes)
-            service_graph.graph['change_log'] = service_graph.graph['change_log'].merge_logs(
-                g.graph['change_log']
-            )
-
-        service_graph.add_nodes_from(nodes, services={_id})
-        service_graph.add_edges_from(edges, services={_id})
-        nx.set_node_attributes(service_graph, nodes)
-        service_graph.graph['routes'] = deepcopy(graph_routes)
+        service_graph = build_graph_from_parts([route.graph() for route in routes], name='Service graph')
+        for node, node_attribs in service_graph.nodes(data=True):
+            node_attribs['services'] = {_id}
+        for u, v, edge_attribs in service_graph.edges(data=True):
+            edge_attribs['services'] = {_id}
         service_graph.graph['services'] = {_id: self._surrender_to_graph()}
         service_graph.graph['route_to_service_map'] = {route.id: _id for route in routes}
         service_graph.graph['service_to_route_map'] = {_id: [route.id for route in routes]}
@@ -1094,6 +1111,8 @@ class Schedule(ScheduleElement):
         self.init_epsg = epsg
         self.transformer = Transformer.from_crs(epsg, 'epsg:4326', always_xy=True)
         self.minimal_transfer_times = {}
+        # index of S2 cells of stops, see `_s2_index`
+        self._s2_stops_index = None
         if vehicles is None:
             self.vehicles = {}
             self.generate_vehicles()
@@ -1124,36 +1143,8 @@ class Schedule(ScheduleElement):
         return len(self.service_ids())
 
     def _build_graph(self, services):
-        nodes = {}
-        edges = {}
-        graph_routes = {}
-        graph_services = {}
-        schedule_graph = nx.DiGraph(name='Schedule graph')
-        schedule_graph.graph['route_to_service_map'] = {}
-        schedule_graph.graph['service_to_route_map'] = {}
-        schedule_graph.graph['change_log'] = change_log.ChangeLog()
-
-        for service in services:
-            g = service.graph()
-            nodes = dict_support.merge_complex_dictionaries(dict(g.nodes(data=True)), nodes)
-            edges = dict_support.combine_edge_data_lists(list(g.edges(data=True)), edges)
-            graph_routes = dict_support.merge_complex_dictionaries(g.graph['routes'], graph_routes)
-            graph_services = dict_support.merge_complex_dictionaries(g.graph['services'], graph_services)
-            schedule_graph.graph['route_to_service_map'] = {**schedule_graph.graph['route_to_service_map'],
-                                                            **g.graph['route_to_service_map']}
-            schedule_graph.graph['service_to_route_map'] = {**schedule_graph.graph['service_to_route_map'],
-                                                            **g.graph['service_to_route_map']}
-            schedule_graph.graph['change_log'] = schedule_graph.graph['change_log'].merge_logs(
-                g.graph['change_log']
-            )
-            # TODO check for clashing stop ids overwriting data
-
-        schedule_graph.add_nodes_from(nodes)
-        schedule_graph.add_edges_from(edges)
-        nx.set_node_attributes(schedule_graph, nodes)
-        schedule_graph.graph['routes'] = graph_routes
-        schedule_graph.graph['services'] = graph_services
-        return schedule_graph
+        # TODO check for clashing stop ids overwriting data
+        return build_graph_from_parts([service.graph() for service in services], name='Schedule graph')
 
     def generate_vehicles(self, overwrite=False):
         """
@@ -1343,6 +1334,7 @@ class Schedule(ScheduleElement):
         self.minimal_transfer_times = {**other.minimal_transfer_times, **self.minimal_transfer_times}
         # todo assuming separate schedules, with non conflicting ids, nodes and edges
         self._graph.update(other._graph)
+        self._s2_stops_index = None
 
         # merge change_log DataFrames
         self._graph.graph['change_log'] = self.change_log().merge_logs(other.change_log())
@@ -1808,7 +1800,21 @@ class Schedule(ScheduleElement):
 
     def _find_stops_on_s2_geometry(self, s2_input):
         cell_union = spatial.s2_hex_to_cell_union(s2_input)
-        return [_id for _id, s2_id in self._graph.nodes(data='s2_id') if cell_union.intersects(CellId(s2_id))]
+        return self._s2_index().intersecting(cell_union)
+
+    def _s2_index(self):
+        """
+        Lazily builds, or rebuilds if stale, the index of S2 cells of stops (`s2_id`). Services and Routes share the
+        graph, they can add or remove stops but do not change their `s2_id`, so the index is rebuilt if the graph is
+        replaced or the number of stops changes.
+        :return: genet.utils.spatial.S2Index
+        """
+        sources = (self._graph, self._graph.number_of_nodes())
+        if (self._s2_stops_index is None) or not self._s2_stops_index.describes(*sources):
+            stops, s2_ids = zip(*self._graph.nodes(data='s2_id')) if self._graph else ((), ())
+            self._s2_stops_index = spatial.S2Index(
+                stops, [[] if s2_id is None else [s2_id] for s2_id in s2_ids], sources=sources)
+        return self._s2_stops_index
 
     def _verify_no_id_change(self, new_attributes):
         id_changes = [id for id, change_dict in new_attributes.items() if
@@ -1826,8 +1832,8 @@ class Schedule(ScheduleElement):
         """
         self._verify_no_id_change(new_attributes)
         services = list(new_attributes.keys())
-        old_attribs = [deepcopy(self._graph.graph['services'][service]) for service in services]
-        new_attribs = [{**self._graph.graph['services'][service], **new_attributes[service]} for service in services]
+        old_attribs = [self._graph.graph['services'][service] for service in services]
+        new_attribs = [{**attribs, **new_attributes[service]} for service, attribs in zip(services, old_attribs)]
 
         self._graph.graph['change_log'] = self.change_log().modify_bunch('service', services, old_attribs, services,
                                                                          new_attribs)
@@ -1846,8 +1852,8 @@ class Schedule(ScheduleElement):
         """
         self._verify_no_id_change(new_attributes)
         routes = list(new_attributes.keys())
-        old_attribs = [deepcopy(self._graph.graph['routes'][route]) for route in routes]
-        new_attribs = [{**self._graph.graph['routes'][route], **new_attributes[route]} for route in routes]
+        old_attribs = [self._graph.graph['routes'][route] for route in routes]
+        new_attribs = [{**attribs, **new_attributes[route]} for route, attribs in zip(routes, old_attribs)]
 
         self._graph.graph['change_log'] = self.change_log().modify_bunch('route', routes, old_attribs, routes,
                                                                          new_attribs)
@@ -1866,12 +1872,14 @@ class Schedule(ScheduleElement):
         """
         self._verify_no_id_change(new_attributes)
         stops = list(new_attributes.keys())
-        old_attribs = [deepcopy(self._graph.nodes[stop]) for stop in stops]
-        new_attribs = [{**self._graph.nodes[stop], **new_attributes[stop]} for stop in stops]
+        old_attribs = [self._graph.nodes[stop] for stop in stops]
+        new_attribs = [{**attribs, **new_attributes[stop]} for stop, attribs in zip(stops, old_attribs)]
 
         self._graph.graph['change_log'] = self.change_log().modify_bunch('stop', stops, old_attribs, stops, new_attribs)
 
         nx.set_node_attributes(self._graph, dict(zip(stops, new_attribs)))
+        if any('s2_id' in attribs for attribs in new_attributes.values()):
+            self._s2_stops_index = None
         logging.info(f'Changed Stop attributes for {len(stops)} stops')
 
     def apply_function_to_services(self, function, location: str):
@@ -2340,6 +2348,47 @@ class Schedule(ScheduleElement):
         self.write_to_csv(output_dir, gtfs_day=gtfs_day, file_extention='txt')
 
 
+def build_graph_from_parts(graphs: List[nx.DiGraph], name: str):
+    """
+    Builds the graph of a schedule element from graphs of its parts, e.g. a Schedule graph from Service graphs.
+    Data of nodes, edges, routes and services is merged using dict_support.update_complex_dictionary, i.e. sets
+    of e.g. routes a stop is used by are joined and other data is taken from the first graph that has it. The maps
+    between routes and services are joined and change logs are merged. All graphs are read once, so the time taken
+    grows linearly with their total size. The parts are merged last to first, so that data of later parts comes
+    first, as it does when merging each part into the data of the parts before it with
+    dict_support.merge_complex_dictionaries.
+    :param graphs: list of nx.DiGraphs of the parts
+    :param name: name of the graph
+    :return: nx.DiGraph
+    """
+    nodes = {}
+    edges = {}
+    graph_routes = {}
+    graph_services = {}
+    route_to_service_map = {}
+    service_to_route_map = {}
+    change_logs = []
+    for g in reversed(graphs):
+        dict_support.update_complex_dictionary(nodes, dict(g.nodes(data=True)))
+        dict_support.update_complex_dictionary(edges, {(u, v): data for u, v, data in g.edges(data=True)})
+        dict_support.update_complex_dictionary(graph_routes, g.graph['routes'])
+        dict_support.update_complex_dictionary(graph_services, g.graph['services'])
+    for g in graphs:
+        route_to_service_map.update(g.graph.get('route_to_service_map', {}))
+        service_to_route_map.update(g.graph.get('service_to_route_map', {}))
+        change_logs.append(g.graph['change_log'])
+
+    graph = nx.DiGraph(name=name)
+    graph.add_nodes_from(nodes.items())
+    graph.add_edges_from((u, v, data) for (u, v), data in edges.items())
+    graph.graph['route_to_service_map'] = route_to_service_map
+    graph.graph['service_to_route_map'] = service_to_route_map
+    graph.graph['change_log'] = change_log.ChangeLog().merge_logs(*change_logs)
+    graph.graph['routes'] = graph_routes
+    graph.graph['services'] = graph_services
+    return graph
+
+
 def verify_graph_schema(graph):
     if not isinstance(graph, nx.DiGraph):
         raise ScheduleElementGraphSchemaError(
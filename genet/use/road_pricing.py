@@ -24,8 +24,7 @@ def extract_network_id_from_osm_csv(network, attribute_name, osm_csv_path, outpa
     target_osm_ids = set(osm_df['osm_ids'].values)
 
     osm_to_network_dict = {}
-
-    with tqdm(total=len(target_osm_ids)) as pbar:
+    with network.attribute_index({'attributes': {attribute_name: 'text'}}), tqdm(total=len(target_osm_ids)) as pbar:
         for target_id in target_osm_ids:
             links = network.extract_links_on_edge_attributes(
                     conditions={'attributes': {attribute_name: {'text': target_id}}},
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from typing import Iterable
+
+LINK_ATTRIBUTES = ['length', 'freespeed', 'capacity', 'permlanes']
+NODE_ATTRIBUTES = ['x', 'y', 'lat', 'lon', 's2_id']
+MAX_NUMBER_OF_MODES = 64
+
+
+class AttributeStore:
+    """
+    Columnar copy of scalar attributes of nodes or links, e.g. `freespeed` or `x`. Items are given dense integer
+    positions and each attribute is held in a numpy array, alongside a boolean mask of items which have that
+    attribute. Modes are held as a bitmask, one bit per mode.
+
+    Attributes whose values are not numeric scalars (e.g. strings, lists or dictionaries) are not held in the store,
+    `has_attribute` is False for them and their data needs to be read from the graph.
+
+    Parameters
+    ----------
+    :param iterator: iterator yielding (index, attribute_dictionary), e.g. genet.core.Network.links()
+    :param keys: attribute keys to hold in the store
+    :param modes: whether to hold the `modes` attribute as a bitmask
+    :param sources: containers the data comes from, e.g. the graph, the last one should hold the items
+    """
+
+    def __init__(self, iterator: Iterable, keys: Iterable[str], modes: bool = False, sources: tuple = ()):
+        self.sources = sources
+        keys = list(keys)
+        ids = []
+        values = {key: [] for key in keys}
+        positions = {key: [] for key in keys}
+        modes_data = []
+        for position, (_id, attribs) in enumerate(iterator):
+            ids.append(_id)
+            for key in keys:
+                if key in attribs:
+                    values[key].append(attribs[key])
+                    positions[key].append(position)
+            if modes:
+                modes_data.append(attribs.get('modes', set()))
+
+        self.ids = pd.Index(ids)
+        self.positions = {_id: i for i, _id in enumerate(ids)}
+        self.columns = {}
+        self.masks = {}
+        for key in keys:
+            self._set_column(key, values[key], positions[key])
+
+        self.mode_bits = None
+        self.modes_bitmask = None
+        if modes:
+            self._set_modes(modes_data)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def describes(self, *sources) -> bool:
+        """
+        Checks whether the store was built from `sources`, and that the number of items in them has not changed
+        :param sources: containers the data comes from, same as those passed to the store on initialisation
+        :return: bool
+        """
+        if len(sources) != len(self.sources) or any(s is not _s for s, _s in zip(sources, self.sources)):
+            return False
+        return (not sources) or (len(sources[-1]) == len(self))
+
+    def _set_column(self, key, values, positions):
+        if not values:
+            return
+        # let pandas decide the dtype, the same way it does for data read from the graph
+        column = pd.Series(values).to_numpy()
+        if column.dtype == object:
+            return
+        full_column = np.zeros(len(self.ids), dtype=column.dtype)
+        mask = np.zeros(len(self.ids), dtype=bool)
+        full_column[positions] = column
+        mask[positions] = True
+        self.columns[key] = full_column
+        self.masks[key] = mask
+
+    def _set_modes(self, modes_data):
+        self.mode_bits = {}
+        bitmask = np.zeros(len(modes_data), dtype=np.uint64)
+        for i, item_modes in enumerate(modes_data):
+            bits = self._modes_to_bits(item_modes)
+            if bits is None:
+                self.mode_bits = None
+                return
+            bitmask[i] = bits
+        self.modes_bitmask = bitmask
+
+    def _modes_to_bits(self, modes):
+        if isinstance(modes, str):
+            modes = {modes}
+        elif not isinstance(modes, (list, set)):
+            return None
+        bits = 0
+        for mode in modes:
+            if mode not in self.mode_bits:
+                if len(self.mode_bits) == MAX_NUMBER_OF_MODES:
+                    return None
+                self.mode_bits[mode] = 1 << len(self.mode_bits)
+            bits |= self.mode_bits[mode]
+        return bits
+
+    def has_attribute(self, key) -> bool:
+        return isinstance(key, str) and key in self.columns
+
+    def has_modes(self) -> bool:
+        return self.modes_bitmask is not None
+
+    def attribute_data(self, key: str) -> pd.Series:
+        """
+        :param key: attribute key held in the store
+        :return: pandas.Series indexed by ids of items which have attribute `key`
+        """
+        mask = self.masks[key]
+        return pd.Series(self.columns[key][mask], index=self.ids[mask])
+
+    def ids_with_modes(self, modes) -> list:
+        """
+        :param modes: string mode e.g. 'car' or a list or set of such modes e.g. ['car', 'walk']
+        :return: list of ids of items which have at least one of the modes
+        """
+        if isinstance(modes, str):
+            modes = [modes]
+        bits = 0
+        for mode in modes:
+            bits |= self.mode_bits.get(mode, 0)
+        return list(self.ids[(self.modes_bitmask & np.uint64(bits)) != 0])
+
+    def update(self, new_attributes: dict) -> bool:
+        """
+        Updates values held in the store
+        :param new_attributes: {id: {key: new_value}}
+        :return: False if the update cannot be applied and the store needs to be rebuilt from the graph
+        """
+        affected_keys = set()
+        for attribs in new_attributes.values():
+            affected_keys |= set(attribs)
+        if ('modes' in affected_keys) and self.has_modes():
+            for _id, attribs in new_attributes.items():
+                if 'modes' in attribs:
+                    bits = self._modes_to_bits(attribs['modes'])
+                    if (bits is None) or (_id not in self.positions):
+                        return False
+                    self.modes_bitmask[self.positions[_id]] = bits
+        for key in affected_keys & set(self.columns):
+            ids = [_id for _id, attribs in new_attributes.items() if key in attribs]
+            try:
+                positions = [self.positions[_id] for _id in ids]
+            except KeyError:
+                return False
+            column = pd.Series([new_attributes[_id][key] for _id in ids]).to_numpy()
+            if column.dtype != self.columns[key].dtype:
+                return False
+            self.columns[key][positions] = column
+            self.masks[key][positions] = True
+        return True
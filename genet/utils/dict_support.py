@@ -1,21 +1,26 @@
 import pandas as pd
 from numpy import ndarray
+from types import MappingProxyType
 from typing import Union
 import genet.utils.graph_operations as graph_operations
 
 
-def set_nested_value(d: dict, value: dict):
+def set_nested_value(d: dict, value: dict, copy: bool = False):
     """
     Changes or, if not present injects, `different_value` into nested dictionary d at key `key: key_2`
     :param d: {key: {key_2: value, key_1: 1234}
     :param value: {key: {key_2: different_value}}
+    :param copy: if True, d is left unchanged and the changes are made to a copy of it, only dictionaries on the way
+        to the changed values are copied
     :return:
     """
     if isinstance(value, dict):
+        if copy:
+            d = dict(d)
         for k, v in value.items():
             if k in d:
                 if isinstance(d[k], dict):
-                    d[k] = set_nested_value(d[k], v)
+                    d[k] = set_nested_value(d[k], v, copy=copy)
                 else:
                     d[k] = v
             else:
@@ -101,6 +106,44 @@ def merge_complex_dictionaries(d1, d2):
     return d1
 
 
+def update_complex_dictionary(d1, d2):
+    """
+    Merges d2 into d1, in place, where the values can be lists, sets or other dictionaries with the same behaviour.
+    Gives the same result as merge_complex_dictionaries(d1, d2), i.e. if values are not list, set or dict then d2
+    values prevail, but only the keys of d2 are visited, so merging many dictionaries into one takes time
+    proportional to their total size. Lists, sets and dictionaries of d2 are copied when added to d1, d2 is left
+    unchanged.
+    :param d1:
+    :param d2:
+    :return: d1
+    """
+    for key, value in d2.items():
+        if key in d1 and isinstance(d1[key], dict) and isinstance(value, dict):
+            update_complex_dictionary(d1[key], value)
+        elif key in d1 and isinstance(d1[key], list) and isinstance(value, list):
+            d1[key] = list(set(d1[key]) | set(value))
+        elif key in d1 and isinstance(d1[key], set) and isinstance(value, set):
+            d1[key] |= value
+        else:
+            d1[key] = copy_containers(value)
+    return d1
+
+
+def copy_containers(value):
+    """
+    Copies dictionaries, lists and sets, and those nested in them, other values are not copied
+    :param value:
+    :return: copy of value
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: copy_containers(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_containers(v) for v in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
 def combine_edge_data_lists(l1, l2):
     """
     Merges two lists where each elem is of the form (from_node, to_node, list)
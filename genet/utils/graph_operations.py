@@ -1,8 +1,11 @@
 from typing import Union, Dict, Callable, Iterable
 from anytree import Node, RenderTree
 import pandas as pd
+import numpy as np
 import logging
-from itertools import count, filterfalse
+import operator
+from itertools import count, filterfalse, chain, compress, repeat
+from types import MappingProxyType
 
 
 class Filter:
@@ -112,6 +115,230 @@ class Filter:
                         satisfies = val(data_dict[key])
         return satisfies
 
+    def filter_ids(self, iterator: Iterable) -> list:
+        """
+        Finds ids of items satisfying the conditions, with the same results as `satisfies_conditions` applied to each
+        item. Conditions are evaluated for all items at once: values under each key in conditions are gathered once
+        into columns, numbers and strings are compared to target values and bounds with NumPy and pandas, per type of
+        value. Functions in conditions, as well as data in unusual formats, are evaluated item by item.
+        :param iterator: iterator or list of tuples (id, dictionary data)
+        :return: list of ids of items satisfying the conditions
+        """
+        items = list(iterator)
+        if not items:
+            return []
+        ids, data = zip(*items)
+        return [ids[i] for i in np.flatnonzero(self.evaluate(list(data)))]
+
+    def evaluate(self, data: list) -> np.ndarray:
+        """
+        :param data: list of dictionaries
+        :return: boolean numpy array, True for dictionaries satisfying the conditions
+        """
+        columns = {}
+        if isinstance(self.conditions, list):
+            if not self.conditions:
+                return np.full(len(data), bool(self.how([])))
+            satisfied = [self._evaluate_condition(condition, data, (), columns) for condition in self.conditions]
+            if self.how is any:
+                return np.logical_or.reduce(satisfied)
+            if self.how is all:
+                return np.logical_and.reduce(satisfied)
+            return np.array([bool(self.how(list(item))) for item in zip(*satisfied)], dtype=bool)
+        elif isinstance(self.conditions, dict):
+            return self._evaluate_condition(self.conditions, data, (), columns)
+        elif self.conditions is None:
+            return np.ones(len(data), dtype=bool)
+        return np.zeros(len(data), dtype=bool)
+
+    def _evaluate_condition(self, condition: dict, data: list, path: tuple, columns: dict) -> np.ndarray:
+        """
+        :param path: keys leading to `data` from the data of the items, `columns` holds the columns gathered so far
+            under each path, to be shared between conditions on the same keys
+        """
+        if len(condition) != 1:
+            # the outcome depends on which of the keys are present, and in which order
+            return self._evaluate_item_by_item(condition, data)
+        [(key, val)] = condition.items()
+        path = path + (key,)
+        if path not in columns:
+            columns[path] = _Column(data, key)
+        column = columns[path]
+
+        satisfies = np.zeros(len(data), dtype=bool)
+        for i in column.other_rows:
+            satisfies[i] = bool(self.evaluate_condition(condition, data[i]))
+        if len(column.rows):
+            if isinstance(val, dict):
+                satisfies[column.rows] = self._evaluate_condition(val, column.values, path, columns)
+            else:
+                satisfies[column.rows] = self._evaluate_column(val, column)
+        return satisfies
+
+    def _evaluate_item_by_item(self, condition, data: list) -> np.ndarray:
+        return np.array([bool(self.evaluate_condition(condition, data_dict)) for data_dict in data], dtype=bool)
+
+    def _evaluate_value(self, val, value) -> bool:
+        return bool(self.evaluate_condition({'value': val}, {'value': value}))
+
+    def _evaluate_column(self, val, column) -> np.ndarray:
+        """
+        Evaluates target value, bound or function `val` on values in `column`, for each group of values of the same
+        type
+        """
+        if isinstance(val, tuple) and len(val) != 2:
+            raise AttributeError('Tuple defining the bound has to be a two-tuple: (lower_bound, upper_bound)')
+        if callable(val) and not isinstance(val, (list, set, tuple)):
+            return np.array([self._evaluate_value(val, value) for value in column.values], dtype=bool)
+        if not isinstance(val, (int, float, str, list, set, tuple)):
+            return np.zeros(len(column.values), dtype=bool)
+
+        satisfies = np.zeros(len(column.values), dtype=bool)
+        for value_type, positions, values, array in column.groups():
+            if issubclass(value_type, (list, set)) and self.mixed_dtypes:
+                group_satisfies = self._evaluate_collections(val, values)
+            elif array is not None:
+                group_satisfies = _evaluate_array(val, array)
+            elif value_type is str and not isinstance(val, tuple):
+                group_satisfies = _evaluate_strings(val, values)
+            else:
+                group_satisfies = np.array([self._evaluate_value(val, value) for value in values], dtype=bool)
+            if group_satisfies is None:
+                # bound cannot be compared with NumPy
+                group_satisfies = np.array([self._evaluate_value(val, value) for value in values], dtype=bool)
+            if positions is None:
+                satisfies = group_satisfies
+            else:
+                satisfies[positions] = group_satisfies
+        return satisfies
+
+    def _evaluate_collections(self, val, values: list) -> np.ndarray:
+        """
+        `values` are lists or sets, the condition needs to hold for at least one item in each (mixed_dtypes)
+        """
+        if isinstance(val, (int, float, str)):
+            return np.fromiter(map(operator.contains, values, repeat(val)), dtype=bool, count=len(values))
+        elif isinstance(val, (list, set)):
+            targets = set(val)
+            return ~np.fromiter(map(targets.isdisjoint, values), dtype=bool, count=len(values))
+        items = list(chain.from_iterable(values))
+        owners = np.repeat(np.arange(len(values)), list(map(len, values)))
+        items_satisfy = np.zeros(len(items), dtype=bool)
+        for positions, group_items, array in _group_by_type(items):
+            group_satisfies = None if array is None else _evaluate_array(val, array)
+            if group_satisfies is None:
+                # as in `evaluate_condition`, values that cannot be compared with the bound raise TypeError
+                group_satisfies = np.array([val[0] <= item <= val[1] for item in group_items], dtype=bool)
+            if positions is None:
+                items_satisfy = group_satisfies
+            else:
+                items_satisfy[positions] = group_satisfies
+        return np.bincount(owners[items_satisfy], minlength=len(values)) > 0
+
+
+class _Column:
+    """
+    Values found under a key in a list of dictionaries. `rows` are positions of the dictionaries with the key in the
+    list, `other_rows` positions of data which are not dictionaries. The values are split into groups of the same type
+    on demand, numbers are held in typed NumPy arrays
+    """
+
+    def __init__(self, data: list, key):
+        if all(isinstance(data_dict, (dict, MappingProxyType)) for data_dict in data):
+            dict_rows = None
+            self.other_rows = []
+        else:
+            dict_rows = [i for i, data_dict in enumerate(data) if isinstance(data_dict, (dict, MappingProxyType))]
+            self.other_rows = sorted(set(range(len(data))) - set(dict_rows))
+            data = [data[i] for i in dict_rows]
+        has_key = list(map(operator.contains, data, repeat(key)))
+        self.rows = np.flatnonzero(has_key)
+        if dict_rows is not None:
+            self.rows = np.array(dict_rows, dtype=int)[self.rows]
+        self.values = list(map(operator.itemgetter(key), compress(data, has_key)))
+        self._groups = None
+
+    def groups(self) -> list:
+        """
+        :return: list of (type of the values, positions of the values in the column or None if all of the values are
+            of that type, values, typed numpy array of the values or None if they are not numbers)
+        """
+        if self._groups is None:
+            self._groups = [(type(values[0]), positions, values, array)
+                            for positions, values, array in _group_by_type(self.values)]
+        return self._groups
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number, np.bool_))
+
+
+def _number_array(values: list):
+    """
+    :return: typed numpy array of `values` of the same type, or None if they are not numbers, or do not fit in one
+    """
+    if not _is_number(values[0]):
+        return None
+    try:
+        array = np.array(values, dtype=np.int64 if type(values[0]) is int else None)
+    except OverflowError:
+        return None
+    return None if array.dtype == object else array
+
+
+def _group_by_type(values: list) -> list:
+    """
+    :return: list of (positions of the values in `values` or None if all of them are of the same type, values of that
+        type, typed numpy array of the values or None if they are not numbers)
+    """
+    if not values:
+        return []
+    types = list(map(type, values))
+    unique_types = set(types)
+    if len(unique_types) == 1:
+        return [(None, values, _number_array(values))]
+    groups = []
+    for value_type in unique_types:
+        is_type = np.fromiter(map(operator.is_, types, repeat(value_type)), dtype=bool, count=len(types))
+        group_values = list(compress(values, is_type.tolist()))
+        groups.append((np.flatnonzero(is_type), group_values, _number_array(group_values)))
+    return groups
+
+
+def _evaluate_array(val, array: np.ndarray):
+    """
+    Evaluates target value, values or bound `val` on typed array of numbers
+    :return: boolean numpy array, or None if `val` is a bound which cannot be compared with NumPy
+    """
+    if isinstance(val, str):
+        return np.zeros(len(array), dtype=bool)
+    elif isinstance(val, (int, float)):
+        return array == val
+    elif isinstance(val, (list, set)):
+        targets = [target for target in val if _is_number(target)]
+        if not targets:
+            return np.zeros(len(array), dtype=bool)
+        return np.isin(array, targets)
+    if not (_is_number(val[0]) and _is_number(val[1])):
+        return None
+    # NaN in the array compares as False, like missing values in the unvectorised filter
+    with np.errstate(invalid='ignore'):
+        return (val[0] <= array) & (array <= val[1])
+
+
+def _evaluate_strings(val, values: list) -> np.ndarray:
+    """
+    Evaluates target value or values `val` on list of strings
+    """
+    if isinstance(val, str):
+        return np.array(values, dtype=object) == val
+    elif isinstance(val, (list, set)):
+        targets = [target for target in val if isinstance(target, str)]
+        if not targets:
+            return np.zeros(len(values), dtype=bool)
+        return pd.Series(values, dtype=object).isin(targets).to_numpy()
+    return np.zeros(len(values), dtype=bool)
+
 
 def extract_on_attributes(iterator, conditions: Union[list, dict], how=any, mixed_dtypes=True):
     """
@@ -155,8 +382,7 @@ def extract_on_attributes(iterator, conditions: Union[list, dict], how=any, mixe
     values e.g. as in simplified networks.
     :return: list of ids in input iterator satisfying conditions
     """
-    filter = Filter(conditions, how, mixed_dtypes)
-    return [_id for _id, attribs in iterator if filter.satisfies_conditions(attribs)]
+    return Filter(conditions, how, mixed_dtypes).filter_ids(iterator)
 
 
 def get_attribute_schema(iterator, data=False):
@@ -236,19 +462,25 @@ def get_attribute_data_under_key(iterator: Iterable, key: Union[str, dict]):
     return data
 
 
-def build_attribute_dataframe(iterator, keys: Union[list, str], index_name: str = None):
+def build_attribute_dataframe(iterator, keys: Union[list, str], index_name: str = None, store=None):
     """
     Builds a pandas.DataFrame from data in iterator.
     :param iterator: iterator or list of tuples (id, dictionary data with keys of interest)
     :param keys: keys to extract data from. Can be a string, list or dictionary/list of dictionaries if accessing
     nested dictionaries, for example on using dictionaries see `get_attribute_data_under_key` docstring.
     :param index_name:
+    :param store: optional, genet.utils.attribute_store.AttributeStore holding the same data as iterator. Data under
+    keys held in the store is read from it rather than the iterator
     :return:
     """
     df = None
     if isinstance(keys, str):
         keys = [keys]
-    if len(keys) > 1:
+    if store is not None:
+        keys_from_iterator = [key for key in keys if not store.has_attribute(key)]
+    else:
+        keys_from_iterator = keys
+    if len(keys_from_iterator) > 1:
         iterator = list(iterator)
     for key in keys:
         if isinstance(key, dict):
@@ -258,7 +490,10 @@ def build_attribute_dataframe(iterator, keys: Union[list, str], index_name: str
         else:
             name = key
 
-        col_series = pd.Series(get_attribute_data_under_key(iterator, key))
+        if store is not None and store.has_attribute(key):
+            col_series = store.attribute_data(key)
+        else:
+            col_series = pd.Series(get_attribute_data_under_key(iterator, key))
         col_series.name = name
 
         if df is not None:
@@ -333,15 +568,18 @@ def consolidate_node_indices(left, right):
     # check uniqueness of the node indices that are left in right
     clashing_right_node_ids = \
         set(s2_id_df[s2_id_df['left'].isna()]['right']) & set(s2_id_df['left'].dropna())
+    reindexing_dict = {}
     if clashing_right_node_ids:
         # generate the index avoiding indices from left, that way they're unique across both graphs
-        [right.reindex_node(node, right.generate_index_for_node([i for i, a in left.nodes()])) for node in
-         clashing_right_node_ids]
-
-    # finally change node ids for overlapping nodes
-    # TODO check that a new index is not being generated if an index exists in right but hasnt been overwritten yet
-    [right.reindex_node(s2_id_df.loc[idx, 'right'], s2_id_df.loc[idx, 'left'])
-     for idx in s2_id_df.dropna()[s2_id_df['right'] != s2_id_df['left']].index]
+        new_node_ids = right.generate_indices_for_n_nodes(len(clashing_right_node_ids), avoid_keys=left.graph.nodes)
+        reindexing_dict = dict(zip(clashing_right_node_ids, new_node_ids))
+
+    # finally change node ids for overlapping nodes, all nodes are relabelled at once so nodes in right can swap
+    # indices
+    overlapping_nodes = s2_id_df.dropna()
+    overlapping_nodes = overlapping_nodes[overlapping_nodes['right'] != overlapping_nodes['left']]
+    reindexing_dict = {**reindexing_dict, **dict(zip(overlapping_nodes['right'], overlapping_nodes['left']))}
+    right.reindex_nodes(reindexing_dict, silent=True)
     logging.info('Finished consolidating node indexing between the two graphs')
     return right
 
@@ -432,8 +670,9 @@ def consolidate_link_indices(left, right):
     clashing_right_link_ids = set(right.link_id_mapping.keys()) & clashing_right_link_ids
     if clashing_right_link_ids:
         # generate the index avoiding indices from left, that way they're unique across both graphs
-        [right.reindex_link(link, right.generate_index_for_edge(set(left.link_id_mapping.keys()))) for link in
-         clashing_right_link_ids]
+        new_link_ids = right.generate_indices_for_n_edges(
+            len(clashing_right_link_ids), avoid_keys=left.link_id_mapping.keys())
+        right.reindex_links(dict(zip(clashing_right_link_ids, new_link_ids)), silent=True)
 
     # Impose link id and multi index if from left on right, basically add the links we deleted from right but using
     # left's indexing, keep the data from right using the dictionaries where we saved them
@@ -442,6 +681,13 @@ def consolidate_link_indices(left, right):
         multi_idx = left.link_id_mapping[left_link_id]['multi_edge_idx']
         right.add_link(left_link_id, u, v, multi_idx, data, silent=True)
 
+    # generate new ids for the remaining links whose ids are taken in either graph, all at once, avoiding the ids of
+    # the other remaining links
+    taken_link_ids = [link_id for link_id in unique_clashing_links_data
+                      if (link_id in left.link_id_mapping) or (link_id in right.link_id_mapping)]
+    replacement_link_ids = dict(zip(taken_link_ids, right.generate_indices_for_n_edges(
+        len(taken_link_ids), avoid_keys=set(left.link_id_mapping) | set(unique_clashing_links_data))))
+
     for right_link_id, data in unique_clashing_links_data.items():
         u, v = data['from'], data['to']
         # generate unique multi index, unique in both left and right
@@ -453,9 +699,7 @@ def consolidate_link_indices(left, right):
             left_multi_idx = set(left.graph[u][v].keys())
         existing_multi_edge_ids = right_multi_idx | left_multi_idx
         multi_idx = next(filterfalse(set(existing_multi_edge_ids).__contains__, count(1)))
-        if right_link_id in set(left.link_id_mapping.keys()) | set(right.link_id_mapping.keys()):
-            right_link_id = right.generate_index_for_edge(set(left.link_id_mapping.keys()))
-        right.add_link(right_link_id, u, v, multi_idx, data, silent=True)
+        right.add_link(replacement_link_ids.get(right_link_id, right_link_id), u, v, multi_idx, data, silent=True)
 
     logging.info('Finished consolidating link indexing between the two graphs')
     return right
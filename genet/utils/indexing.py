@@ -0,0 +1,461 @@
+import heapq
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import KeysView
+from types import MappingProxyType
+from typing import Iterable, List, Union
+
+
+def _int_or_none(_id):
+    try:
+        return int(_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class IdAllocator(ABC):
+    """
+    Generates new, unique string indices (e.g. '1234') for items stored in a container, e.g. nodes of a graph or
+    link ids in a link id mapping, without scanning all of the existing indices each time.
+
+    Indices added to, or removed from, the container are passed to `add` and `remove` to keep track of them. The
+    allocator rescans the container if it is not the one seen previously, or if the number of indices in it has
+    changed without going through the allocator.
+    """
+
+    def __init__(self):
+        self._source = None
+        self._size = 0
+        self._reset()
+
+    def sync(self, source):
+        """
+        Points the allocator at the container holding the existing indices, rescans it if it has been replaced or
+        modified directly.
+        :param source: container supporting `in`, `len` and iteration over the existing indices
+        :return: self
+        """
+        if (source is not self._source) or (len(source) != self._size):
+            self._source = source
+            self._size = len(source)
+            self._reset()
+            self._scan(source)
+        return self
+
+    def add(self, ids: Iterable):
+        """
+        :param ids: indices that have been added to the container
+        :return:
+        """
+        for _id in ids:
+            self._size += 1
+            self._add(_id)
+
+    def remove(self, ids: Iterable):
+        """
+        :param ids: indices that have been removed from the container
+        :return:
+        """
+        for _id in ids:
+            self._size -= 1
+            self._remove(_id)
+
+    @abstractmethod
+    def _reset(self):
+        pass
+
+    def _scan(self, ids: Iterable):
+        for _id in ids:
+            self._add(_id)
+
+    @abstractmethod
+    def _add(self, _id):
+        pass
+
+    @abstractmethod
+    def _remove(self, _id):
+        pass
+
+    @abstractmethod
+    def generate(self, n: int = 1, avoid_keys: Iterable = None) -> List[str]:
+        """
+        Generates `n` new unique indices, without reserving them, the same indices are given out until they are added
+        to the container
+        :param n: number of indices to generate
+        :param avoid_keys: optional, indices to avoid on top of the ones in the container
+        :return: list of `n` string indices
+        """
+        pass
+
+
+class NodeIdAllocator(IdAllocator):
+    """
+    Gives out the integers following the highest integer index in use, e.g. '6' for nodes '1', '2' and '5'. If some
+    of the indices are not integers, gives out the integers following the number of indices in use, or uuid4 strings
+    for those which are taken.
+
+    The highest integer index is held in a heap, indices removed from the container are dropped from it when they
+    reach the top.
+    """
+
+    def _reset(self):
+        self._highest = []
+        self._other_int_forms = {}
+        self._non_int_ids = set()
+
+    def _scan(self, ids: Iterable):
+        for _id in ids:
+            self._add(_id, push=self._highest.append)
+        heapq.heapify(self._highest)
+
+    def _add(self, _id, push=None):
+        int_id = _int_or_none(_id)
+        if int_id is None:
+            self._non_int_ids.add(_id)
+            return
+        if (_id != int_id) and (_id != str(int_id)):
+            # e.g. '007'
+            self._other_int_forms.setdefault(int_id, set()).add(_id)
+        if push is None:
+            heapq.heappush(self._highest, -int_id)
+        else:
+            push(-int_id)
+
+    def _remove(self, _id):
+        self._non_int_ids.discard(_id)
+
+    def _in_use(self, int_id) -> bool:
+        return (str(int_id) in self._source) or (int_id in self._source) or any(
+            _id in self._source for _id in self._other_int_forms.get(int_id, ()))
+
+    def _highest_in_use(self):
+        while self._highest and not self._in_use(-self._highest[0]):
+            heapq.heappop(self._highest)
+        return -self._highest[0] if self._highest else None
+
+    def generate(self, n: int = 1, avoid_keys: Iterable = None) -> List[str]:
+        avoid_keys = set(avoid_keys) if avoid_keys else set()
+        number_of_ids = self._size + sum(1 for _id in avoid_keys if _id not in self._source)
+        int_avoid_keys = [_int_or_none(_id) for _id in avoid_keys]
+        highest = self._highest_in_use()
+        if self._non_int_ids or (None in int_avoid_keys) or not number_of_ids:
+            first = number_of_ids + 1
+        else:
+            first = max((i for i in int_avoid_keys + [highest] if i is not None), default=0) + 1
+
+        def taken(int_id):
+            return self._in_use(int_id) or (int_id in avoid_keys) or (str(int_id) in avoid_keys)
+
+        return [str(uuid.uuid4()) if taken(i) else str(i) for i in range(first, first + n)]
+
+
+class LinkIdAllocator(IdAllocator):
+    """
+    Gives out the lowest free non-negative integers, e.g. '2' and '4' for links '0', '1' and '3'.
+
+    Integers below a cursor are in use, or have been freed by removing indices through `remove` and are held in a
+    heap. Indices added to the container are skipped when generating, so they need no bookkeeping.
+    """
+
+    def _reset(self):
+        self._cursor = 0
+        self._free = []
+
+    def _scan(self, ids: Iterable):
+        # integers in the container are skipped when generating
+        pass
+
+    def _add(self, _id):
+        pass
+
+    def _remove(self, _id):
+        if isinstance(_id, str) and _id.isdigit() and (str(int(_id)) == _id) and (int(_id) < self._cursor):
+            heapq.heappush(self._free, int(_id))
+
+    def _iter_free(self):
+        """
+        Yields integers held in the free heap in ascending order, without popping them
+        """
+        candidates = [(self._free[0], 0)] if self._free else []
+        while candidates:
+            int_id, i = heapq.heappop(candidates)
+            yield int_id
+            for child in [2 * i + 1, 2 * i + 2]:
+                if child < len(self._free):
+                    heapq.heappush(candidates, (self._free[child], child))
+
+    def generate(self, n: int = 1, avoid_keys: Iterable = None) -> List[str]:
+        if not avoid_keys:
+            avoid_keys = set()
+        elif not isinstance(avoid_keys, (set, frozenset, dict, KeysView)):
+            avoid_keys = set(avoid_keys)
+        # dropping integers which are back in use does not change what is generated
+        while self._free and (str(self._free[0]) in self._source):
+            heapq.heappop(self._free)
+        while str(self._cursor) in self._source:
+            self._cursor += 1
+
+        ids = []
+        for int_id in self._iter_free():
+            if len(ids) == n:
+                return ids
+            _id = str(int_id)
+            if (_id not in avoid_keys) and (_id not in self._source) and not (ids and ids[-1] == _id):
+                ids.append(_id)
+        int_id = self._cursor
+        while len(ids) < n:
+            _id = str(int_id)
+            if (_id not in avoid_keys) and (_id not in self._source):
+                ids.append(_id)
+            int_id += 1
+        return ids
+
+
+class NodeLinkIndex:
+    """
+    Reverse adjacency index for a link id mapping (see genet.core.Network.link_id_mapping): stores, for each node,
+    the ids of links going into and out of that node.
+
+    The index is rebuilt from the link id mapping if it is not the mapping seen previously, or if the number of
+    links in it has changed without going through the index.
+    """
+
+    def __init__(self):
+        self._in_links = {}
+        self._out_links = {}
+        self._source = None
+        self._size = 0
+
+    def sync(self, link_id_mapping: dict):
+        """
+        Points the index at the link id mapping it describes, rebuilds the index if the mapping has been replaced or
+        modified directly.
+        :param link_id_mapping: {link_id: {'from': from_node, 'to': to_node, ...}}
+        :return: self
+        """
+        if (link_id_mapping is not self._source) or (len(link_id_mapping) != self._size):
+            self._in_links = {}
+            self._out_links = {}
+            self._source = link_id_mapping
+            self._size = 0
+            for link_id, link_edge in link_id_mapping.items():
+                if ('from' in link_edge) and ('to' in link_edge):
+                    self.add(link_id, link_edge['from'], link_edge['to'])
+                else:
+                    self._size += 1
+        return self
+
+    def add(self, link_id, u, v):
+        self._out_links.setdefault(u, set()).add(link_id)
+        self._in_links.setdefault(v, set()).add(link_id)
+        self._size += 1
+
+    def remove(self, link_id, u, v):
+        self._discard(self._out_links, u, link_id)
+        self._discard(self._in_links, v, link_id)
+        self._size -= 1
+
+    def _discard(self, index, node, link_id):
+        if node in index:
+            index[node].discard(link_id)
+            if not index[node]:
+                del index[node]
+
+    def relabel_nodes(self, mapping: dict):
+        """
+        Changes node ids in the index, all at once, so nodes can swap ids
+        :param mapping: {old_node_id: new_node_id}
+        :return:
+        """
+        for index in [self._in_links, self._out_links]:
+            relabelled = {mapping[node]: index.pop(node) for node in mapping if node in index}
+            index.update(relabelled)
+
+    def in_links(self, node) -> set:
+        """
+        :param node: node id
+        :return: set of ids of links ending at `node`
+        """
+        return set(self._in_links.get(node, set()))
+
+    def out_links(self, node) -> set:
+        """
+        :param node: node id
+        :return: set of ids of links starting at `node`
+        """
+        return set(self._out_links.get(node, set()))
+
+
+def attribute_path(key: Union[str, dict]) -> tuple:
+    """
+    Translates a (possibly nested) attribute key to a tuple of keys, e.g. {'attributes': {'osm:way:id': 'text'}} to
+    ('attributes', 'osm:way:id', 'text')
+    :param key: either a string e.g. 'modes', or if accessing nested information, a dictionary
+        e.g. {'attributes': {'osm:way:name': 'text'}}
+    :return: tuple of keys
+    """
+    path = []
+    while isinstance(key, dict):
+        if len(key) != 1:
+            raise RuntimeError(f'Attribute key {key} needs to point to a single attribute')
+        [(k, key)] = key.items()
+        path.append(k)
+    path.append(key)
+    return tuple(path)
+
+
+def condition_path(condition: dict):
+    """
+    Splits an equality or set-membership condition on a single attribute (see graph_operations.Filter), e.g.
+    {'attributes': {'osm:way:id': {'text': '123'}}}, into the path to the attribute and the target value
+    :param condition: dictionary condition
+    :return: (tuple of keys, target value), or (None, None) if condition is not on a single attribute or the target
+        value is not a single value or list or set of such values
+    """
+    path = []
+    while isinstance(condition, dict):
+        if len(condition) != 1:
+            return None, None
+        [(k, condition)] = condition.items()
+        path.append(k)
+    if isinstance(condition, (int, float, str)):
+        return tuple(path), condition
+    if isinstance(condition, (list, set)) and all(_is_hashable(value) for value in condition):
+        return tuple(path), condition
+    return None, None
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+        # e.g. float('nan') is never equal to itself
+        return bool(value == value)
+    except TypeError:
+        return False
+
+
+class AttributeIndex:
+    """
+    Inverted (hash) index from values stored under one, possibly nested, attribute to the ids of items (e.g. links)
+    that hold them. Answers equality and set-membership conditions (see genet.utils.graph_operations.Filter) with the
+    same results as evaluating the condition on each item. Values in lists or sets are indexed individually, for use
+    with `mixed_dtypes`.
+
+    Parameters
+    ----------
+    :param path: tuple of keys leading to the attribute, see `attribute_path`
+    :param iterator: iterator yielding (index, attribute_dictionary), e.g. genet.core.Network.links()
+    :param sources: containers the data comes from, e.g. the graph, the last one should hold the items
+    """
+
+    def __init__(self, path: tuple, iterator: Iterable, sources: tuple = ()):
+        self.path = path
+        self.sources = sources
+        self._values = {}
+        self._members = {}
+        self._keys = {}
+        self._positions = {}
+        self._next_position = 0
+        for _id, attribs in iterator:
+            self.add(_id, attribs)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, _id):
+        return _id in self._positions
+
+    def describes(self, *sources) -> bool:
+        """
+        Checks whether the index was built from `sources`, and that the number of items in them has not changed
+        :param sources: containers the data comes from, same as those passed to the index on initialisation
+        :return: bool
+        """
+        if len(sources) != len(self.sources) or any(s is not _s for s, _s in zip(sources, self.sources)):
+            return False
+        return (not sources) or (len(sources[-1]) == len(self))
+
+    def _value(self, attribs):
+        value = attribs
+        for key in self.path:
+            if not (isinstance(value, (dict, MappingProxyType)) and key in value):
+                return None, False
+            value = value[key]
+        return value, True
+
+    def add(self, _id, attribs: dict, position: int = None):
+        """
+        Adds an item to the index, items are kept in the order they are added
+        :param _id: item's id
+        :param attribs: item's attribute dictionary
+        :param position: optional, position of the item, for items changed in place
+        :return:
+        """
+        if position is None:
+            position = self._next_position
+            self._next_position += 1
+        self._positions[_id] = position
+        value, found = self._value(attribs)
+        if not found:
+            return
+        if isinstance(value, (list, set)):
+            members = {member for member in value if _is_hashable(member)}
+            for member in members:
+                self._members.setdefault(member, set()).add(_id)
+            self._keys[_id] = (False, members)
+        elif _is_hashable(value):
+            self._values.setdefault(value, set()).add(_id)
+            self._keys[_id] = (True, value)
+
+    def remove(self, _id):
+        """
+        Removes an item from the index
+        :param _id: item's id
+        :return: position of the item
+        """
+        position = self._positions.pop(_id)
+        if _id in self._keys:
+            is_value, keys = self._keys.pop(_id)
+            if is_value:
+                self._discard(self._values, keys, _id)
+            else:
+                for member in keys:
+                    self._discard(self._members, member, _id)
+        return position
+
+    def update(self, _id, attribs: dict):
+        """
+        Re-indexes an item whose data has changed, keeping its position
+        :param _id: item's id
+        :param attribs: item's new attribute dictionary
+        :return:
+        """
+        self.add(_id, attribs, position=self.remove(_id))
+
+    def _discard(self, index, key, _id):
+        index[key].discard(_id)
+        if not index[key]:
+            del index[key]
+
+    def match(self, value, mixed_dtypes=True) -> set:
+        """
+        :param value: single value, or list or set of single values, the attribute should be equal to (or in the case
+            of list or set attribute and mixed_dtypes, should contain)
+        :param mixed_dtypes: see genet.utils.graph_operations.Filter
+        :return: set of ids of items matching the condition
+        """
+        values = value if isinstance(value, (list, set)) else [value]
+        matches = set()
+        for value in values:
+            if _is_hashable(value):
+                matches |= self._values.get(value, set())
+                if mixed_dtypes:
+                    matches |= self._members.get(value, set())
+        return matches
+
+    def sorted(self, ids: Iterable) -> list:
+        """
+        :param ids: ids of items in the index
+        :return: list of `ids` in the order the items were added to the index
+        """
+        return sorted(ids, key=self._positions.__getitem__)
@@ -1,3 +1,4 @@
+import math
 import polyline
 import s2sphere as s2
 import networkx as nx
@@ -12,6 +13,13 @@ import genet.outputs_handler.geojson as gngeojson
 APPROX_EARTH_RADIUS = 6371008.8
 S2_LEVELS_FOR_SPATIAL_INDEXING = [0, 6, 8, 12, 18, 24, 30]
 
+# S2 lookup tables between (i, j) and Hilbert curve positions, shared with s2sphere
+_S2_LOOKUP_POS = np.array(s2.sphere.LOOKUP_POS, dtype=np.int64)
+_S2_LOOKUP_IJ = np.array(s2.sphere.LOOKUP_IJ, dtype=np.int64)
+_S2_LOOKUP_BITS = s2.sphere.LOOKUP_BITS
+_S2_MAX_LEVEL = s2.CellId.MAX_LEVEL
+_S2_MAX_SIZE = s2.CellId.MAX_SIZE
+
 
 def decode_polyline_to_s2_points(_polyline):
     """
@@ -19,7 +27,10 @@ def decode_polyline_to_s2_points(_polyline):
     :return:
     """
     decoded = polyline.decode(_polyline)
-    return [generate_index_s2(lat, lon) for lat, lon in decoded]
+    if not decoded:
+        return []
+    lats, lons = zip(*decoded)
+    return generate_indices_s2(lats, lons).tolist()
 
 
 def encode_shapely_linestring_to_polyline(linestring):
@@ -59,14 +70,9 @@ def compute_average_proximity_to_polyline(poly_1, poly_2):
     s2_poly_list_1 = decode_polyline_to_s2_points(poly_1)
     s2_poly_list_2 = decode_polyline_to_s2_points(poly_2)
 
-    closest_distances = []
-    for point in s2_poly_list_1:
-        d = None
-        for other_line_point in s2_poly_list_2:
-            dist = distance_between_s2cellids(point, other_line_point)
-            if (d is None) or (d > dist):
-                d = dist
-        closest_distances.append(d)
+    distances = distances_between_s2cellids(
+        np.repeat(s2_poly_list_1, len(s2_poly_list_2)), np.tile(s2_poly_list_2, len(s2_poly_list_1)))
+    closest_distances = distances.reshape(len(s2_poly_list_1), len(s2_poly_list_2)).min(axis=1).tolist()
     return statistics.mean(closest_distances)
 
 
@@ -95,6 +101,153 @@ def generate_index_s2(lat, lng):
     return s2.CellId.from_lat_lng(s2.LatLng.from_degrees(lat, lng)).id()
 
 
+def _libm(func, *arrays):
+    """
+    Applies a function from the math module to each element of the arrays. NumPy's own (SIMD) trigonometric
+    functions can differ from the C library ones in the last bit, which is enough to move a point to a neighbouring
+    S2 cell, so this is used only when generating s2.CellIds, which need to match s2sphere exactly. Decoding cells and
+    distances use NumPy and agree with s2sphere to within floating point error
+    :param func: function from the math module, e.g. math.sin
+    :param arrays: 1D float arrays of the same length
+    :return: 1D float array
+    """
+    return np.fromiter(map(func, *[a.tolist() for a in arrays]), dtype=float, count=len(arrays[0]))
+
+
+def generate_indices_s2(lats, lngs):
+    """
+    Returns s2.CellIds (leaf cells) for many points at once, same as generate_index_s2 for each point
+    :param lats: iterable of latitudes
+    :param lngs: iterable of longitudes, same length as lats
+    :return: np.array of np.uint64 s2.CellIds, `.tolist()` gives python ints
+    """
+    phi = np.radians(np.asarray(lats, dtype=float).ravel())
+    theta = np.radians(np.asarray(lngs, dtype=float).ravel())
+    if not (np.isfinite(phi).all() and np.isfinite(theta).all()):
+        raise ValueError('Latitudes and longitudes need to be finite numbers to generate s2.CellIds')
+
+    # LatLng.to_point
+    cosphi = _libm(math.cos, phi)
+    x = _libm(math.cos, theta) * cosphi
+    y = _libm(math.sin, theta) * cosphi
+    z = _libm(math.sin, phi)
+
+    # xyz_to_face_uv
+    ax, ay, az = np.abs(x), np.abs(y), np.abs(z)
+    face = np.where(ax > ay, np.where(ax > az, 0, 2), np.where(ay > az, 1, 2))
+    face = face + 3 * (np.choose(face, [x, y, z]) < 0)
+    denominator = np.choose(face, [x, y, z, x, y, z])
+    u = np.choose(face, [y, -x, -x, z, z, -y]) / denominator
+    v = np.choose(face, [z, z, -y, y, -x, -x]) / denominator
+
+    # CellId.from_face_ij
+    i, j = _s2_uv_to_ij(u), _s2_uv_to_ij(v)
+    n = face.astype(np.int64) << (2 * _S2_MAX_LEVEL)
+    bits = face & s2.sphere.SWAP_MASK
+    mask = (1 << _S2_LOOKUP_BITS) - 1
+    for k in range(7, -1, -1):
+        bits = bits + (((i >> (k * _S2_LOOKUP_BITS)) & mask) << (_S2_LOOKUP_BITS + 2))
+        bits = bits + (((j >> (k * _S2_LOOKUP_BITS)) & mask) << 2)
+        bits = _S2_LOOKUP_POS[bits]
+        n |= (bits >> 2) << (k * 2 * _S2_LOOKUP_BITS)
+        bits &= (s2.sphere.SWAP_MASK | s2.sphere.INVERT_MASK)
+    return (n.astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+
+
+def _s2_uv_to_ij(u):
+    # CellId.uv_to_st and CellId.st_to_ij for the quadratic projection
+    with np.errstate(invalid='ignore'):
+        s = np.where(u >= 0, 0.5 * np.sqrt(1 + 3 * u), 1 - 0.5 * np.sqrt(1 - 3 * u))
+    return np.clip(np.floor(_S2_MAX_SIZE * s), 0, _S2_MAX_SIZE - 1).astype(np.int64)
+
+
+def _s2_indices_to_radians(s2_ids):
+    """
+    Centres of s2.CellIds, same as s2.CellId.to_lat_lng for each cell, to within floating point error
+    :param s2_ids: iterable of int s2.CellIds
+    :return: two np.arrays, latitudes and longitudes in radians
+    """
+    ids = np.asarray(s2_ids, dtype=np.uint64).ravel()
+
+    # CellId.to_face_ij_orientation
+    face = (ids >> np.uint64(2 * _S2_MAX_LEVEL + 1)).astype(np.int64)
+    i = np.zeros(len(ids), dtype=np.int64)
+    j = np.zeros(len(ids), dtype=np.int64)
+    bits = face & s2.sphere.SWAP_MASK
+    for k in range(7, -1, -1):
+        nbits = _S2_MAX_LEVEL - 7 * _S2_LOOKUP_BITS if k == 7 else _S2_LOOKUP_BITS
+        position = (ids >> np.uint64(k * 2 * _S2_LOOKUP_BITS + 1)) & np.uint64((1 << (2 * nbits)) - 1)
+        bits = _S2_LOOKUP_IJ[bits + (position.astype(np.int64) << 2)]
+        i += (bits >> (_S2_LOOKUP_BITS + 2)) << (k * _S2_LOOKUP_BITS)
+        j += ((bits >> 2) & ((1 << _S2_LOOKUP_BITS) - 1)) << (k * _S2_LOOKUP_BITS)
+        bits &= (s2.sphere.SWAP_MASK | s2.sphere.INVERT_MASK)
+
+    # CellId.get_center_si_ti
+    is_leaf = (ids & np.uint64(1)) != 0
+    odd = ((i & 1) ^ ((ids >> np.uint64(2)) & np.uint64(1)).astype(np.int64)) != 0
+    delta = np.where(is_leaf, 1, np.where(odd, 2, 0))
+    u = _s2_st_to_uv((0.5 / _S2_MAX_SIZE) * (2 * i + delta))
+    v = _s2_st_to_uv((0.5 / _S2_MAX_SIZE) * (2 * j + delta))
+
+    # face_uv_to_xyz and LatLng.from_point
+    one = np.ones(len(ids))
+    x = np.choose(face, [one, -u, -u, -one, v, v])
+    y = np.choose(face, [u, one, -v, -v, -one, u])
+    z = np.choose(face, [v, v, one, -u, -u, -one])
+    return np.arctan2(z, np.sqrt(x * x + y * y)), np.arctan2(y, x)
+
+
+def _s2_st_to_uv(s):
+    # CellId.st_to_uv for the quadratic projection
+    return np.where(s >= 0.5, (1.0 / 3.0) * (4 * s * s - 1), (1.0 / 3.0) * (1 - 4 * (1 - s) * (1 - s)))
+
+
+def decode_indices_s2(s2_ids):
+    """
+    Returns centres of many s2.CellIds at once, same as s2.CellId.to_lat_lng for each cell, to within floating point
+    error
+    :param s2_ids: iterable of int s2.CellIds
+    :return: two np.arrays, latitudes and longitudes in degrees
+    """
+    lats, lngs = _s2_indices_to_radians(s2_ids)
+    return np.degrees(lats), np.degrees(lngs)
+
+
+def _angular_distance(lats_1, lngs_1, lats_2, lngs_2):
+    # s2.LatLng.get_distance, haversine formula, inputs and output in radians
+    dlat = np.sin(0.5 * (lats_2 - lats_1))
+    dlng = np.sin(0.5 * (lngs_2 - lngs_1))
+    x = dlat * dlat + dlng * dlng * np.cos(lats_1) * np.cos(lats_2)
+    return 2 * np.arctan2(np.sqrt(x), np.sqrt(np.maximum(0.0, 1.0 - x)))
+
+
+def great_circle_distance(lats_1, lngs_1, lats_2, lngs_2):
+    """
+    Great-circle (haversine) distances between pairs of points, in metres
+    :param lats_1: iterable of latitudes of the first points
+    :param lngs_1: iterable of longitudes of the first points
+    :param lats_2: iterable of latitudes of the second points
+    :param lngs_2: iterable of longitudes of the second points
+    :return: np.array of distances
+    """
+    lats_1, lngs_1, lats_2, lngs_2 = [np.radians(np.asarray(a, dtype=float).ravel())
+                                      for a in [lats_1, lngs_1, lats_2, lngs_2]]
+    return _angular_distance(lats_1, lngs_1, lats_2, lngs_2) * APPROX_EARTH_RADIUS
+
+
+def distances_between_s2cellids(s2_ids_1, s2_ids_2):
+    """
+    Distances between pairs of s2.CellIds, same as distance_between_s2cellids for each pair, to within floating point
+    error
+    :param s2_ids_1: iterable of int s2.CellIds
+    :param s2_ids_2: iterable of int s2.CellIds, same length as s2_ids_1
+    :return: np.array of distances in metres
+    """
+    lats_1, lngs_1 = _s2_indices_to_radians(s2_ids_1)
+    lats_2, lngs_2 = _s2_indices_to_radians(s2_ids_2)
+    return _angular_distance(lats_1, lngs_1, lats_2, lngs_2) * APPROX_EARTH_RADIUS
+
+
 def generate_s2_geometry(points):
     """
     Generate ordered list of s2.CellIds
@@ -104,9 +257,13 @@ def generate_s2_geometry(points):
     if isinstance(points, LineString):
         points = list(points.coords)
     try:
-        return [generate_index_s2(pt.x, pt.y) for pt in points]
+        coords = [(pt.x, pt.y) for pt in points]
     except AttributeError:
-        return [generate_index_s2(pt[0], pt[1]) for pt in points]
+        coords = [(pt[0], pt[1]) for pt in points]
+    if not coords:
+        return []
+    lats, lngs = zip(*coords)
+    return generate_indices_s2(lats, lngs).tolist()
 
 
 def distance_between_s2cellids(s2cellid1, s2cellid2):
@@ -126,6 +283,18 @@ def change_proj(x, y, crs_transformer):
     return crs_transformer.transform(x, y)
 
 
+def change_proj_arrays(x, y, crs_transformer):
+    """
+    Transforms many points in one call to the transformer, same as change_proj for each point
+    :param x: iterable of x coordinates
+    :param y: iterable of y coordinates, same length as x
+    :param crs_transformer: pyproj crs transformer
+    :return: two lists of floats, transformed x and y coordinates
+    """
+    x, y = crs_transformer.transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.asarray(x).tolist(), np.asarray(y).tolist()
+
+
 def grow_point(x, distance):
     return x.buffer(distance)
 
@@ -159,6 +328,108 @@ def approximate_metres_distance_in_4326_degrees(distance, lat):
     return ((float(distance) / 111111) + float(distance) / (111111 * np.cos(np.radians(float(lat))))) / 2
 
 
+class SpatialIndex:
+    """
+    R-tree index over geometries of nodes or links, answers spatial queries without testing every geometry.
+    Results are returned in the order of the GeoDataFrame the index was built from.
+
+    Parameters
+    ----------
+    :param gdf: GeoDataFrame with `id` and `geometry` columns
+    :param sources: containers the geometries come from, e.g. the graph, used to check whether the index is stale
+    """
+
+    def __init__(self, gdf: gpd.GeoDataFrame, sources: tuple = ()):
+        self.gdf = gdf[['id', 'geometry']]
+        self.ids = self.gdf['id'].to_numpy()
+        self.sources = sources
+
+    def describes(self, *sources) -> bool:
+        """
+        :param sources: containers the geometries come from, same as those passed to the index on initialisation
+        :return: True if the index was built from `sources`
+        """
+        return len(sources) == len(self.sources) and all(s == _s for s, _s in zip(sources, self.sources))
+
+    def intersecting(self, geometry) -> list:
+        """
+        :param geometry: shapely.geometry object
+        :return: ids of geometries intersecting `geometry`
+        """
+        return self._query(geometry, predicate='intersects')
+
+    def within(self, geometry) -> list:
+        """
+        :param geometry: shapely.geometry object
+        :return: ids of geometries within `geometry`
+        """
+        # a geometry in the index is within `geometry` if `geometry` contains it
+        return self._query(geometry, predicate='contains')
+
+    def _query(self, geometry, predicate):
+        if self.gdf.empty:
+            return []
+        positions = np.sort(self.gdf.sindex.query(geometry, predicate=predicate))
+        return list(self.ids[positions])
+
+
+class S2Index:
+    """
+    Index of items (e.g. nodes or links) by the S2 leaf cells they cover (e.g. node's `s2_id` or points along a link).
+    Cells are held in a sorted numpy array, so a region given as an S2 cell union is found with two `searchsorted`
+    range lookups per cell of the union, whatever its level, rather than testing each item.
+    Results are returned in the order of the items the index was built from.
+
+    Parameters
+    ----------
+    :param ids: ids of the items
+    :param s2_geometries: one list of S2 leaf cell ids (ints) for each item in `ids`
+    :param sources: containers the data comes from, e.g. the graph, used to check whether the index is stale
+    """
+
+    def __init__(self, ids: list, s2_geometries: list, sources: tuple = ()):
+        self.ids = list(ids)
+        self.sources = sources
+        self._counts = np.array([len(s2_geometry) for s2_geometry in s2_geometries], dtype=np.int64)
+        cells = np.array([cell for s2_geometry in s2_geometries for cell in s2_geometry], dtype=np.uint64)
+        owners = np.repeat(np.arange(len(self.ids)), self._counts)
+        order = np.argsort(cells, kind='stable')
+        self._cells = cells[order]
+        self._owners = owners[order]
+
+    def describes(self, *sources) -> bool:
+        """
+        :param sources: containers the data comes from, same as those passed to the index on initialisation
+        :return: True if the index was built from `sources`
+        """
+        return len(sources) == len(self.sources) and all(s == _s for s, _s in zip(sources, self.sources))
+
+    def _number_of_cells_in(self, cell_union: s2.CellUnion):
+        ranges = np.array([(cell.range_min().id(), cell.range_max().id()) for cell in cell_union.cell_ids()],
+                          dtype=np.uint64).reshape(-1, 2)
+        starts = np.searchsorted(self._cells, ranges[:, 0], side='left')
+        ends = np.searchsorted(self._cells, ranges[:, 1], side='right')
+        in_union = np.zeros(len(self._cells) + 1, dtype=np.int64)
+        np.add.at(in_union, starts, 1)
+        np.add.at(in_union, ends, -1)
+        in_union = np.cumsum(in_union)[:len(self._cells)] > 0
+        return np.bincount(self._owners[in_union], minlength=len(self.ids))
+
+    def intersecting(self, cell_union: s2.CellUnion) -> list:
+        """
+        :param cell_union: s2sphere.CellUnion, e.g. output of `s2_hex_to_cell_union`
+        :return: ids of items with at least one of their cells in `cell_union`
+        """
+        return [self.ids[i] for i in np.flatnonzero(self._number_of_cells_in(cell_union) > 0)]
+
+    def within(self, cell_union: s2.CellUnion) -> list:
+        """
+        :param cell_union: s2sphere.CellUnion, e.g. output of `s2_hex_to_cell_union`
+        :return: ids of items with all of their cells in `cell_union`
+        """
+        return [self.ids[i] for i in np.flatnonzero(self._number_of_cells_in(cell_union) == self._counts)]
+
+
 class SpatialTree(nx.DiGraph):
     def __init__(self, n=None):
         super().__init__()
@@ -16,8 +16,9 @@ from genet.core import Network
 from genet.inputs_handler import matsim_reader
 from tests.test_outputs_handler_matsim_xml_writer import network_dtd, schedule_dtd
 from genet.schedule_elements import Route, Service, Schedule
-from genet.utils import plot, spatial
+from genet.utils import plot, spatial, graph_operations
 from genet.inputs_handler import read
+from genet import auxiliary_files
 from tests.fixtures import assert_semantically_equal, route, stop_epsg_27700, network_object_from_test_data, \
     full_fat_default_config_path, correct_schedule, vehicle_definitions_config_path
 
@@ -642,6 +643,63 @@ def test_link_attribute_data_under_keys_generates_key_for_nested_data(network1):
     assert 'attributes::osm:way:access::text' in df.columns
 
 
+def test_link_attribute_data_under_keys_with_attribute_store_matches_data_from_graph(network1):
+    network1.add_link('1', '101986', '101982', attribs={'freespeed': 10.0, 'modes': ['bus']})
+    keys = ['modes', 'freespeed', 'capacity', 'permlanes', {'attributes': {'osm:way:access': 'text'}}]
+    df = network1.link_attribute_data_under_keys(keys, index_name='id')
+    network1.enable_attribute_store()
+
+    assert_frame_equal(network1.link_attribute_data_under_keys(keys, index_name='id'), df)
+    assert_series_equal(network1.link_attribute_data_under_key('capacity'), pd.Series({'0': 600.0}))
+
+
+def test_node_attribute_data_under_keys_with_attribute_store_matches_data_from_graph(network1):
+    network1.add_node('1', {'x': 1.0, 'y': 2.0, 'lat': 1.0})
+    keys = ['x', 'y', 'lat', 'lon', 's2_id']
+    df = network1.node_attribute_data_under_keys(keys)
+    network1.enable_attribute_store()
+
+    assert_frame_equal(network1.node_attribute_data_under_keys(keys), df)
+
+
+def test_attribute_store_follows_changes_to_link_data(network1):
+    network1.enable_attribute_store()
+    network1.link_attribute_data_under_keys(['freespeed'])
+
+    network1.apply_attributes_to_links({'0': {'freespeed': 1.0, 'modes': ['bus']}})
+    assert_series_equal(network1.link_attribute_data_under_key('freespeed'), pd.Series({'0': 1.0}))
+    assert network1.links_on_modal_condition('bus') == ['0']
+
+    network1.apply_attributes_to_link('0', {'freespeed': 'fast'})
+    assert_series_equal(network1.link_attribute_data_under_key('freespeed'), pd.Series({'0': 'fast'}))
+
+
+def test_attribute_store_follows_changes_to_nodes_and_links(network1):
+    network1.enable_attribute_store()
+    network1.node_attribute_data_under_keys(['lat'])
+    network1.link_attribute_data_under_keys(['freespeed'])
+
+    network1.add_link('1', '101986', '101982', attribs={'freespeed': 10.0, 'modes': ['car']})
+    network1.reindex_node('101982', '5')
+    network1.reindex_link('0', '10')
+
+    assert_series_equal(network1.link_attribute_data_under_key('freespeed'),
+                        pd.Series({'1': 10.0, '10': 4.166666666666667}))
+    assert set(network1.node_attribute_data_under_key('lat').index) == {'5', '101986'}
+    assert network1.links_on_modal_condition('car') == ['1', '10']
+
+    network1.remove_link('1')
+    assert network1.links_on_modal_condition('car') == ['10']
+
+
+def test_attribute_store_follows_replaced_link_id_mapping(network1):
+    network1.enable_attribute_store()
+    assert network1.links_on_modal_condition('car') == ['0']
+
+    network1.link_id_mapping = {'x': network1.link_id_mapping['0']}
+    assert network1.links_on_modal_condition('car') == ['x']
+
+
 def test_add_node_adds_node_to_graph_with_attribs():
     n = Network('epsg:27700')
     n.add_node(1, {'a': 1})
@@ -750,6 +808,15 @@ def test_add_link_adds_edge_to_graph_with_attribs():
     assert n.edge(1, 2) == {0: {'a': 1, 'from': 1, 'id': '0', 'to': 2}}
 
 
+def test_add_link_change_log_keeps_attributes_as_added_after_modes_are_changed_in_place():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'modes': {'car'}})
+
+    n.link('0')['modes'].add('walk')
+
+    assert ast.literal_eval(n.change_log.loc[0, 'new_attributes'])['modes'] == {'car'}
+
+
 def test_add_link_adds_edge_to_graph_without_attribs():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2)
@@ -940,6 +1007,53 @@ def test_network_modal_subgraph_using_specific_modal_subgraph_method_several_mod
     assert list(car_bike_graph.edges) == [(1, 2, 0), (2, 3, 0), (2, 3, 1)]
 
 
+def test_network_modal_subgraph_is_reused_for_the_same_modes():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike']})
+    n.add_link('1', 2, 3, attribs={'modes': ['car']})
+
+    assert n.modal_subgraph(modes=['car', 'bike']) is n.modal_subgraph(modes=['bike', 'car'])
+    assert n.modal_subgraph(modes='car') is n.modal_subgraph(modes=['car'])
+
+
+def test_network_modal_subgraph_is_read_only():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike']})
+
+    with pytest.raises(nx.NetworkXError):
+        n.modal_subgraph(modes='car').add_edge(2, 3)
+
+
+def test_network_modal_subgraph_shows_changes_to_link_data():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike'], 'length': 1})
+    car_graph = n.modal_subgraph(modes='car')
+
+    n.apply_attributes_to_link('0', {'length': 10})
+    assert car_graph[1][2][0]['length'] == 10
+    assert n.modal_subgraph(modes='car') is car_graph
+
+
+def test_network_modal_subgraph_follows_changes_to_modes_and_links():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike']})
+    n.add_link('1', 2, 3, attribs={'modes': ['car']})
+    assert list(n.modal_subgraph(modes='car').edges) == [(1, 2, 0), (2, 3, 0)]
+
+    n.apply_attributes_to_links({'1': {'modes': ['bike']}})
+    assert list(n.modal_subgraph(modes='car').edges) == [(1, 2, 0)]
+
+    n.add_link('2', 3, 4, attribs={'modes': ['car']})
+    assert list(n.modal_subgraph(modes='car').edges) == [(1, 2, 0), (3, 4, 0)]
+
+    n.remove_link('0')
+    assert list(n.modal_subgraph(modes='car').edges) == [(3, 4, 0)]
+
+    n.graph.add_edge(4, 5, modes=['car'])
+    n.link_id_mapping['3'] = {'from': 4, 'to': 5, 'multi_edge_idx': 0}
+    assert list(n.modal_subgraph(modes='car').edges) == [(3, 4, 0), (4, 5, 0)]
+
+
 def test_links_on_modal_condition():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike']})
@@ -951,6 +1065,109 @@ def test_links_on_modal_condition():
     assert set(car_links) == {'0', '1'}
 
 
+@pytest.fixture()
+def network_with_osm_highway_tags():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike'],
+                                   'attributes': {'osm:way:highway': {'name': 'osm:way:highway', 'text': 'primary'}}})
+    n.add_link('1', 2, 3, attribs={'modes': ['car'],
+                                   'attributes': {'osm:way:highway': {'name': 'osm:way:highway', 'text': 'primary'}}})
+    n.add_link('2', 2, 3, attribs={'modes': ['bike'],
+                                   'attributes': {'osm:way:highway': {'name': 'osm:way:highway', 'text': 'cycleway'}}})
+    n.add_link('3', 3, 4, attribs={'modes': ['walk']})
+    return n
+
+
+def test_extract_links_on_edge_attributes_with_attribute_index(network_with_osm_highway_tags, mocker):
+    network_with_osm_highway_tags.build_attribute_index({'attributes': {'osm:way:highway': 'text'}})
+    mocker.spy(graph_operations, 'extract_on_attributes')
+
+    links = network_with_osm_highway_tags.extract_links_on_edge_attributes(
+        conditions={'attributes': {'osm:way:highway': {'text': 'primary'}}})
+    assert links == ['0', '1']
+    links = network_with_osm_highway_tags.extract_links_on_edge_attributes(
+        conditions={'attributes': {'osm:way:highway': {'text': ['cycleway', 'primary']}}})
+    assert links == ['0', '1', '2']
+    assert not graph_operations.extract_on_attributes.called
+
+
+def test_extract_links_on_edge_attributes_combines_conditions_on_attribute_indices(network_with_osm_highway_tags):
+    network_with_osm_highway_tags.build_attribute_index({'attributes': {'osm:way:highway': 'text'}})
+    network_with_osm_highway_tags.build_attribute_index('modes')
+    conditions = [{'attributes': {'osm:way:highway': {'text': 'primary'}}}, {'modes': 'bike'}]
+
+    assert network_with_osm_highway_tags.extract_links_on_edge_attributes(conditions, how=all) == ['0']
+    assert network_with_osm_highway_tags.extract_links_on_edge_attributes(conditions, how=any) == ['0', '1', '2']
+
+
+def test_extract_links_on_edge_attributes_falls_back_on_conditions_not_covered_by_indices(
+        network_with_osm_highway_tags, mocker):
+    network_with_osm_highway_tags.build_attribute_index('modes')
+    mocker.spy(graph_operations, 'extract_on_attributes')
+
+    links = network_with_osm_highway_tags.extract_links_on_edge_attributes(
+        conditions=[{'modes': 'bike'}, {'attributes': {'osm:way:highway': {'text': 'primary'}}}], how=all)
+    assert links == ['0']
+    assert graph_operations.extract_on_attributes.called
+
+
+def test_attribute_index_follows_changes_to_links(network_with_osm_highway_tags):
+    n = network_with_osm_highway_tags
+    n.build_attribute_index('modes')
+
+    n.apply_attributes_to_links({'3': {'modes': ['walk', 'car']}})
+    n.apply_attributes_to_link('1', {'modes': ['bus']})
+    n.add_link('4', 4, 5, attribs={'modes': ['car']})
+    n.add_links({'5': {'from': 5, 'to': 6, 'modes': ['car']}})
+    n.remove_link('0')
+    n.reindex_link('3', '30')
+    n.reindex_nodes({4: 40})
+    n.remove_node(6)
+
+    assert n.extract_links_on_edge_attributes({'modes': 'car'}) == ['4', '30']
+    assert n.extract_links_on_edge_attributes({'modes': ['bus', 'bike']}) == ['1', '2']
+    assert n.extract_links_on_edge_attributes({'modes': 'car'}) == graph_operations.extract_on_attributes(
+        n.links(), conditions={'modes': 'car'})
+
+
+def test_attribute_index_is_rebuilt_after_changes_to_edges(network_with_osm_highway_tags):
+    network_with_osm_highway_tags.build_attribute_index('modes')
+    network_with_osm_highway_tags.apply_attributes_to_edge(2, 3, {'modes': ['car']})
+
+    assert network_with_osm_highway_tags.extract_links_on_edge_attributes({'modes': 'car'}) == ['0', '1', '2']
+
+
+def test_dropping_attribute_index_stops_it_being_used(network_with_osm_highway_tags, mocker):
+    network_with_osm_highway_tags.build_attribute_index('modes')
+    network_with_osm_highway_tags.drop_attribute_index('modes')
+    mocker.spy(graph_operations, 'extract_on_attributes')
+
+    assert network_with_osm_highway_tags.extract_links_on_edge_attributes({'modes': 'walk'}) == ['3']
+    assert graph_operations.extract_on_attributes.called
+
+
+def test_attribute_index_context_drops_index_it_built(network_with_osm_highway_tags, mocker):
+    mocker.spy(graph_operations, 'extract_on_attributes')
+
+    with network_with_osm_highway_tags.attribute_index('modes'):
+        assert network_with_osm_highway_tags.extract_links_on_edge_attributes({'modes': 'walk'}) == ['3']
+        assert not graph_operations.extract_on_attributes.called
+
+    assert network_with_osm_highway_tags.extract_links_on_edge_attributes({'modes': 'walk'}) == ['3']
+    assert graph_operations.extract_on_attributes.called
+
+
+def test_attribute_index_context_keeps_index_built_before(network_with_osm_highway_tags, mocker):
+    network_with_osm_highway_tags.build_attribute_index('modes')
+    mocker.spy(graph_operations, 'extract_on_attributes')
+
+    with network_with_osm_highway_tags.attribute_index('modes'):
+        pass
+
+    assert network_with_osm_highway_tags.extract_links_on_edge_attributes({'modes': 'walk'}) == ['3']
+    assert not graph_operations.extract_on_attributes.called
+
+
 def test_nodes_on_modal_condition():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike']})
@@ -1074,6 +1291,35 @@ def test_links_on_spatial_condition_with_containement_and_complex_geometry_that_
     assert set(links) == {'1'}
 
 
+def test_spatial_index_is_reused_between_spatial_queries(network_object_from_test_data, mocker):
+    mocker.spy(Network, 'to_geodataframe')
+    region = Polygon([(-0.1487016677856445, 51.52556684350165), (-0.14063358306884766, 51.5255134425896),
+                      (-0.13865947723388672, 51.5228700191647), (-0.14093399047851562, 51.52006622056997),
+                      (-0.1492595672607422, 51.51974577545329), (-0.1508045196533203, 51.52276321095246),
+                      (-0.1487016677856445, 51.52556684350165)])
+    for i in range(3):
+        assert set(network_object_from_test_data.nodes_on_spatial_condition(region)) == {'21667818', '25508485'}
+        assert set(network_object_from_test_data.links_on_spatial_condition(region)) == {'1'}
+    assert Network.to_geodataframe.call_count == 2
+
+
+def test_spatial_index_follows_changes_to_network(network_object_from_test_data):
+    region = Polygon([(-0.1487016677856445, 51.52556684350165), (-0.14063358306884766, 51.5255134425896),
+                      (-0.13865947723388672, 51.5228700191647), (-0.14093399047851562, 51.52006622056997),
+                      (-0.1492595672607422, 51.51974577545329), (-0.1508045196533203, 51.52276321095246),
+                      (-0.1487016677856445, 51.52556684350165)])
+    assert set(network_object_from_test_data.nodes_on_spatial_condition(region)) == {'21667818', '25508485'}
+    assert set(network_object_from_test_data.links_on_spatial_condition(region)) == {'1'}
+
+    network_object_from_test_data.apply_attributes_to_node('25508485', {'x': 508400, 'y': 162050})
+    network_object_from_test_data.reindex_link('1', '10')
+    network_object_from_test_data.add_link('2', u='21667818', v='21667818')
+
+    assert set(network_object_from_test_data.nodes_on_spatial_condition(region)) == {'21667818'}
+    assert set(network_object_from_test_data.links_on_spatial_condition(region)) == {'10', '2'}
+    assert set(network_object_from_test_data.links_on_spatial_condition(region, how='within')) == {'2'}
+
+
 def test_find_shortest_path_when_graph_has_no_extra_edge_choices():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={'modes': ['car', 'bike'], 'length': 1})
@@ -1195,6 +1441,22 @@ def test_reindex_node(network1):
                        check_dtype=False)
 
 
+def test_reindex_node_updates_links_going_in_and_out_of_the_node():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 2, 3)
+    n.add_link('2', 3, 1)
+
+    n.reindex_node(1, 'new_1')
+
+    assert n.out_links('new_1') == {'0'}
+    assert n.in_links('new_1') == {'2'}
+    assert n.out_links(1) == set()
+    assert n.in_links(1) == set()
+    assert n.link('0')['from'] == 'new_1'
+    assert n.link('2')['to'] == 'new_1'
+
+
 def test_reindex_node_when_node_id_already_exists(network1):
     assert [id for id, attribs in network1.nodes()] == ['101982', '101986']
     assert [id for id, attribs in network1.links()] == ['0']
@@ -1211,6 +1473,100 @@ def test_reindex_node_when_node_id_already_exists(network1):
     assert network1.node(node_ids[0]) != network1.node(node_ids[1])
 
 
+def test_reindex_nodes_relabels_nodes_and_links_going_in_and_out_of_them():
+    n = Network('epsg:27700')
+    n.add_nodes({'1': {'x': 1}, '2': {'x': 2}, '3': {'x': 3}})
+    n.add_link('0', '1', '2')
+    n.add_link('1', '2', '3')
+
+    mapping = n.reindex_nodes({'1': 'a', '2': 'b'})
+
+    assert mapping == {'1': 'a', '2': 'b'}
+    assert set(n.graph.nodes) == {'a', 'b', '3'}
+    assert n.node('a') == {'x': 1, 'id': 'a'}
+    assert n.link('0')['from'] == 'a'
+    assert n.link('0')['to'] == 'b'
+    assert n.link('1')['from'] == 'b'
+    assert n.link_id_mapping['0'] == {'from': 'a', 'to': 'b', 'multi_edge_idx': 0}
+    assert n.link_id_mapping['1'] == {'from': 'b', 'to': '3', 'multi_edge_idx': 0}
+    assert n.out_links('a') == {'0'}
+    assert n.in_links('3') == {'1'}
+
+
+def test_reindex_nodes_records_one_change_log_event_for_nodes_and_one_for_links():
+    n = Network('epsg:27700')
+    n.add_link('0', '1', '2')
+    n.add_link('1', '2', '3')
+    log_length = len(n.change_log)
+
+    n.reindex_nodes({'1': 'a', '2': 'b'})
+
+    new_log = n.change_log.iloc[log_length:]
+    assert list(new_log['object_type']) == ['node', 'node', 'link', 'link']
+    assert set(new_log['timestamp']) == {new_log['timestamp'].iloc[0]}
+
+
+def test_reindex_nodes_swaps_node_ids():
+    n = Network('epsg:27700')
+    n.add_link('0', '1', '2')
+
+    n.reindex_nodes({'1': '2', '2': '1'})
+
+    assert n.link('0')['from'] == '2'
+    assert n.link('0')['to'] == '1'
+    assert n.graph.has_edge('2', '1')
+    assert not n.graph.has_edge('1', '2')
+
+
+def test_reindex_nodes_generates_new_index_when_node_id_already_exists():
+    n = Network('epsg:27700')
+    n.add_link('0', '1', '2')
+
+    mapping = n.reindex_nodes({'1': '2'})
+
+    assert mapping['1'] not in {'1', '2'}
+    assert set(n.graph.nodes) == {mapping['1'], '2'}
+    assert n.link('0')['from'] == mapping['1']
+
+
+def test_reindex_links_changes_link_ids():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 2, 3)
+
+    mapping = n.reindex_links({'0': 'a', '1': 'b'})
+
+    assert mapping == {'0': 'a', '1': 'b'}
+    assert set(n.link_id_mapping) == {'a', 'b'}
+    assert n.link('a') == {'from': 1, 'to': 2, 'id': 'a'}
+    assert n.link('b') == {'from': 2, 'to': 3, 'id': 'b'}
+    assert n.out_links(1) == {'a'}
+    assert n.in_links(3) == {'b'}
+    assert list(n.change_log.tail(2)['new_id']) == ['a', 'b']
+
+
+def test_reindex_links_swaps_link_ids():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 2, 3)
+
+    n.reindex_links({'0': '1', '1': '0'})
+
+    assert n.link('1') == {'from': 1, 'to': 2, 'id': '1'}
+    assert n.link('0') == {'from': 2, 'to': 3, 'id': '0'}
+
+
+def test_reindex_links_generates_new_index_when_link_id_already_exists():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 2, 3)
+
+    mapping = n.reindex_links({'0': '1'})
+
+    assert mapping['0'] not in {'0', '1'}
+    assert set(n.link_id_mapping) == {mapping['0'], '1'}
+
+
 def test_reindex_link(network1):
     assert [id for id, attribs in network1.nodes()] == ['101982', '101986']
     assert [id for id, attribs in network1.links()] == ['0']
@@ -1428,6 +1784,18 @@ def test_modify_link_adds_attributes_in_the_graph_and_change_is_recorded_by_chan
     assert_frame_equal(n.change_log[cols_to_compare], correct_change_log_df[cols_to_compare], check_dtype=False)
 
 
+def test_modifying_nested_link_attributes_records_data_from_before_the_change_in_change_log():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'attributes': {'osm:way:lanes': {'text': '1'}, 'osm:way:name': {'text': 'a'}}})
+    n.apply_attributes_to_links({'0': {'attributes': {'osm:way:lanes': {'text': '2'}}}})
+    n.apply_attributes_to_link('0', {'attributes': {'osm:way:lanes': {'text': '3'}}})
+
+    assert n.link('0')['attributes'] == {'osm:way:lanes': {'text': '3'}, 'osm:way:name': {'text': 'a'}}
+    assert list(n.change_log['diff'])[1:] == [
+        [('change', 'attributes.osm:way:lanes.text', ('1', '2'))],
+        [('change', 'attributes.osm:way:lanes.text', ('2', '3'))]]
+
+
 def test_modify_link_overwrites_existing_attributes_in_the_graph_and_change_is_recorded_by_change_log():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={'a': 1})
@@ -1511,6 +1879,67 @@ def test_resolves_link_id_clashes_by_mapping_clashing_link_to_a_new_id(mocker):
     assert n.link_id_mapping['0'] == {'from': 1, 'to': 2, 'multi_edge_idx': 0}
 
 
+def test_in_and_out_links_of_nodes():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 1, 2)
+    n.add_links({'2': {'from': 2, 'to': 3}, '3': {'from': 3, 'to': 1}})
+
+    assert n.out_links(1) == {'0', '1'}
+    assert n.in_links(1) == {'3'}
+    assert n.in_links(2) == {'0', '1'}
+    assert n.out_links(2) == {'2'}
+
+
+def test_in_and_out_links_of_nodes_after_reindexing_and_removing_links():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 1, 2)
+    n.add_link('2', 2, 3)
+
+    n.reindex_link('0', '10')
+    n.remove_link('1')
+    n.remove_links(['2'])
+
+    assert n.out_links(1) == {'10'}
+    assert n.in_links(2) == {'10'}
+    assert n.out_links(2) == set()
+    assert n.in_links(3) == set()
+
+
+def test_in_and_out_links_of_nodes_with_replaced_link_id_mapping():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.link_id_mapping = {'5': {'from': 2, 'to': 1, 'multi_edge_idx': 0}}
+
+    assert n.out_links(1) == set()
+    assert n.out_links(2) == {'5'}
+
+
+def test_removing_node_removes_ids_of_links_connected_to_the_node():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 2, 3)
+    n.add_link('2', 3, 1)
+
+    n.remove_node(1)
+
+    assert set(n.link_id_mapping) == {'1'}
+    assert [link_id for link_id, attribs in n.links()] == ['1']
+
+
+def test_removing_nodes_removes_ids_of_links_connected_to_the_nodes():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2)
+    n.add_link('1', 2, 3)
+    n.add_link('2', 3, 4)
+
+    n.remove_nodes([1, 4])
+
+    assert set(n.link_id_mapping) == {'1'}
+    assert n.out_links(3) == set()
+
+
 def test_removing_single_node():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={'a': 1})
@@ -1638,6 +2067,25 @@ def test_edges_gives_iterator_of_edge_from_to_nodes_and_attribs():
     assert list(n.edges()) == [(1, 2, {0: {}}), (2, 3, {0: {}}), (3, 4, {0: {}})]
 
 
+def test_edges_gives_multi_edges_between_the_same_nodes_once():
+    n = Network('epsg:27700')
+    n.graph.add_edges_from([(1, 2, {'a': 1}), (1, 2, {'a': 2}), (2, 3)])
+    assert list(n.edges()) == [(1, 2, {0: {'a': 1}, 1: {'a': 2}}), (2, 3, {0: {}})]
+
+
+def test_edges_without_copy_gives_read_only_views_of_attribs_stored_in_the_graph():
+    n = Network('epsg:27700')
+    n.graph.add_edge(1, 2, **{'attrib': 1})
+    [(u, v, data)] = list(n.edges(copy=False))
+    assert data == {0: {'attrib': 1}}
+    with pytest.raises(TypeError):
+        data[0]['attrib'] = 2
+    n.graph[1][2][0]['attrib'] = 3
+    assert n.edge(1, 2, copy=False)[0]['attrib'] == 3
+    assert n.edge(1, 2)[0] is n.graph[1][2][0]
+    assert isinstance(n.edge(1, 2), dict)
+
+
 def test_edge_method_gives_attributes_for_given_from_and_to_nodes():
     n = Network('epsg:27700')
     n.graph.add_edge(1, 2, **{'attrib': 1})
@@ -1652,6 +2100,30 @@ def test_links_gives_iterator_of_link_id_and_edge_attribs():
                                ('1', {'h': 1, 'from': 2, 'to': 3, 'id': '1'})]
 
 
+def test_links_without_copy_gives_read_only_views_of_attribs_stored_in_the_graph():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'f': 's'})
+    n.add_link('1', 1, 2, attribs={'h': 1})
+    links = list(n.links(copy=False))
+    assert links == list(n.links())
+    with pytest.raises(TypeError):
+        links[0][1]['f'] = 'x'
+    n.graph[1][2][1]['h'] = 2
+    assert links[1][1]['h'] == 2
+    assert n.link('1', copy=False)['h'] == 2
+    with pytest.raises(TypeError):
+        n.link('1', copy=False)['h'] = 3
+    assert n.link('1') is not n.graph[1][2][1]
+
+
+def test_route_distance_leaves_link_data_unchanged():
+    n = Network('epsg:27700')
+    n.add_link('0', 5221390309330528839, 5221390329378179879, attribs={'length': 1.0})
+    n.add_link('1', 5221390329378179879, 5221390301001263407)
+    assert n.route_distance(['0', '1']) > 1.0
+    assert 'length' not in n.link('1')
+
+
 def test_link_gives_link_attribs():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={'attrib': 1})
@@ -2077,6 +2549,30 @@ def test_generate_index_for_node_gives_uuid4_as_last_resort(mocker):
     uuid.uuid4.assert_called_once()
 
 
+def test_generate_index_for_node_gives_next_integer_string_after_highest_node_is_removed():
+    n = Network('epsg:27700')
+    n.add_nodes({'1': {}, '2': {}, '3': {}})
+    n.remove_node('3')
+    assert n.generate_index_for_node() == '3'
+
+
+def test_generate_index_for_node_avoids_nodes_added_to_graph_directly():
+    n = Network('epsg:27700')
+    n.add_node('1')
+    n.generate_index_for_node()
+    n.graph.add_node('3')
+    assert n.generate_index_for_node() == '4'
+
+
+def test_generate_index_for_node_avoids_nodes_in_replaced_graph():
+    n = Network('epsg:27700')
+    n.add_node('1')
+    n.generate_index_for_node()
+    n.graph = nx.MultiDiGraph()
+    n.graph.add_nodes_from(['10', '20'])
+    assert n.generate_index_for_node() == '21'
+
+
 def test_generating_n_indicies_for_nodes():
     n = Network('epsg:27700')
     n.add_nodes({str(i): {} for i in range(10)})
@@ -2109,6 +2605,22 @@ def test_generate_index_for_edge_gives_string_based_on_length_link_id_mapping_wh
     assert new_idx not in ['1x', 'x2']
 
 
+def test_generate_index_for_edge_avoids_link_ids_in_replaced_link_id_mapping():
+    n = Network('epsg:27700')
+    n.add_link('2', 1, 2)
+    n.generate_index_for_edge()
+    n.link_id_mapping = {'0': {}, '1': {}}
+    assert n.generate_index_for_edge() == '2'
+
+
+def test_generate_index_for_edge_fills_gap_left_by_removed_link():
+    n = Network('epsg:27700')
+    n.add_links({str(i): {'from': 0, 'to': 1} for i in range(5)})
+    n.remove_link('1')
+    assert n.generate_index_for_edge() == '1'
+    assert n.generate_indices_for_n_edges(2) == {'1', '5'}
+
+
 def test_index_graph_edges_generates_completely_new_index():
     n = Network('epsg:27700')
     n.add_link('1x', 1, 2)
@@ -2324,6 +2836,72 @@ def test_write_to_matsim_generates_change_log_csv(network_object_from_test_data,
     assert os.path.exists(expected_schedule_change_log_path)
 
 
+def test_network_with_change_log_turned_off_records_no_changes_to_network_or_schedule(network_object_from_test_data):
+    n = network_object_from_test_data
+    n.set_change_log_level('off')
+
+    n.add_link('new_link', '25508485', '21667818', attribs={'modes': ['car']})
+    n.apply_attributes_to_link('new_link', {'freespeed': 1})
+    n.schedule.apply_attributes_to_stops({'26997928P': {'name': 'new name'}})
+    n.remove_link('new_link')
+
+    assert n.change_log.empty
+    assert n.schedule.change_log().empty
+
+
+def test_network_with_change_log_sink_writes_all_changes_in_extras(network_object_from_test_data, tmpdir):
+    n = network_object_from_test_data
+    n.set_change_log_level('ids_only', path=os.path.join(tmpdir, 'network_change_log.csv.gz'))
+
+    n.add_links({'new_link_1': {'from': '25508485', 'to': '21667818', 'modes': ['car']},
+                 'new_link_2': {'from': '21667818', 'to': '25508485', 'modes': ['car']}})
+    n.remove_link('new_link_1')
+    n.write_extras(tmpdir)
+
+    change_log = pd.read_csv(os.path.join(tmpdir, 'network_change_log.csv'), index_col=0)
+    assert list(change_log['change_event']) == ['add', 'add', 'remove']
+    assert list(change_log['new_id'].fillna('')) == ['new_link_1', 'new_link_2', '']
+
+
+def test_changes_made_in_batch_are_visible_straight_away_and_recorded_as_bunches_when_done():
+    n = Network('epsg:27700')
+    n.add_nodes({'1': {'x': 1, 'y': 2}, '2': {'x': 2, 'y': 2}, '3': {'x': 3, 'y': 2}})
+    n.enable_attribute_store()
+    n.add_link('0', '1', '2', attribs={'modes': ['car'], 'freespeed': 1.0})
+    assert n.links_on_modal_condition('car') == ['0']
+    log_length = len(n.change_log)
+
+    with n.batch():
+        for i in range(3):
+            n.add_link(f'new_{i}', '2', '3', attribs={'modes': ['bus'], 'freespeed': 1.0})
+        for i in range(3):
+            n.apply_attributes_to_link('0', {'freespeed': float(i + 2)})
+            assert n.link('0')['freespeed'] == float(i + 2)
+        assert n.links_on_modal_condition('bus') == ['new_0', 'new_1', 'new_2']
+        n.remove_link('new_1')
+
+    new_log = n.change_log.iloc[log_length:]
+    assert list(new_log['change_event']) == ['add', 'add', 'add', 'modify', 'remove']
+    assert new_log.iloc[3]['diff'] == [('change', 'freespeed', (1.0, 4.0))]
+    assert n.link_attribute_data_under_key('freespeed').to_dict() == {'0': 4.0, 'new_0': 1.0, 'new_2': 1.0}
+    assert n.links_on_modal_condition('bus') == ['new_0', 'new_2']
+
+
+def test_batch_updates_auxiliary_files_once(aux_network, mocker):
+    mocker.spy(auxiliary_files.AuxiliaryFile, 'apply_map')
+
+    with aux_network.batch():
+        aux_network.reindex_link('1', '10')
+        aux_network.reindex_link('2', '20')
+        aux_network.remove_link('3')
+
+    assert auxiliary_files.AuxiliaryFile.apply_map.call_count == 1
+    aux_file = aux_network.auxiliary_files['link']['links_benchmark.json']
+    assert aux_file.map['1'] == '10'
+    assert aux_file.map['2'] == '20'
+    assert aux_file.map['3'] is None
+
+
 benchmark_path_json = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "test_data", "auxiliary_files", "links_benchmark.json"))
 benchmark_path_csv = os.path.abspath(
@@ -2364,6 +2942,17 @@ def test_removing_network_node_with_auxiliary_files(aux_network):
     assert aux_network.auxiliary_files['link']['links_benchmark.json'].map == {'2': '2', '1': '1', '3': '3', '4': '4'}
 
 
+def test_reindexing_network_nodes_with_auxiliary_files(aux_network):
+    aux_network.reindex_nodes({'3': '04', '4': '03'})
+    assert aux_network.auxiliary_files['node']['links_benchmark.csv'].map == {'2': '2', '3': '04', '4': '03', '1': '1'}
+
+
+def test_reindexing_network_links_with_auxiliary_files(aux_network):
+    aux_network.reindex_links({'1': '01', '4': '04'})
+    assert aux_network.auxiliary_files['link']['links_benchmark.json'].map == {'2': '2', '1': '01', '3': '3',
+                                                                               '4': '04'}
+
+
 def test_removing_network_link_with_auxiliary_files(aux_network):
     aux_network.remove_links(['1', '2'])
     aux_network.remove_link('3')
@@ -428,6 +428,23 @@ def test_getting_stops_on_spatial_condition_with_s2_hex_region(schedule):
     assert set(stops) == {'5', '6', '7', '8', '2', '4', '3', '1'}
 
 
+def test_s2_index_of_stops_is_reused_between_queries_on_s2_hex_region(schedule, mocker):
+    mocker.spy(spatial, 'S2Index')
+    schedule.stops_on_spatial_condition('4837,4839,483f5,4844,4849')
+    stops = schedule.stops_on_spatial_condition('4837,4839,483f5,4844,4849')
+
+    assert set(stops) == {'5', '6', '7', '8', '2', '4', '3', '1'}
+    assert spatial.S2Index.call_count == 1
+
+
+def test_s2_index_of_stops_is_rebuilt_after_changing_s2_id_of_stops(schedule):
+    schedule.stops_on_spatial_condition('4837,4839,483f5,4844,4849')
+    schedule.apply_attributes_to_stops({'1': {'s2_id': spatial.generate_index_s2(lat=0, lng=0)}})
+    stops = schedule.stops_on_spatial_condition('4837,4839,483f5,4844,4849')
+
+    assert set(stops) == {'5', '6', '7', '8', '2', '4', '3'}
+
+
 def test_getting_routes_intersecting_spatial_region(schedule):
     p = Polygon([(-7.6, 49.7), (-7.4, 49.7), (-7.4, 49.8), (-7.6, 49.8), (-7.6, 49.7)])
     routes = schedule.routes_on_spatial_condition(p)
@@ -654,6 +671,21 @@ def test_removing_service(schedule):
     assert not schedule._graph.graph['service_to_route_map']
 
 
+def test_changes_made_to_schedule_in_batch_are_recorded_in_change_log_when_done(schedule):
+    log_length = len(schedule.change_log())
+
+    with schedule.batch():
+        schedule.apply_attributes_to_routes({'1': {'route_long_name': 'a'}})
+        schedule.apply_attributes_to_routes({'1': {'route_long_name': 'b'}})
+        schedule.remove_route('2')
+        assert set(schedule.route_ids()) == {'1'}
+
+    new_log = schedule.change_log().iloc[log_length:]
+    assert list(new_log['change_event']) == ['modify', 'remove']
+    assert list(new_log['old_id']) == ['1', '2']
+    assert ('change', 'route_long_name', ('', 'b')) in new_log.iloc[0]['diff']
+
+
 def test_adding_route(schedule, route):
     route.reindex('new_id')
     schedule.add_route('service', route)
@@ -1092,6 +1124,16 @@ def test_build_graph_builds_correct_graph(strongly_connected_schedule):
                                '3': {'4': {'services': {'service'}, 'routes': {'1'}}}})
 
 
+def test_build_graph_does_not_share_data_between_stops(strongly_connected_schedule):
+    g = strongly_connected_schedule.graph()
+
+    g.nodes['1']['services'].add('other_service')
+    g.edges['1', '2']['routes'].add('other_route')
+
+    assert g.nodes['2']['services'] == {'service'}
+    assert g.edges['2', '3']['routes'] == {'1'}
+
+
 def test_building_trips_dataframe(schedule):
     df = schedule.route_trips_with_stops_to_dataframe()
 
@@ -1,6 +1,8 @@
 import json
 import os
 import sys
+import numpy as np
+import pandas as pd
 from pandas.testing import assert_frame_equal
 from tests.fixtures import *
 from genet.inputs_handler import gtfs_reader
@@ -15,6 +17,28 @@ def test_read_services_from_calendar_correct():
     assert services == ['6630', '6631']
 
 
+def test_read_services_from_calendar_in_zip_file():
+    services = gtfs_reader.read_services_from_calendar(gtfs_test_zip_file, '20190604')
+    assert services == ['6630', '6631']
+
+
+def test_services_from_calendar_selects_services_running_on_the_day():
+    calendar = [
+        {'service_id': 'weekday', 'monday': '1', 'tuesday': '1', 'wednesday': '1', 'thursday': '1', 'friday': '1',
+         'saturday': '0', 'sunday': '0', 'start_date': '20190603', 'end_date': '20200228'},
+        {'service_id': 'weekend', 'monday': '0', 'tuesday': '0', 'wednesday': '0', 'thursday': '0', 'friday': '0',
+         'saturday': '1', 'sunday': '1', 'start_date': '20190603', 'end_date': '20200228'}
+    ]
+    assert gtfs_reader.services_from_calendar(calendar, '20190604') == ['weekday']
+    assert gtfs_reader.services_from_calendar(calendar, '20190608') == ['weekend']
+
+
+def test_services_from_missing_calendar_throws_error():
+    with pytest.raises(RuntimeError) as e:
+        gtfs_reader.services_from_calendar(None, '20190604')
+    assert 'Calendar was not found' in str(e.value)
+
+
 def test_read_gtfs_to_db_like_tables_correct(correct_stop_times_db, correct_stops_db, correct_trips_db, correct_routes_db):
     stop_times_db, stops_db, trips_db, routes_db = gtfs_reader.read_gtfs_to_db_like_tables(gtfs_test_file)
 
@@ -24,6 +48,24 @@ def test_read_gtfs_to_db_like_tables_correct(correct_stop_times_db, correct_stop
     assert_frame_equal(routes_db, correct_routes_db)
 
 
+def test_read_gtfs_to_db_like_tables_for_services_reads_stop_times_of_their_trips_only():
+    stop_times_db, stops_db, trips_db, routes_db = gtfs_reader.read_gtfs_to_db_like_tables(
+        gtfs_test_zip_file, services=['6631'])
+
+    assert trips_db['trip_id'].to_list() == ['RT1']
+    assert_frame_equal(stop_times_db, pd.DataFrame(
+        {'trip_id': ['RT1', 'RT1'], 'arrival_time': np.array([12060, 12180], dtype=np.int32),
+         'departure_time': np.array([12060, 12180], dtype=np.int32), 'stop_id': ['RSN', 'RSE'],
+         'stop_sequence': np.array([0, 1], dtype=np.int8)}))
+
+
+def test_read_stop_times_of_trips_in_chunks_gives_same_result_as_in_one_go():
+    stop_times_file = os.path.join(gtfs_test_file, 'stop_times.txt')
+    assert_frame_equal(
+        gtfs_reader.read_stop_times_of_trips(stop_times_file, {'BT1', 'RT1'}, chunksize=1),
+        gtfs_reader.read_stop_times_of_trips(stop_times_file, {'BT1', 'RT1'}))
+
+
 def test_get_mode_returns_mode_if_given_int():
     assert gtfs_reader.get_mode(3) == 'bus'
 
@@ -36,6 +78,40 @@ def test_get_mode_returns_other_if_doesnt_recognise():
     assert gtfs_reader.get_mode('99999999') == 'other'
 
 
+def test_get_times_in_seconds_reads_times_past_midnight():
+    times = gtfs_reader.get_times_in_seconds(pd.Series(['03:21:00', '3:21:05', '25:00:01']))
+    assert times.tolist() == [12060, 12065, 90001]
+
+
+def test_seconds_to_hms_gives_time_of_day():
+    assert gtfs_reader.seconds_to_hms(np.array([0, 120, 12065, 90001])).tolist() == [
+        '00:00:00', '00:02:00', '03:21:05', '01:00:01']
+
+
+def test_gtfs_db_to_schedule_graph_groups_trips_with_the_same_stops_into_routes():
+    stop_times_db = pd.DataFrame({
+        'trip_id': ['T2', 'T2', 'T1', 'T1', 'T3', 'T4'],
+        'arrival_time': ['24:03:00', '24:00:00', '10:02:00', '10:00:00', '11:00:00', '12:00:00'],
+        'departure_time': ['24:03:30', '24:00:00', '10:02:30', '10:00:00', '11:00:00', '12:00:00'],
+        'stop_id': ['B', 'A', 'B', 'A', 'B', 'A'],
+        'stop_sequence': [2, 1, 2, 1, 1, 1]
+    })
+    stops_db = pd.DataFrame({'stop_id': ['A', 'B'], 'stop_lat': [51.52, 51.53], 'stop_lon': [-0.14, -0.15]})
+    trips_db = pd.DataFrame({'route_id': ['R'] * 4, 'service_id': ['S'] * 4, 'trip_id': ['T1', 'T2', 'T3', 'T4']})
+    routes_db = pd.DataFrame({'route_id': ['R'], 'route_type': [3], 'route_short_name': ['r'],
+                              'route_long_name': ['route'], 'route_color': ['FFFFFF']})
+
+    g = gtfs_reader.gtfs_db_to_schedule_graph(stop_times_db, stops_db, trips_db, routes_db, ['S'])
+
+    assert g.graph['service_to_route_map'] == {'R': ['R_0']}
+    route = g.graph['routes']['R_0']
+    assert route['ordered_stops'] == ['A', 'B']
+    assert route['arrival_offsets'] == ['00:00:00', '00:02:00']
+    assert route['departure_offsets'] == ['00:00:00', '00:02:30']
+    assert route['trips'] == {'trip_id': ['T1', 'T2'], 'trip_departure_time': ['10:00:00', '00:00:00'],
+                              'vehicle_id': ['veh_0', 'veh_1']}
+
+
 def test_read_to_schedule_correct(correct_schedule_graph_nodes_from_test_gtfs,
                                   correct_schedule_graph_edges_from_test_gtfs,
                                   correct_schedule_graph_data_from_test_gtfs):
@@ -50,7 +126,7 @@ def test_read_to_schedule_correct(correct_schedule_graph_nodes_from_test_gtfs,
 def test_zip_read_to_schedule_correct(correct_schedule_graph_nodes_from_test_gtfs,
                                       correct_schedule_graph_edges_from_test_gtfs,
                                       correct_schedule_graph_data_from_test_gtfs):
-    schedule_graph = gtfs_reader.read_gtfs_to_schedule_graph(gtfs_test_file, '20190604')
+    schedule_graph = gtfs_reader.read_gtfs_to_schedule_graph(gtfs_test_zip_file, '20190604')
     assert_semantically_equal(dict(schedule_graph.nodes(data=True)), correct_schedule_graph_nodes_from_test_gtfs)
     assert_semantically_equal(schedule_graph.edges._adjdict, correct_schedule_graph_edges_from_test_gtfs)
     del schedule_graph.graph['change_log']
@@ -63,3 +139,16 @@ def test_reading_loopy_gtfs_removes_duplicated_stops():
          os.path.abspath(os.path.join(os.path.dirname(__file__), "test_data", "loopy_gtfs")),
         '20190604')
     assert schedule_graph.graph['routes']['1001_0']['ordered_stops'] == ['BSE', 'BSN', 'BSE', 'BSN']
+
+
+def test_read_to_schedule_graphs_gives_same_graphs_as_reading_each_day():
+    schedule_graphs = gtfs_reader.read_gtfs_to_schedule_graphs(gtfs_test_zip_file, ['20190604', '20190605'])
+
+    assert list(schedule_graphs) == ['20190604', '20190605']
+    for day, schedule_graph in schedule_graphs.items():
+        expected_graph = gtfs_reader.read_gtfs_to_schedule_graph(gtfs_test_zip_file, day)
+        assert_semantically_equal(dict(schedule_graph.nodes(data=True)), dict(expected_graph.nodes(data=True)))
+        assert_semantically_equal(schedule_graph.edges._adjdict, expected_graph.edges._adjdict)
+        del schedule_graph.graph['change_log']
+        del expected_graph.graph['change_log']
+        assert_semantically_equal(schedule_graph.graph, expected_graph.graph)
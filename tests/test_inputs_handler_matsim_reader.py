@@ -315,6 +315,22 @@ def test_reading_network_with_singular_geometry_attribute_cleans_up_empty_attrib
     assert_semantically_equal(dict(n.links()), correct_links)
 
 
+def test_read_network_discards_elements_once_they_are_read(mocker):
+    release_element = matsim_reader._release_element
+    elements_held = []
+
+    def release_and_count_elements_held(elem):
+        release_element(elem)
+        elements_held.append(len(elem) + len(list(elem.itersiblings(preceding=True))))
+
+    mocker.patch.object(matsim_reader, '_release_element', side_effect=release_and_count_elements_held)
+    transformer = Transformer.from_proj(Proj('epsg:27700'), Proj('epsg:4326'))
+    matsim_reader.read_network(pt2matsim_network_with_geometry_file, transformer)
+
+    # 2 nodes, 2 links, 5 attributes on each link, none leave children or preceding siblings in the tree once read
+    assert elements_held == [0] * 14
+
+
 def test_read_schedule_reads_the_data_correctly(correct_services_from_test_pt2matsim_schedule):
     services, minimalTransferTimes = matsim_reader.read_schedule(pt2matsim_schedule_file, 'epsg:27700')
 
@@ -326,6 +342,61 @@ def test_read_schedule_reads_the_data_correctly(correct_services_from_test_pt2ma
     assert_semantically_equal(minimalTransferTimes, correct_minimalTransferTimes)
 
 
+def assert_schedule_graphs_equal(g, other):
+    assert_semantically_equal(dict(g.nodes(data=True)), dict(other.nodes(data=True)))
+    assert_semantically_equal({(u, v): data for u, v, data in g.edges(data=True)},
+                              {(u, v): data for u, v, data in other.edges(data=True)})
+    for key in ['routes', 'services', 'route_to_service_map', 'service_to_route_map']:
+        assert_semantically_equal(g.graph[key], other.graph[key])
+
+
+def test_read_schedule_to_schedule_graph_gives_same_graph_as_schedule_from_services():
+    services, minimal_transfer_times = matsim_reader.read_schedule(pt2matsim_schedule_file, 'epsg:27700')
+    g, _minimal_transfer_times = matsim_reader.read_schedule_to_schedule_graph(pt2matsim_schedule_file, 'epsg:27700')
+
+    assert_schedule_graphs_equal(g, Schedule(services=services, epsg='epsg:27700').graph())
+    assert_semantically_equal(_minimal_transfer_times, minimal_transfer_times)
+
+
+def test_read_schedule_to_schedule_graph_reindexes_clashing_services_and_routes_like_schedule(tmpdir):
+    schedule_path = os.path.join(tmpdir, 'schedule.xml')
+    with open(schedule_path, 'w') as f:
+        f.write("""<?xml version="1.0" encoding="UTF-8"?>
+<transitSchedule>
+    <transitStops>
+        <stopFacility id="A" x="528464.13" y="182179.74" name="Stop A"/>
+        <stopFacility id="B" x="528504.13" y="182155.74" linkRefId="1"/>
+    </transitStops>
+    <transitLine id="line" name="12">
+        <transitRoute id="route">
+            <transportMode>bus</transportMode>
+            <routeProfile>
+                <stop refId="A" departureOffset="00:00:00"/>
+                <stop refId="B" arrivalOffset="00:02:00" awaitDeparture="true"/>
+            </routeProfile>
+            <route><link refId="1"/></route>
+            <departures><departure id="1" departureTime="04:40:00" vehicleRefId="veh_1"/></departures>
+        </transitRoute>
+    </transitLine>
+    <transitLine id="line" name="">
+        <transitRoute id="route">
+            <transportMode>rail</transportMode>
+            <routeProfile>
+                <stop refId="B" departureOffset="00:00:00"/>
+                <stop refId="A" arrivalOffset="00:03:00"/>
+            </routeProfile>
+            <route><link refId="2"/></route>
+            <departures><departure id="2" departureTime="05:40:00" vehicleRefId="veh_2"/></departures>
+        </transitRoute>
+    </transitLine>
+</transitSchedule>""")
+    services, _ = matsim_reader.read_schedule(schedule_path, 'epsg:27700')
+    g, _ = matsim_reader.read_schedule_to_schedule_graph(schedule_path, 'epsg:27700')
+
+    assert_schedule_graphs_equal(g, Schedule(services=services, epsg='epsg:27700').graph())
+    assert g.graph['service_to_route_map'] == {'line': ['route'], 'line_0': ['line_0_route']}
+
+
 def test_reading_pt2matsim_vehicles():
     vehicles, vehicle_types = matsim_reader.read_vehicles(pt2matsim_vehicles_file)
 
@@ -1,5 +1,6 @@
 import os
 import sys
+import numpy as np
 from genet.inputs_handler import osm_reader
 from tests.fixtures import assert_semantically_equal, full_fat_default_config
 
@@ -148,6 +149,28 @@ def test_generate_osm_graph_edges_from_file(full_fat_default_config):
         i += 1
 
 
+def test_read_osm_paths_keeps_ways_with_modes_and_their_nodes(full_fat_default_config):
+    paths, node_ids, relations = osm_reader.read_osm_paths(osm_test_file, full_fat_default_config)
+
+    assert list(paths) == [0, 100, 400, 700, 47007861, 47007862]
+    assert node_ids.tolist() == [0, 1, 2]
+    assert relations == []
+
+
+def test_read_osm_paths_reads_relations_when_requested(full_fat_default_config):
+    _, _, relations = osm_reader.read_osm_paths(osm_test_file, full_fat_default_config, relations=True)
+
+    assert [relation['id'] for relation in relations] == [12176]
+
+
+def test_read_osm_nodes_keeps_requested_nodes_only(full_fat_default_config):
+    nodes = osm_reader.read_osm_nodes(osm_test_file, np.array([0, 2]), full_fat_default_config, chunksize=1)
+
+    assert_semantically_equal(nodes, {
+        0: {'osmid': 0, 's2id': 1152921492875543713, 'y': 0.008554364250688652, 'x': -0.0006545205888310243},
+        2: {'osmid': 2, 's2id': 384307157539499829, 'y': -0.00716977739835831, 'x': -0.0006545205888310243}})
+
+
 def test_generate_graph_nodes():
     nodes = {0: {'osmid': 0, 's2id': 1152921492875543713, 'x': 0.008554364250688652, 'y': -0.0006545205888310243},
              1: {'osmid': 1, 's2id': 1152921335974974453, 'x': 0.024278505899735615, 'y': -0.0006545205888310243},
@@ -283,3 +306,31 @@ def test_generate_graph_edges_with_node_reindexing():
          'attributes': {'osm:way:osmid': {'name': 'osm:way:osmid', 'class': 'java.lang.String', 'text': '0'},
                         'osm:way:highway': {'name': 'osm:way:highway', 'class': 'java.lang.String',
                                             'text': 'unclassified'}}}])
+
+
+def test_matsim_link_values_key_depends_on_tags_with_matsim_defaults_and_modes():
+    assert osm_reader.matsim_link_values_key({'osmid': 0, 'highway': 'primary', 'modes': ['car', 'bike']}) == \
+        (('highway', 'primary'), ('car', 'bike'))
+    assert osm_reader.matsim_link_values_key({'osmid': 1, 'railway': 'rail', 'modes': ['rail']}) == \
+        ('railway', ('rail',))
+    assert osm_reader.matsim_link_values_key({'osmid': 2, 'modes': ['walk']}) == (None, ('walk',))
+
+
+def test_generate_graph_edges_reads_config_once_and_gives_each_edge_its_own_values(mocker):
+    mocker.spy(osm_reader, 'Config')
+    edges = [((0, 1), {'osmid': 0, 'modes': ['car'], 'highway': 'primary', 'lanes': '2'}),
+             ((1, 0), {'osmid': 0, 'modes': ['car'], 'highway': 'primary', 'lanes': '3;2'}),
+             ((1, 2), {'osmid': 1, 'modes': ['car'], 'highway': 'primary'})]
+    nodes_and_attributes = {'0': {'s2_id': 1152921492875543713}, '1': {'s2_id': 1152921335974974453},
+                            '2': {'s2_id': 384307157539499829}}
+
+    generated_edges = osm_reader.generate_graph_edges(
+        edges, reindexing_dict={}, nodes_and_attributes=nodes_and_attributes,
+        config_path=os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "..", "genet", "configs", "OSM", "default_config.yml")))
+
+    assert osm_reader.Config.call_count == 1
+    assert [(edge['permlanes'], edge['capacity']) for edge in generated_edges] == [(2, 3000.0), (1.0, 1500.0),
+                                                                                 (1.0, 1500.0)]
+    generated_edges[0]['freespeed'] = 0
+    assert generated_edges[1]['freespeed'] == generated_edges[2]['freespeed'] == 22.22
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+from genet.inputs_handler import osm_reader, osmnx_customised, pbf_reader
+from tests.fixtures import assert_semantically_equal, full_fat_default_config
+
+# same data as osm.xml, with each block holding at most two OSM elements
+osm_pbf_test_file = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data", "osm", "osm.osm.pbf"))
+# dense and non-dense nodes with highway, railway, ref and other tags, in separate blocks, and a highway way through
+# all but one of the tagged nodes
+tagged_nodes_pbf_test_file = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data", "osm", "tagged_nodes.osm.pbf"))
+
+
+def test_read_blocks_splits_file_into_data_blocks():
+    blocks = pbf_reader.read_blocks(osm_pbf_test_file)
+    assert len(blocks) == 6
+    assert [offset for offset, size in blocks] == sorted(offset for offset, size in blocks)
+
+
+def test_read_pbf_paths_gives_same_paths_as_reading_file_serially(full_fat_default_config):
+    paths, node_ids, node_blocks = pbf_reader.read_pbf_paths(osm_pbf_test_file, full_fat_default_config, processes=2)
+    expected_paths, expected_node_ids, _ = osm_reader.read_osm_paths(osm_pbf_test_file, full_fat_default_config)
+
+    assert_semantically_equal(paths, expected_paths)
+    assert list(paths) == list(expected_paths)
+    assert node_ids.tolist() == expected_node_ids.tolist()
+    assert node_blocks == pbf_reader.read_blocks(osm_pbf_test_file)[:2]
+
+
+def test_read_pbf_nodes_keeps_requested_nodes_only(full_fat_default_config):
+    ids, lons, lats, tags = pbf_reader.read_pbf_nodes(
+        osm_pbf_test_file, np.array([0, 2]), full_fat_default_config, processes=2)
+
+    assert ids.tolist() == [0, 2]
+    assert lons.tolist() == [-0.0006546, -0.0006546]
+    assert lats.tolist() == [0.0085544, -0.0071698]
+    assert tags == {}
+
+
+def test_generate_osm_graph_edges_from_pbf_file_gives_same_graph_as_reading_file_serially(full_fat_default_config):
+    nodes, edges = osm_reader.generate_osm_graph_edges_from_file(osm_pbf_test_file, full_fat_default_config, 2)
+
+    paths, node_ids, _ = osm_reader.read_osm_paths(osm_pbf_test_file, full_fat_default_config)
+    assert_semantically_equal(nodes, osm_reader.read_osm_nodes(osm_pbf_test_file, node_ids, full_fat_default_config))
+    assert edges == osmnx_customised.return_edges(paths, full_fat_default_config)
+
+
+def test_read_pbf_nodes_gives_same_tags_as_reading_file_serially(full_fat_default_config):
+    node_ids = np.arange(1, 10)
+    ids, lons, lats, tags = pbf_reader.read_pbf_nodes(
+        tagged_nodes_pbf_test_file, node_ids, full_fat_default_config, processes=2)
+
+    assert ids.tolist() == node_ids.tolist()
+    assert tags == {
+        1: {'highway': 'traffic_signals'},
+        4: {'highway': 'crossing', 'ref': '12'},
+        7: {'highway': 'stop'}
+    }
+    assert_semantically_equal(
+        osm_reader.build_nodes(ids, lons, lats, tags),
+        osm_reader.read_osm_nodes(tagged_nodes_pbf_test_file, node_ids, full_fat_default_config))
+
+
+def test_generate_osm_graph_edges_from_pbf_file_with_tagged_nodes_gives_same_graph_as_reading_file_serially(
+        full_fat_default_config):
+    nodes, edges = osm_reader.generate_osm_graph_edges_from_file(
+        tagged_nodes_pbf_test_file, full_fat_default_config, 2)
+
+    paths, node_ids, _ = osm_reader.read_osm_paths(tagged_nodes_pbf_test_file, full_fat_default_config)
+    assert node_ids.tolist() == list(range(1, 10))
+    assert_semantically_equal(
+        nodes, osm_reader.read_osm_nodes(tagged_nodes_pbf_test_file, node_ids, full_fat_default_config))
+    assert edges == osmnx_customised.return_edges(paths, full_fat_default_config)
@@ -192,3 +192,15 @@ def test_read_gtfs_returns_expected_schedule(correct_stops_to_service_mapping_fr
         )])
     assert_semantically_equal(schedule.stop_to_service_ids_map(), correct_stops_to_service_mapping_from_test_gtfs)
     assert_semantically_equal(schedule.stop_to_route_ids_map(), correct_stops_to_route_mapping_from_test_gtfs)
+
+
+def test_read_gtfs_days_returns_same_schedules_as_reading_each_day():
+    days = ['20190604', '20190608']
+    schedules = read.read_gtfs_days(gtfs_test_folder, days, epsg='epsg:27700', num_processes=2)
+
+    assert list(schedules) == days
+    for day in days:
+        expected_schedule = read.read_gtfs(gtfs_test_folder, day, epsg='epsg:27700')
+        assert_semantically_equal(dict(schedules[day].graph().nodes(data=True)),
+                                  dict(expected_schedule.graph().nodes(data=True)))
+        assert_semantically_equal(schedules[day].graph().graph['routes'], expected_schedule.graph().graph['routes'])
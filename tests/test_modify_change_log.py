@@ -2,7 +2,7 @@ import ast
 from pandas.testing import assert_frame_equal
 from pandas import DataFrame
 from tests.fixtures import *
-from genet.modify import ChangeLog
+from genet.modify import ChangeLog, ChangeLogBatch, ChangeLogSink
 
 
 def test_change_log_records_adding_objects():
@@ -104,3 +104,261 @@ def test_change_log_records_removing_objects_in_bunch():
 
     cols_to_compare = ['change_event', 'object_type', 'old_id', 'new_id', 'old_attributes', 'new_attributes', 'diff']
     assert_frame_equal(log[cols_to_compare], target[cols_to_compare], check_dtype=False)
+
+
+def test_change_log_is_only_turned_into_dataframe_when_queried(mocker):
+    mocker.spy(DataFrame, 'from_records')
+    log = ChangeLog()
+    for i in range(5):
+        log.add('link', str(i), {'attrib': i})
+    log = log.modify_bunch('link', ['0', '1'], [{'attrib': 0}, {'attrib': 1}], ['0', '1'], [{'attrib': 2}, {}])
+
+    assert len(log) == 7
+    assert not log.empty
+    DataFrame.from_records.assert_not_called()
+
+    assert list(log['new_id']) == ['0', '1', '2', '3', '4', '0', '1']
+    assert log.loc[6, 'diff'] == [('remove', '', [('attrib', 1)])]
+    assert DataFrame.from_records.call_count == 1
+
+
+def test_change_log_records_events_after_being_queried():
+    log = ChangeLog()
+    log.add('link', '1', {'attrib': 'hey'})
+    assert len(log.to_dataframe()) == 1
+
+    log.remove('link', '1', {'attrib': 'hey'})
+
+    assert list(log['change_event']) == ['add', 'remove']
+
+
+def test_merging_change_logs_orders_events_by_timestamp():
+    log = ChangeLog()
+    log._events = [('2020-07-09 09:56:05', 'add', 'link', None, '1', None, '{}', [])]
+    other_log = ChangeLog()
+    other_log._events = [('2020-07-09 09:56:01', 'add', 'link', None, '2', None, '{}', []),
+                         ('2020-07-09 09:56:07', 'add', 'link', None, '3', None, '{}', [])]
+
+    merged_log = log.merge_logs(other_log)
+
+    assert list(merged_log['new_id']) == ['2', '1', '3']
+    assert len(log) == 1
+
+
+def test_merging_many_change_logs_at_once_gives_same_log_as_merging_them_one_by_one():
+    logs = []
+    for timestamps in [['2020-07-09 09:56:05', '2020-07-09 09:56:08'], ['2020-07-09 09:56:01'],
+                       ['2020-07-09 09:56:05', '2020-07-09 09:56:07']]:
+        log = ChangeLog()
+        log._events = [(timestamp, 'add', 'link', None, str(len(logs)), None, '{}', []) for timestamp in timestamps]
+        log._count('add', 'link', len(timestamps))
+        logs.append(log)
+
+    merged_log = ChangeLog().merge_logs(*logs)
+    expected_log = ChangeLog().merge_logs(logs[0]).merge_logs(logs[1]).merge_logs(logs[2])
+
+    assert merged_log._events == expected_log._events
+    assert_frame_equal(merged_log.summary(), expected_log.summary())
+
+
+def test_exported_change_log_has_the_same_rows_as_the_log(tmpdir):
+    log = ChangeLog()
+    log.add('link', '1234', {'attrib': 'hey'})
+    log.remove('link', '1234', {'attrib': 'hey'})
+    path = os.path.join(tmpdir, 'change_log.csv')
+
+    log.export(path)
+
+    exported_log = pd.read_csv(path, index_col=0)
+    assert list(exported_log.columns) == list(log.columns)
+    assert list(exported_log['change_event']) == ['add', 'remove']
+
+
+def test_change_log_computes_diffs_only_when_queried(mocker):
+    mocker.spy(ChangeLog, 'generate_diff')
+    log = ChangeLog()
+    log.modify('link', '1234', {'attrib': 'old'}, '1234', {'attrib': 'new'})
+    log = log.add_bunch('link', ['1', '2'], [{'attrib': 'hey'}, {'attrib': 'helloooo'}])
+    ChangeLog.generate_diff.assert_not_called()
+
+    assert list(log['diff']) == [
+        [('change', 'attrib', ('old', 'new'))],
+        [('add', '', [('attrib', 'hey')]), ('add', 'id', '1')],
+        [('add', '', [('attrib', 'helloooo')]), ('add', 'id', '2')]]
+    assert ChangeLog.generate_diff.call_count == 3
+
+    log.to_dataframe()
+    assert ChangeLog.generate_diff.call_count == 3
+
+
+def test_change_log_is_not_affected_by_changes_to_recorded_dictionaries():
+    log = ChangeLog()
+    old_attributes = {'attrib': 'old'}
+    new_attributes = {'attrib': 'new'}
+    log.modify('link', '1234', old_attributes, '1234', new_attributes)
+
+    old_attributes['attrib'] = 'new'
+    new_attributes['attrib'] = 'newer'
+
+    assert log.loc[0, 'old_attributes'] == "{'attrib': 'old'}"
+    assert log.loc[0, 'new_attributes'] == "{'attrib': 'new'}"
+
+
+def test_change_log_records_only_changed_keys_of_modified_objects_with_the_same_diffs():
+    old_attributes = {'attrib': 'old', 'same': 1, 'nested': {'a': 1, 'b': 2}, 'removed': 0}
+    new_attributes = {'attrib': 'new', 'same': 1, 'nested': {'a': 1, 'b': 3}, 'added': [1]}
+    full_log = ChangeLog()
+    full_log.modify('link', '1234', old_attributes, '1', new_attributes)
+    log = ChangeLog(changed_keys_only=True)
+    log = log.modify_bunch('link', ['1234'], [old_attributes], ['1'], [new_attributes])
+
+    assert ast.literal_eval(log.loc[0, 'old_attributes']) == {'attrib': 'old', 'nested': {'a': 1, 'b': 2}, 'removed': 0}
+    assert ast.literal_eval(log.loc[0, 'new_attributes']) == {'attrib': 'new', 'nested': {'a': 1, 'b': 3}, 'added': [1]}
+    assert log.loc[0, 'diff'] == full_log.loc[0, 'diff']
+
+
+def test_change_log_at_ids_only_level_records_ids_without_attributes():
+    log = ChangeLog(level='ids_only')
+    log.add('link', '1234', {'attrib': 'hey'})
+    log = log.modify_bunch('link', ['1234'], [{'attrib': 'hey'}], ['1'], [{'attrib': 'HEY'}])
+
+    assert list(log['new_id']) == ['1234', '1']
+    assert list(log['old_id']) == [None, '1234']
+    assert log['old_attributes'].isna().all()
+    assert log['diff'].isna().all()
+
+
+def test_change_log_at_summary_level_counts_events():
+    log = ChangeLog(level='summary')
+    log.add('link', '1234', {'attrib': 'hey'})
+    log = log.add_bunch('link', ['1', '2'], [{}, {}])
+    log.remove('node', '1', {})
+
+    assert log.empty
+    assert_frame_equal(
+        log.summary(),
+        DataFrame({'change_event': ['add', 'remove'], 'object_type': ['link', 'node'], 'count': [3, 1]}))
+
+
+def test_change_log_turned_off_records_nothing():
+    log = ChangeLog()
+    log.add('link', '1234', {'attrib': 'hey'})
+    log.set_level('off')
+    log.add('link', '1', {'attrib': 'hey'})
+
+    assert list(log['new_id']) == ['1234']
+    assert log.summary()['count'].sum() == 1
+
+
+def test_change_log_with_unknown_level_raises_error():
+    with pytest.raises(ValueError):
+        ChangeLog(level='everything')
+
+
+@pytest.mark.parametrize('file_name', ['change_log.csv.gz', 'change_log.jsonl.gz', 'change_log.csv'])
+def test_change_log_with_sink_holds_at_most_buffer_size_events_and_exports_all_of_them(tmpdir, file_name):
+    sink = ChangeLogSink(os.path.join(tmpdir, file_name), buffer_size=3)
+    log = ChangeLog(sink=sink)
+    for i in range(7):
+        log.add('link', str(i), {'attrib': i})
+        assert len(log) < 3
+
+    export_path = os.path.join(tmpdir, 'exported_change_log.csv')
+    log.export(export_path)
+
+    assert len(log) == 0
+    exported_log = pd.read_csv(export_path, index_col=0)
+    assert list(exported_log.index) == list(range(7))
+    assert list(exported_log['new_id']) == list(range(7))
+    assert list(exported_log['new_attributes']) == [str({'attrib': i}) for i in range(7)]
+    assert list(sink.read()['change_event']) == ['add'] * 7
+
+
+def test_setting_sink_writes_events_held_in_change_log(tmpdir):
+    log = ChangeLog()
+    log.add('link', '1234', {'attrib': 'hey'})
+    path = os.path.join(tmpdir, 'change_log.csv.gz')
+
+    log.set_level('full', sink=path)
+
+    assert log.empty
+    assert list(log.sink.read()['new_id']) == ['1234']
+
+
+@pytest.mark.parametrize('file_name', ['change_log.csv.gz', 'change_log.jsonl.gz', 'change_log.csv', 'change_log.jsonl'])
+def test_exporting_change_log_with_sink_gives_same_file_as_exporting_from_memory(tmpdir, file_name):
+    def record(log):
+        log.add_bunch('node', ['1', '007', '0123', '1e5', 5], [{'x': 1}, {'x': 2}, {}, {'ids': {'1', '2'}}, {}])
+        log.modify('link', '0123', {'modes': ['car'], 'to': '007'}, '1e5', {'modes': ('car', 'bus'), 'to': '007'})
+        log.remove_bunch('node', ['007', 5], [{'x': 2}, {}])
+
+    log = ChangeLog()
+    record(log)
+    memory_path = os.path.join(tmpdir, 'memory_change_log.csv')
+    log.export(memory_path)
+    sink_log = ChangeLog(sink=ChangeLogSink(os.path.join(tmpdir, file_name), buffer_size=2))
+    record(sink_log)
+    sink_path = os.path.join(tmpdir, 'sink_change_log.csv')
+    sink_log.export(sink_path)
+
+    memory_log = pd.read_csv(memory_path, index_col=0, dtype=str, keep_default_na=False).drop(columns='timestamp')
+    exported_log = pd.read_csv(sink_path, index_col=0, dtype=str, keep_default_na=False).drop(columns='timestamp')
+    assert_frame_equal(exported_log, memory_log)
+    assert list(exported_log['new_id']) == ['1', '007', '0123', '1e5', '5', '1e5', '', '']
+
+
+def test_change_log_batch_records_repeated_modifications_of_an_object_as_one():
+    log = ChangeLog()
+    batch = ChangeLogBatch(log)
+    batch.add('link', '1', {'attrib': 0})
+    batch.modify('link', '1', {'attrib': 0}, '1', {'attrib': 1})
+    batch.modify('link', '2', {'attrib': 0}, '2', {'attrib': 5})
+    batch.modify('link', '1', {'attrib': 1}, '10', {'attrib': 2})
+    batch = batch.modify_bunch('link', ['10'], [{'attrib': 2}], ['10'], [{'attrib': 3}])
+    assert batch.number_of_events == 3
+    assert log.empty
+
+    log = batch.record()
+
+    assert list(log['change_event']) == ['add', 'modify', 'modify']
+    assert list(log['old_id']) == [None, '1', '2']
+    assert list(log['new_id']) == ['1', '10', '2']
+    assert list(log['diff'])[1:] == [[('change', 'attrib', (0, 3)), ('change', 'id', ('1', '10'))],
+                                     [('change', 'attrib', (0, 5))]]
+
+
+def test_change_log_batch_does_not_merge_modifications_of_removed_and_added_again_object():
+    batch = ChangeLogBatch(ChangeLog())
+    batch.modify('link', '1', {'attrib': 0}, '1', {'attrib': 1})
+    batch.remove('link', '1', {'attrib': 1})
+    batch.add('link', '1', {'attrib': 5})
+    batch.modify('link', '1', {'attrib': 5}, '1', {'attrib': 6})
+
+    log = batch.record()
+
+    assert list(log['change_event']) == ['modify', 'remove', 'add', 'modify']
+
+
+def test_change_log_keeps_attributes_as_recorded_when_nested_values_are_changed_in_place():
+    log = ChangeLog()
+    attribs = {'modes': {'car'}, 'attributes': {'osm:way:highway': 'primary'}}
+    log.add('link', '0', attribs)
+
+    attribs['modes'].add('walk')
+    attribs['attributes']['osm:way:highway'] = 'secondary'
+
+    assert ast.literal_eval(log.loc[0, 'new_attributes']) == {
+        'modes': {'car'}, 'attributes': {'osm:way:highway': 'primary'}}
+    assert log.loc[0, 'diff'] == [('add', '', [('modes', {'car'}), ('attributes', {'osm:way:highway': 'primary'})]),
+                                  ('add', 'id', '0')]
+
+
+def test_change_log_with_changed_keys_only_keeps_attributes_as_recorded_when_nested_values_are_changed_in_place():
+    log = ChangeLog(changed_keys_only=True)
+    old_attribs = {'modes': {'car'}, 'freespeed': 10}
+    new_attribs = {'modes': {'car', 'bus'}, 'freespeed': 10}
+    log.modify('link', '0', old_attribs, '0', new_attribs)
+
+    new_attribs['modes'].add('walk')
+
+    assert ast.literal_eval(log.loc[0, 'new_attributes']) == {'modes': {'car', 'bus'}}
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_series_equal
+
+from genet.utils import attribute_store
+
+
+def links_data():
+    return [
+        ('0', {'freespeed': 10.0, 'capacity': 600.0, 'modes': ['car', 'bus'], 'name': 'a'}),
+        ('1', {'freespeed': 20.0, 'modes': {'walk'}, 'name': 'b'}),
+        ('2', {'freespeed': 30.0, 'capacity': 1000.0, 'modes': 'car'})
+    ]
+
+
+def test_store_holds_numeric_attributes_with_the_same_dtype_as_pandas():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=['freespeed', 'capacity'])
+    assert len(store) == 3
+    assert store.has_attribute('freespeed')
+    assert store.columns['freespeed'].dtype == np.float64
+
+
+def test_store_returns_data_only_for_items_which_have_the_attribute():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=['capacity'])
+    assert_series_equal(
+        store.attribute_data('capacity'),
+        pd.Series({'0': 600.0, '2': 1000.0}))
+
+
+def test_store_does_not_hold_non_numeric_or_missing_attributes():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=['name', 'length'])
+    assert not store.has_attribute('name')
+    assert not store.has_attribute('length')
+    assert not store.has_attribute({'attributes': 'osm:way:name'})
+
+
+def test_store_finds_ids_with_modes():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=[], modes=True)
+    assert store.has_modes()
+    assert store.ids_with_modes('car') == ['0', '2']
+    assert store.ids_with_modes(['walk', 'bus']) == ['0', '1']
+    assert store.ids_with_modes('rail') == []
+
+
+def test_store_does_not_hold_modes_of_unexpected_type():
+    store = attribute_store.AttributeStore(iter([('0', {'modes': ('car',)})]), keys=[], modes=True)
+    assert not store.has_modes()
+
+
+def test_store_describes_sources_it_was_built_from():
+    data = dict(links_data())
+    store = attribute_store.AttributeStore(iter(data.items()), keys=['freespeed'], sources=(data,))
+    assert store.describes(data)
+    assert not store.describes(dict(data))
+    del data['0']
+    assert not store.describes(data)
+
+
+def test_updating_store_with_matching_dtype_changes_values_in_place():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=['capacity'], modes=True)
+    assert store.update({'1': {'capacity': 5.0, 'modes': ['bike']}})
+    assert_series_equal(
+        store.attribute_data('capacity'),
+        pd.Series({'0': 600.0, '1': 5.0, '2': 1000.0}))
+    assert store.ids_with_modes('bike') == ['1']
+
+
+def test_updating_store_with_different_dtype_fails():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=['capacity'])
+    assert not store.update({'1': {'capacity': 'high'}})
+
+
+def test_updating_store_with_unknown_id_fails():
+    store = attribute_store.AttributeStore(iter(links_data()), keys=['capacity'])
+    assert not store.update({'10': {'capacity': 5.0}})
@@ -1,3 +1,4 @@
+from copy import deepcopy
 import pytest
 import genet.utils.dict_support as dict_support
 from tests.fixtures import assert_semantically_equal
@@ -27,6 +28,16 @@ def test_set_nested_value_creates_new_nest_in_place_of_single_value():
     assert return_d == {'attributes': {'some_tag': 'bye'}}
 
 
+def test_set_nested_value_with_copy_leaves_original_dictionary_unchanged():
+    d = {'attributes': {'some_osm_tag': 'hello', 'other': {'a': 1}}, 'modes': ['car']}
+    value = {'attributes': {'some_osm_tag': 'bye'}}
+    return_d = dict_support.set_nested_value(d, value, copy=True)
+
+    assert return_d == {'attributes': {'some_osm_tag': 'bye', 'other': {'a': 1}}, 'modes': ['car']}
+    assert d == {'attributes': {'some_osm_tag': 'hello', 'other': {'a': 1}}, 'modes': ['car']}
+    assert return_d['attributes']['other'] is d['attributes']['other']
+
+
 def test_getting_nested_value_from_dictionary():
     d = {'1': {'2': {'3': {'4': 'hey'}}}}
     path = {'1': {'2': {'3': '4'}}}
@@ -112,6 +123,26 @@ def test_merging_dictionaries_with_nested_sets():
     assert_semantically_equal(return_d, {'a': 1, 'b': {'a': {3, 6, 5}}, 'c': {'b': {8, 90, 1}}})
 
 
+def test_updating_complex_dictionary_gives_same_result_as_merging():
+    d1 = {'a': 1, 'b': {'a': {3, 6}, 'x': 'd1'}, 'c': [1], 'd': {'b': [3]}}
+    d2 = {'a': 2, 'b': {'a': {5}, 'x': 'd2'}, 'c': [8, 90], 'e': {'f': {1}}}
+    expected = dict_support.merge_complex_dictionaries(deepcopy(d1), deepcopy(d2))
+
+    updated = dict_support.update_complex_dictionary(d1, d2)
+
+    assert_semantically_equal(updated, expected)
+    assert list(updated) == list(expected)
+
+
+def test_updating_complex_dictionary_copies_containers_of_the_other_dictionary():
+    d2 = {'a': {'b': {1}}}
+    d1 = dict_support.update_complex_dictionary({}, d2)
+    dict_support.update_complex_dictionary(d1, {'a': {'b': {2}}})
+
+    assert d2 == {'a': {'b': {1}}}
+    assert d1 == {'a': {'b': {1, 2}}}
+
+
 def test_merging_dicts_with_lists():
     d = dict_support.merge_complex_dictionaries({'1': [''], '2': []}, {'3': ['1'], '1': ['2']})
 
@@ -128,3 +159,13 @@ def test_merging_dicts_with_lists_when_one_dict_is_empty():
     d = dict_support.merge_complex_dictionaries({'1': [''], '2': []}, {})
 
     assert_semantically_equal(d, {'1': [''], '2': []})
+
+
+def test_copy_containers_copies_nested_dicts_lists_and_sets():
+    d = {'attributes': {'osm:way:lanes': {'text': ['1', '2']}}, 'modes': {'car'}, 'length': 1}
+    copied = dict_support.copy_containers(d)
+
+    assert copied == d
+    assert copied['attributes']['osm:way:lanes'] is not d['attributes']['osm:way:lanes']
+    assert copied['attributes']['osm:way:lanes']['text'] is not d['attributes']['osm:way:lanes']['text']
+    assert copied['modes'] is not d['modes']
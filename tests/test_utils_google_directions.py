@@ -486,8 +486,9 @@ def test_parsing_routes_with_multiple_routes_selects_the_one_closest(mocker, goo
         {'google_speed': 3.7183098591549295, 'google_polyline': 'ahmyHzvYkCvCuCdDcBrB'}])
     data = google_directions.parse_routes(google_directions_api_response, generated_request['path_polyline'])
 
-    assert_semantically_equal(data, {'google_speed': 3.7183098591549295, 'google_polyline': 'ahmyHzvYkCvCuCdDcBrB',
-                                     'polyline_proximity': 1.306345084680333})
+    assert data['polyline_proximity'] == pytest.approx(1.306345084680333, rel=1e-9)
+    del data['polyline_proximity']
+    assert_semantically_equal(data, {'google_speed': 3.7183098591549295, 'google_polyline': 'ahmyHzvYkCvCuCdDcBrB'})
 
 
 def test_parsing_routes_with_bad_request(caplog, bad_request_google_directions_api_response):
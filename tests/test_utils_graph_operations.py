@@ -1,3 +1,5 @@
+import pytest
+import warnings
 from genet.core import Network
 from genet.utils import graph_operations
 from anytree import Node, RenderTree
@@ -188,6 +190,22 @@ def test_extract_graph_links_with_bound_condition():
     assert links == ['0']
 
 
+def test_extract_graph_links_with_bound_condition_on_data_with_nan_values_does_not_warn():
+    n = Network('epsg:27700')
+    n.add_link('0', 1, 2, attribs={'freespeed': 9.0})
+    n.add_link('1', 2, 3, attribs={'freespeed': float('nan')})
+    n.add_link('2', 3, 4, attribs={'freespeed': 1.0})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        links = graph_operations.extract_on_attributes(
+            n.links(),
+            conditions={'freespeed': (2, 10)}
+        )
+
+    assert links == ['0']
+
+
 def test_extract_graph_links_with_bound_condition_and_list_value():
     n = Network('epsg:27700')
     n.add_link('0', 1, 2, attribs={
@@ -279,6 +297,55 @@ def test_extract_graph_links_with_callable_condition_and_list_value_specifying_t
     assert links == []
 
 
+def links_with_mixed_attribute_data():
+    return [
+        ('0', {'modes': ['car', 'bus'], 'freespeed': 10.0, 'lanes': 1,
+               'attributes': {'osm:way:highway': {'text': 'primary'}}}),
+        ('1', {'modes': 'car', 'freespeed': 20, 'lanes': '2', 'attributes': {'osm:way:highway': {'text': [1, 2]}}}),
+        ('2', {'modes': {'walk'}, 'freespeed': 30.5, 'attributes': {'osm:way:highway': {'text': {9, 10}}}}),
+        ('3', {'modes': ('rail',), 'freespeed': None, 'lanes': 2.0, 'attributes': 'yes'}),
+        ('4', {'modes': [], 'freespeed': True, 'lanes': [1, 'x'], 'attributes': {'osm:way:highway': 'secondary'}}),
+        ('5', {'modes': 'bus'})
+    ]
+
+
+@pytest.mark.parametrize('conditions,how', [
+    ({'modes': 'car'}, any),
+    ({'modes': ['car', 'walk']}, any),
+    ({'freespeed': (10, 30)}, any),
+    ({'freespeed': 20}, any),
+    ({'lanes': 2}, any),
+    ({'lanes': lambda x: x == 1}, any),
+    ({'freespeed': lambda x: bool(x)}, any),
+    ({'attributes': {'osm:way:highway': {'text': 'primary'}}}, any),
+    ({'attributes': {'osm:way:highway': {'text': [1, 9]}}}, any),
+    ({'attributes': {'osm:way:highway': {'text': (2, 9)}}}, any),
+    ({'attributes': {'osm:way:highway': {'text': lambda x: x == 10}}}, any),
+    ({'attributes': {'osm:way:highway': 'secondary'}}, any),
+    ({'attributes': 'yes'}, any),
+    ({'modes': 'car', 'freespeed': 20}, any),
+    ([{'modes': 'car'}, {'freespeed': (25, 35)}], any),
+    ([{'modes': 'car'}, {'freespeed': (15, 35)}], all),
+    ([], any),
+    ([], all),
+])
+@pytest.mark.parametrize('mixed_dtypes', [True, False])
+def test_evaluating_filter_on_all_data_at_once_gives_same_result_as_checking_each_item(conditions, how, mixed_dtypes):
+    links = links_with_mixed_attribute_data()
+    _filter = graph_operations.Filter(conditions=conditions, how=how, mixed_dtypes=mixed_dtypes)
+
+    expected = [link_id for link_id, data in links if _filter.satisfies_conditions(data)]
+
+    assert _filter.filter_ids(iter(links)) == expected
+
+
+def test_evaluating_bound_condition_on_list_data_with_values_that_cannot_be_compared_raises_error():
+    _filter = graph_operations.Filter(conditions={'lanes': (1, 2)})
+
+    with pytest.raises(TypeError):
+        _filter.filter_ids(iter(links_with_mixed_attribute_data()))
+
+
 def test_get_attribute_schema_with_nested_dictionaries():
     input_list = [
         ('0', {'attributes': {'osm:way:highway': {'name': 'osm:way:highway',
@@ -0,0 +1,218 @@
+import pytest
+
+from genet.utils import graph_operations, indexing
+
+
+def test_node_id_allocator_starts_at_one_for_empty_container():
+    allocator = indexing.NodeIdAllocator().sync(set())
+    assert allocator.generate() == ['1']
+
+
+def test_node_id_allocator_gives_indices_above_highest_integer_index_in_container():
+    allocator = indexing.NodeIdAllocator().sync({'1', '5', 3})
+    assert allocator.generate(n=3) == ['6', '7', '8']
+
+
+def test_node_id_allocator_gives_indices_above_number_of_indices_if_some_are_not_integers():
+    allocator = indexing.NodeIdAllocator().sync({'1', 'x7'})
+    assert allocator.generate(n=2) == ['3', '4']
+
+
+def test_node_id_allocator_gives_uuid4_strings_for_taken_indices():
+    allocator = indexing.NodeIdAllocator().sync({'1', 'x7', '4'})
+    ids = allocator.generate(n=2)
+    assert ids[1] == '5'
+    assert len(ids[0]) == 36
+
+
+def test_node_id_allocator_avoids_keys_passed_to_generate():
+    allocator = indexing.NodeIdAllocator().sync({'1'})
+    assert allocator.generate(n=2, avoid_keys={'2', '4'}) == ['5', '6']
+    assert allocator.generate() == ['2']
+
+
+def test_node_id_allocator_follows_indices_removed_from_container():
+    container = {'1', '2', '3', 'x'}
+    allocator = indexing.NodeIdAllocator().sync(container)
+    container -= {'3', 'x'}
+    allocator.remove(['3', 'x'])
+    assert allocator.sync(container).generate() == ['3']
+
+
+def test_node_id_allocator_rescans_container_modified_directly():
+    container = {'1'}
+    allocator = indexing.NodeIdAllocator().sync(container)
+    container |= {'2', '3'}
+    assert allocator.sync(container).generate() == ['4']
+
+
+def test_node_id_allocator_rescans_a_new_container():
+    allocator = indexing.NodeIdAllocator().sync({'1'})
+    allocator.sync({'100'})
+    assert allocator.generate() == ['101']
+
+
+def test_link_id_allocator_gives_lowest_free_indices():
+    allocator = indexing.LinkIdAllocator().sync({'0', '1', '3', 'x'})
+    assert allocator.generate(n=3) == ['2', '4', '5']
+
+
+def test_link_id_allocator_gives_out_the_same_index_until_it_is_added_to_container():
+    container = {'0'}
+    allocator = indexing.LinkIdAllocator().sync(container)
+    assert allocator.generate() == ['1']
+    assert allocator.generate() == ['1']
+    container.add('1')
+    allocator.add(['1'])
+    assert allocator.sync(container).generate() == ['2']
+
+
+def test_link_id_allocator_avoids_keys_passed_to_generate():
+    allocator = indexing.LinkIdAllocator().sync({'0'})
+    assert allocator.generate(n=2, avoid_keys=['1', '3']) == ['2', '4']
+    assert allocator.generate(n=2) == ['1', '2']
+
+
+def test_link_id_allocator_gives_out_indices_removed_from_container():
+    container = {'0', '1', '2'}
+    allocator = indexing.LinkIdAllocator().sync(container)
+    assert allocator.generate() == ['3']
+    container.add('3')
+    allocator.add(['3'])
+    container.remove('1')
+    allocator.remove(['1'])
+    assert allocator.sync(container).generate(n=2) == ['1', '4']
+
+
+def test_link_id_allocator_keeps_indices_removed_from_container_until_they_are_added_back():
+    container = {str(i) for i in range(6)}
+    allocator = indexing.LinkIdAllocator().sync(container)
+    assert allocator.generate() == ['6']
+    for _id in ['4', '1', '2']:
+        container.remove(_id)
+        allocator.remove([_id])
+    allocator.sync(container)
+    assert allocator.generate() == ['1']
+    assert allocator.generate(n=4, avoid_keys={'2'}) == ['1', '4', '6', '7']
+    container.add('1')
+    allocator.add(['1'])
+    assert allocator.sync(container).generate(n=3) == ['2', '4', '6']
+
+
+def test_id_allocator_cannot_be_instantiated_without_generate():
+    with pytest.raises(TypeError):
+        indexing.IdAllocator()
+
+
+def test_link_id_allocator_rescans_container_modified_directly():
+    container = {'0', '1'}
+    allocator = indexing.LinkIdAllocator().sync(container)
+    assert allocator.generate() == ['2']
+    container.remove('0')
+    assert allocator.sync(container).generate() == ['0']
+
+
+def test_node_link_index_built_from_link_id_mapping():
+    index = indexing.NodeLinkIndex().sync({
+        '0': {'from': 1, 'to': 2, 'multi_edge_idx': 0},
+        '1': {'from': 1, 'to': 2, 'multi_edge_idx': 1},
+        '2': {'from': 2, 'to': 1, 'multi_edge_idx': 0}})
+    assert index.out_links(1) == {'0', '1'}
+    assert index.in_links(1) == {'2'}
+    assert index.out_links(2) == {'2'}
+    assert index.in_links(2) == {'0', '1'}
+    assert index.in_links(3) == set()
+
+
+def test_node_link_index_updated_incrementally():
+    link_id_mapping = {'0': {'from': 1, 'to': 2, 'multi_edge_idx': 0}}
+    index = indexing.NodeLinkIndex().sync(link_id_mapping)
+
+    link_id_mapping['1'] = {'from': 2, 'to': 3, 'multi_edge_idx': 0}
+    index.add('1', 2, 3)
+    del link_id_mapping['0']
+    index.remove('0', 1, 2)
+
+    assert index.sync(link_id_mapping).out_links(1) == set()
+    assert index.out_links(2) == {'1'}
+    assert index.in_links(3) == {'1'}
+
+
+def test_node_link_index_relabels_nodes():
+    index = indexing.NodeLinkIndex().sync({'0': {'from': 1, 'to': 2, 'multi_edge_idx': 0}})
+    index.relabel_nodes({1: 'a'})
+    assert index.out_links(1) == set()
+    assert index.out_links('a') == {'0'}
+
+
+def test_node_link_index_relabels_nodes_swapping_ids():
+    index = indexing.NodeLinkIndex().sync({'0': {'from': 1, 'to': 2, 'multi_edge_idx': 0}})
+    index.relabel_nodes({1: 2, 2: 1})
+    assert index.out_links(2) == {'0'}
+    assert index.in_links(1) == {'0'}
+    assert index.out_links(1) == set()
+
+
+def test_node_link_index_rebuilt_if_link_id_mapping_modified_directly():
+    link_id_mapping = {'0': {'from': 1, 'to': 2, 'multi_edge_idx': 0}}
+    index = indexing.NodeLinkIndex().sync(link_id_mapping)
+    link_id_mapping['1'] = {'from': 1, 'to': 3, 'multi_edge_idx': 0}
+    assert index.sync(link_id_mapping).out_links(1) == {'0', '1'}
+
+
+def test_attribute_path_from_string_key():
+    assert indexing.attribute_path('modes') == ('modes',)
+
+
+def test_attribute_path_from_nested_key():
+    assert indexing.attribute_path({'attributes': {'osm:way:id': 'text'}}) == ('attributes', 'osm:way:id', 'text')
+
+
+def test_condition_path_splits_equality_condition():
+    assert indexing.condition_path({'attributes': {'osm:way:id': {'text': '1'}}}) == \
+           (('attributes', 'osm:way:id', 'text'), '1')
+
+
+def test_condition_path_splits_set_membership_condition():
+    assert indexing.condition_path({'modes': ['car', 'bus']}) == (('modes',), ['car', 'bus'])
+
+
+def test_condition_path_rejects_bounds_functions_and_several_keys():
+    assert indexing.condition_path({'length': (1, 2)}) == (None, None)
+    assert indexing.condition_path({'length': lambda x: x > 1}) == (None, None)
+    assert indexing.condition_path({'length': 1, 'modes': 'car'}) == (None, None)
+
+
+def attribute_index_data():
+    return [
+        ('0', {'modes': ['car', 'bus'], 'attributes': {'osm:way:highway': {'text': 'primary'}}}),
+        ('1', {'modes': 'car', 'attributes': {'osm:way:highway': {'text': ['primary', 'secondary']}}}),
+        ('2', {'modes': {'walk'}, 'attributes': {'osm:way:highway': {'text': 'secondary'}}}),
+        ('3', {'modes': [], 'attributes': 'text'}),
+        ('4', {'attributes': {'osm:way:highway': {'text': float('nan')}}})
+    ]
+
+
+@pytest.mark.parametrize('condition', [
+    {'modes': 'car'}, {'modes': ['car', 'walk']}, {'modes': ['rail']}, {'modes': []},
+    {'attributes': {'osm:way:highway': {'text': 'primary'}}},
+    {'attributes': {'osm:way:highway': {'text': ['secondary']}}},
+    {'attributes': {'osm:way:highway': {'text': float('nan')}}}])
+@pytest.mark.parametrize('mixed_dtypes', [True, False])
+def test_attribute_index_matches_the_same_items_as_filter(condition, mixed_dtypes):
+    path, value = indexing.condition_path(condition)
+    index = indexing.AttributeIndex(path, attribute_index_data())
+    expected = graph_operations.extract_on_attributes(
+        attribute_index_data(), conditions=condition, mixed_dtypes=mixed_dtypes)
+    assert index.sorted(index.match(value, mixed_dtypes=mixed_dtypes)) == expected
+
+
+def test_attribute_index_keeps_position_of_updated_items():
+    index = indexing.AttributeIndex(('modes',), attribute_index_data())
+    index.update('0', {'modes': ['walk']})
+    index.remove('1')
+    index.add('1', {'modes': ['walk']})
+
+    assert index.sorted(index.match('walk')) == ['0', '2', '1']
+    assert index.match('bus') == set()
+    assert '1' in index
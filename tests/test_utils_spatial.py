@@ -2,8 +2,9 @@ import s2sphere
 import pytest
 from geopandas import GeoDataFrame
 from pandas import DataFrame
+import numpy as np
 from numpy import int64
-from pyproj import Geod
+from pyproj import Geod, Transformer
 from genet.utils import spatial
 from genet import Network
 from tests.fixtures import *
@@ -92,6 +93,61 @@ def test_grabs_point_indexes_from_s2(mocker):
     s2sphere.CellId.from_lat_lng.assert_called_once_with(s2sphere.LatLng.from_degrees(53.483959, -2.244644))
 
 
+def test_generating_s2_indices_for_many_points_matches_generating_them_one_by_one():
+    lats = [53.483959, 53.53959, -33.86, 0.0]
+    lngs = [-2.244644, -2.34644, 151.21, 0.0]
+    assert spatial.generate_indices_s2(lats, lngs).tolist() == [
+        spatial.generate_index_s2(lat, lng) for lat, lng in zip(lats, lngs)]
+
+
+def test_generating_s2_indices_for_points_on_all_faces_matches_generating_them_one_by_one():
+    lats = [0, 0, 90, 0, 0, -90, 35.1, -62.4]
+    lngs = [0, 90, 0, 180, -90, 0, -170.3, 119.9]
+    s2_ids = spatial.generate_indices_s2(lats, lngs)
+    assert s2_ids.dtype == np.uint64
+    assert s2_ids.tolist() == [spatial.generate_index_s2(lat, lng) for lat, lng in zip(lats, lngs)]
+
+
+def test_generating_s2_indices_for_missing_coordinates_raises_value_error():
+    with pytest.raises(ValueError):
+        spatial.generate_indices_s2([51.5, np.nan], [0.1, 0.2])
+
+
+def test_decoding_s2_indices_matches_decoding_them_one_by_one():
+    leaf_cells = [spatial.generate_index_s2(lat, lng) for lat, lng in [(53.48, -2.24), (-33.86, 151.21), (0, -90)]]
+    s2_ids = leaf_cells + [s2sphere.CellId(leaf_cells[0]).parent(level).id() for level in [0, 7, 18, 29]]
+    lats, lngs = spatial.decode_indices_s2(s2_ids)
+    lat_lngs = [s2sphere.CellId(s2_id).to_lat_lng() for s2_id in s2_ids]
+    assert lats.tolist() == pytest.approx([lat_lng.lat().degrees for lat_lng in lat_lngs], rel=1e-12)
+    assert lngs.tolist() == pytest.approx([lat_lng.lng().degrees for lat_lng in lat_lngs], rel=1e-12)
+
+
+def test_distances_between_s2_indices_match_computing_them_one_by_one():
+    s2_ids = [spatial.generate_index_s2(lat, lng) for lat, lng in [(53.48, -2.24), (53.5, -2.3), (-33.86, 151.21)]]
+    distances = spatial.distances_between_s2cellids(s2_ids[:-1], s2_ids[1:])
+    assert distances.tolist() == pytest.approx([
+        spatial.distance_between_s2cellids(s2_id_1, s2_id_2) for s2_id_1, s2_id_2 in zip(s2_ids[:-1], s2_ids[1:])],
+        rel=1e-12)
+
+
+def test_great_circle_distance_matches_s2_distance():
+    lats, lngs = [53.48, 53.5, -33.86], [-2.24, -2.3, 151.21]
+    distances = spatial.great_circle_distance(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    assert distances.tolist() == pytest.approx([
+        s2sphere.LatLng.from_degrees(lats[i], lngs[i]).get_distance(
+            s2sphere.LatLng.from_degrees(lats[i + 1], lngs[i + 1])).radians * spatial.APPROX_EARTH_RADIUS
+        for i in range(2)], rel=1e-12)
+
+
+def test_changing_projection_of_many_points_matches_changing_them_one_by_one():
+    transformer = Transformer.from_crs('epsg:27700', 'epsg:4326', always_xy=True)
+    xs = [528504.1342843144, 528489.467895946, 0]
+    ys = [182155.7435136598, 182206.20303669578, 0]
+    lons, lats = spatial.change_proj_arrays(xs, ys, transformer)
+    assert [isinstance(lon, float) for lon in lons] == [True] * 3
+    assert list(zip(lons, lats)) == [spatial.change_proj(x, y, transformer) for x, y in zip(xs, ys)]
+
+
 def test_generating_s2_geometry_with_tuples():
     s2_geoms = spatial.generate_s2_geometry([(53.483959, -2.244644), (53.53959, -2.34644)])
     assert s2_geoms == [5222963659595391499, 5222961020721801439]
@@ -326,3 +382,55 @@ def test_SpatialTree_shortest_path_lengths(network):
                                2: {'u': 'link_2', 'v': 'link_4', 'path_lengths': 78.443},
                                3: {'u': 'link_1', 'v': 'link_4', 'path_lengths': 231.4724}}
                               )
+
+
+def test_spatial_index_finds_intersecting_geometries_in_order_of_geodataframe():
+    gdf = GeoDataFrame({'id': ['a', 'b', 'c'], 'geometry': [
+        Point(3, 3), LineString([(0, 0), (5, 5)]), Point(0.5, 0.5)]})
+    index = spatial.SpatialIndex(gdf)
+    assert index.intersecting(Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])) == ['b', 'c']
+
+
+def test_spatial_index_finds_geometries_within_region():
+    gdf = GeoDataFrame({'id': ['a', 'b', 'c'], 'geometry': [
+        Point(3, 3), LineString([(0, 0), (5, 5)]), Point(0.5, 0.5)]})
+    index = spatial.SpatialIndex(gdf)
+    assert index.within(Polygon([(0, 0), (4, 0), (4, 4), (0, 4)])) == ['a', 'c']
+
+
+def test_spatial_index_describes_sources_it_was_built_from():
+    gdf = GeoDataFrame({'id': ['a'], 'geometry': [Point(3, 3)]})
+    graph = object()
+    index = spatial.SpatialIndex(gdf, sources=(graph, 1))
+    assert index.describes(graph, 1)
+    assert not index.describes(graph, 2)
+    assert not index.describes(object(), 1)
+
+
+def test_s2_index_finds_items_with_cells_intersecting_cell_union():
+    inside = spatial.generate_index_s2(51.52287873323954, -0.14625948709424305)
+    also_inside = spatial.generate_index_s2(51.52228713323965, -0.14439428709377497)
+    outside = spatial.generate_index_s2(51.3472033, 0.4449167)
+    cell_union = s2sphere.CellUnion([s2sphere.CellId(inside).parent(10)])
+    assert cell_union.contains(s2sphere.CellId(also_inside))
+
+    index = spatial.S2Index(['a', 'b', 'c', 'd'], [[outside], [also_inside, outside], [], [inside]])
+    assert index.intersecting(cell_union) == ['b', 'd']
+
+
+def test_s2_index_finds_items_with_all_cells_within_cell_union():
+    inside = spatial.generate_index_s2(51.52287873323954, -0.14625948709424305)
+    also_inside = spatial.generate_index_s2(51.52228713323965, -0.14439428709377497)
+    outside = spatial.generate_index_s2(51.3472033, 0.4449167)
+    cell_union = s2sphere.CellUnion([s2sphere.CellId(inside).parent(10)])
+
+    index = spatial.S2Index(['a', 'b', 'c'], [[outside], [also_inside, outside], [inside, also_inside]])
+    assert index.within(cell_union) == ['c']
+
+
+def test_s2_index_agrees_with_cell_union_intersects():
+    s2_ids = [spatial.generate_index_s2(51.52 + i * 0.0001, -0.15 + i * 0.0001) for i in range(200)]
+    cell_union = s2sphere.CellUnion([s2sphere.CellId(s2_ids[i]).parent(level) for i, level in [(20, 14), (150, 18)]])
+    index = spatial.S2Index(range(200), [[s2_id] for s2_id in s2_ids])
+    assert index.intersecting(cell_union) == [
+        i for i, s2_id in enumerate(s2_ids) if cell_union.intersects(s2sphere.CellId(s2_id))]